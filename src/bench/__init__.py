@@ -0,0 +1,5 @@
+""" Benchmarks
+Reproducible load tests for the server, run against local stand-ins for
+the zero-shot pipeline and Supabase (bench/stubs.py) instead of the paid
+inference API and the production database. See bench/__main__.py.
+"""
@@ -0,0 +1,311 @@
+""" Benchmark runner
+Starts the stand-ins from bench/stubs.py, starts `server:app` under
+uvicorn against them, drives each scenario and writes one JSON report.
+
+    cd src
+    python -m bench --concurrency 50 --duration 20 --out results/base.json
+    python -m bench compare results/base.json results/new.json
+
+Scenarios:
+    analyze     POST /analyze, `--unique` of the texts never seen before
+    history     GET /analyze/history for one of the seeded users
+    login       POST /auth/login with a seeded user's credentials
+    read_users  GET /admin/read_users as the seeded admin
+
+Extra server settings are passed with `--env NAME=VALUE` (repeatable), so
+two configurations can be compared run for run. Rate limiting is off
+unless `--rate-limit` is given: the benchmark measures capacity, not the
+limits.
+"""
+from datetime import datetime, timezone
+from typing import Any, Optional
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import secrets
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+import jwt
+from bench.driver import Scenario, run
+from bench.stubs import PASSWORD
+
+SCENARIOS = ("analyze", "history", "login", "read_users")
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_WORDS = (
+    "poverty hunger health education equality water energy work industry "
+    "inequality cities consumption climate ocean land peace partnership "
+    "community school farmers clinic renewable solar jobs housing transport "
+    "waste emissions forest justice finance trade data research women youth"
+).split()
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _text(rng: random.Random, words: int = 60) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(words)).capitalize() + "."
+
+def _token(secret: str, uid: str, role: str) -> str:
+    return "Bearer " + jwt.encode(
+        {
+            "sub": uid,
+            "aud": "authenticated",
+            "exp": int(time.time()) + 24 * 60 * 60,
+            "user_metadata": {"app_role": role},
+        },
+        secret,
+        algorithm="HS256",
+    )
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=SRC, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def _wait_until_up(url: str, process: subprocess.Popen[bytes], timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(timeout=2) as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"{process.args!r} exited with {process.returncode}")
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+def _scenarios(args: argparse.Namespace, secret: str, users: list[dict[str, Any]]) -> dict[str, Scenario]:
+    rng = random.Random(args.seed)
+    hot = [_text(rng) for _ in range(20)]
+    regular = [user for user in users if user["user_metadata"]["app_role"] == "user"]
+    admin = next(user for user in users if user["user_metadata"]["app_role"] == "admin")
+
+    def as_user(sequence: int) -> dict[str, str]:
+        user = regular[sequence % len(regular)]
+        return {"Cookie": f"access_token={_token(secret, user['id'], 'user')}"}
+
+    async def analyze(client: httpx.AsyncClient, sequence: int) -> httpx.Response:
+        text = _text(rng) if rng.random() < args.unique else rng.choice(hot)
+        return await client.post("/analyze", json={"text": text}, headers=as_user(sequence))
+
+    async def history(client: httpx.AsyncClient, sequence: int) -> httpx.Response:
+        return await client.get("/analyze/history", params={"limit": 20}, headers=as_user(sequence))
+
+    async def login(client: httpx.AsyncClient, sequence: int) -> httpx.Response:
+        user = regular[sequence % len(regular)]
+        return await client.post("/auth/login", json={"email": user["email"], "password": PASSWORD})
+
+    async def read_users(client: httpx.AsyncClient, sequence: int) -> httpx.Response:
+        return await client.get("/admin/read_users", params={"page": sequence % 5 + 1, "per_page": 50})
+
+    return {
+        "analyze": Scenario("analyze", analyze),
+        "history": Scenario("history", history),
+        "login": Scenario("login", login),
+        "read_users": Scenario(
+            "read_users", read_users,
+            headers={"Cookie": f"access_token={_token(secret, admin['id'], 'admin')}"},
+        ),
+    }
+
+async def benchmark(args: argparse.Namespace) -> dict[str, Any]:
+    secret = secrets.token_urlsafe(48)
+    pipeline_port, supabase_port, server_port = _free_port(), _free_port(), _free_port()
+    workdir = tempfile.mkdtemp(prefix="bench-")
+
+    env = {
+        **os.environ,
+        "PIPELINE_URL": f"http://127.0.0.1:{pipeline_port}/models/zero-shot",
+        "PIPELINE_KEY": "bench",
+        "PIPELINE_ENGINE": "remote",
+        "SUPABASE_URL": f"http://127.0.0.1:{supabase_port}",
+        "SUPABASE_KEY": "bench",
+        "SUPABASE_KEY_ADMIN": "bench",
+        "SUPABASE_JWT": secret,
+        "RATE_LIMIT_ENABLED": "true" if args.rate_limit else "false",
+        "RATE_LIMIT_STORAGE": f"sqlite://{os.path.join(workdir, 'ratelimit.sqlite3')}",
+        "LOGS_SPILL_PATH": os.path.join(workdir, "logs-spill.jsonl"),
+        "BACKUP_DIR": os.path.join(workdir, "backups"),
+        "PROFILE_DIR": os.path.join(workdir, "profiles"),
+        "METRICS_ALLOW_NETWORKS": "127.0.0.1/32,::1/128",
+        "METRICS_ENABLED": "true",
+    }
+    for setting in args.env:
+        name, _, value = setting.partition("=")
+        env[name] = value
+    if args.workers > 1:
+        env["PROMETHEUS_MULTIPROC_DIR"] = os.path.join(workdir, "prometheus")
+        os.makedirs(env["PROMETHEUS_MULTIPROC_DIR"])
+
+    stubs = subprocess.Popen([
+        sys.executable, "-m", "bench.stubs",
+        "--pipeline-port", str(pipeline_port),
+        "--supabase-port", str(supabase_port),
+        "--jwt-secret", secret,
+        "--users", str(args.users),
+        "--history", str(args.history),
+        "--pipeline-latency", str(args.pipeline_latency),
+        "--pipeline-sigma", str(args.pipeline_sigma),
+        "--pipeline-error-rate", str(args.pipeline_error_rate),
+        "--pipeline-loading-rate", str(args.pipeline_loading_rate),
+        "--db-latency", str(args.db_latency),
+        "--seed", str(args.seed),
+    ], cwd=SRC, env=env)
+    server: Optional[subprocess.Popen[bytes]] = None
+
+    try:
+        await _wait_until_up(f"http://127.0.0.1:{supabase_port}/auth/v1/admin/users", stubs)
+        await _wait_until_up(f"http://127.0.0.1:{pipeline_port}/_stats", stubs)
+
+        started = time.monotonic()
+        server = subprocess.Popen([
+            sys.executable, "-m", "uvicorn", "server:app",
+            "--host", "127.0.0.1", "--port", str(server_port),
+            "--workers", str(args.workers), "--log-level", "warning", "--no-access-log",
+        ], cwd=SRC, env=env)
+        base_url = f"http://127.0.0.1:{server_port}"
+        await _wait_until_up(base_url + "/ready", server)
+        startup = time.monotonic() - started
+
+        async with httpx.AsyncClient(timeout=10) as client:
+            users = []
+            page = 1
+            while True:
+                response = await client.get(
+                    f"http://127.0.0.1:{supabase_port}/auth/v1/admin/users",
+                    params={"page": page, "per_page": 1000},
+                )
+                batch = response.json()["users"]
+                users.extend(batch)
+                if len(batch) < 1000:
+                    break
+                page += 1
+
+        scenarios = _scenarios(args, secret, users)
+        results: dict[str, Any] = {}
+        for name in args.scenarios:
+            print(f"running {name}: {args.concurrency} workers for {args.duration}s", file=sys.stderr)
+            results[name] = await run(
+                base_url, scenarios[name], args.concurrency, args.duration,
+                requests=args.requests, warmup=args.warmup,
+            )
+
+        async with httpx.AsyncClient(timeout=10) as client:
+            upstream = (await client.get(f"http://127.0.0.1:{pipeline_port}/_stats")).json()
+    finally:
+        for process in (server, stubs):
+            if process is not None and process.poll() is None:
+                process.terminate()
+                try:
+                    process.wait(timeout=15)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    return {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "server_startup_seconds": round(startup, 3),
+            "settings": {
+                key: value for key, value in vars(args).items()
+                if key not in ("command", "out")
+            },
+        },
+        "upstream": upstream,
+        "scenarios": results,
+    }
+
+def _print_summary(report: dict[str, Any]) -> None:
+    print(f"{'scenario':<12}{'req':>8}{'rps':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'err%':>8}")
+    for name, result in report["scenarios"].items():
+        latency = result["latency_ms"]
+        print(
+            f"{name:<12}{result['requests']:>8}{result['throughput_rps']:>10.1f}"
+            f"{latency['p50']:>10.1f}{latency['p95']:>10.1f}{latency['p99']:>10.1f}"
+            f"{result['error_rate'] * 100:>8.2f}"
+        )
+        for dependency, totals in sorted(result["dependencies"].items()):
+            print(f"  {dependency:<18}{totals['calls']:>8} calls{totals['mean_ms']:>10.2f} ms mean{totals['ms_per_request']:>10.2f} ms/req")
+
+def compare(base: dict[str, Any], new: dict[str, Any]) -> None:
+    """ Prints the relative change of each headline number. """
+    def change(old: float, value: float) -> str:
+        if not old:
+            return "n/a"
+        return f"{(value - old) / old * 100:+.1f}%"
+
+    print(f"{'scenario':<12}{'metric':<16}{'base':>12}{'new':>12}{'change':>10}")
+    for name, result in new["scenarios"].items():
+        previous = base["scenarios"].get(name)
+        if previous is None:
+            continue
+        rows = [("throughput_rps", previous["throughput_rps"], result["throughput_rps"])]
+        rows += [
+            (f"{q} ms", previous["latency_ms"][q], result["latency_ms"][q])
+            for q in ("p50", "p95", "p99")
+        ]
+        rows.append(("error_rate", previous["error_rate"], result["error_rate"]))
+        for metric, old, value in rows:
+            print(f"{name:<12}{metric:<16}{old:>12.2f}{value:>12.2f}{change(old, value):>10}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Load-test the server against local stand-ins.")
+    subparsers = parser.add_subparsers(dest="command")
+
+    comparison = subparsers.add_parser("compare", help="compare two JSON reports")
+    comparison.add_argument("base")
+    comparison.add_argument("new")
+
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=15, help="seconds per scenario")
+    parser.add_argument("--requests", type=int, default=None, help="stop each scenario after this many requests instead")
+    parser.add_argument("--warmup", type=float, default=2, help="unrecorded seconds before each scenario")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--history", type=int, default=20, help="history rows per seeded user")
+    parser.add_argument("--unique", type=float, default=0.8, help="share of /analyze texts that are new")
+    parser.add_argument("--pipeline-latency", type=float, default=0.3, help="median seconds")
+    parser.add_argument("--pipeline-sigma", type=float, default=0.5)
+    parser.add_argument("--pipeline-error-rate", type=float, default=0.0)
+    parser.add_argument("--pipeline-loading-rate", type=float, default=0.0)
+    parser.add_argument("--db-latency", type=float, default=0.01, help="median seconds")
+    parser.add_argument("--rate-limit", action="store_true", help="keep the server's rate limits on")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE", help="extra server setting")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="write the JSON report here (default: stdout)")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.base, encoding="utf-8") as base, open(args.new, encoding="utf-8") as new:
+            compare(json.load(base), json.load(new))
+        return
+
+    report = asyncio.run(benchmark(args))
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        _print_summary(report)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+if __name__ == "__main__":
+    main()
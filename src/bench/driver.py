@@ -0,0 +1,152 @@
+""" Benchmark driver
+Drives one scenario at a fixed concurrency and summarizes it.
+
+Each scenario is a request factory: `concurrency` workers call it in a
+loop until `duration` seconds have passed (or `requests` calls were made),
+and every call's latency and status are recorded. Before and after the
+run the server's /metrics are scraped, so the summary also says how much
+time the requests spent waiting on each dependency (pipeline, Supabase,
+log sink, rate limiter).
+"""
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+import asyncio
+import random
+import statistics
+import time
+import httpx
+from prometheus_client.parser import text_string_to_metric_families
+
+Call = Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]]
+
+@dataclass
+class Scenario:
+    name: str
+    call: Call
+    headers: dict[str, str] = field(default_factory=dict)
+
+@dataclass
+class Sample:
+    started: float
+    latency: float
+    status: int
+
+def percentile(values: list[float], q: float) -> float:
+    """ Nearest-rank percentile of an already sorted list. """
+    if not values:
+        return 0.0
+    rank = max(1, min(len(values), round(q / 100 * len(values) + 0.5)))
+    return values[rank - 1]
+
+async def scrape(client: httpx.AsyncClient) -> dict[str, dict[str, float]]:
+    """ dependency -> {"count", "sum"} from the server's /metrics. """
+    try:
+        response = await client.get("/metrics")
+        response.raise_for_status()
+    except httpx.HTTPError:
+        return {}
+
+    totals: dict[str, dict[str, float]] = {}
+    for family in text_string_to_metric_families(response.text):
+        if family.name != "dependency_duration_seconds":
+            continue
+        for sample in family.samples:
+            if sample.name.endswith(("_count", "_sum")):
+                entry = totals.setdefault(sample.labels["dependency"], {"count": 0.0, "sum": 0.0})
+                entry["count" if sample.name.endswith("_count") else "sum"] += sample.value
+    return totals
+
+def _dependency_delta(
+    before: dict[str, dict[str, float]],
+    after: dict[str, dict[str, float]],
+    requests: int,
+) -> dict[str, dict[str, float]]:
+    delta: dict[str, dict[str, float]] = {}
+    for dependency, totals in after.items():
+        previous = before.get(dependency, {"count": 0.0, "sum": 0.0})
+        calls = totals["count"] - previous["count"]
+        seconds = totals["sum"] - previous["sum"]
+        if calls <= 0:
+            continue
+        delta[dependency] = {
+            "calls": int(calls),
+            "seconds": round(seconds, 4),
+            "mean_ms": round(seconds / calls * 1000, 3),
+            "ms_per_request": round(seconds / max(requests, 1) * 1000, 3),
+        }
+    return delta
+
+def summarize(samples: list[Sample], elapsed: float) -> dict[str, Any]:
+    latencies = sorted(sample.latency * 1000 for sample in samples)
+    statuses: dict[str, int] = {}
+    for sample in samples:
+        statuses[str(sample.status)] = statuses.get(str(sample.status), 0) + 1
+    errors = sum(1 for sample in samples if sample.status == 0 or sample.status >= 500)
+
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "statuses": statuses,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.fmean(latencies), 3) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "max": round(latencies[-1], 3) if latencies else 0.0,
+        },
+    }
+
+async def run(
+    base_url: str,
+    scenario: Scenario,
+    concurrency: int,
+    duration: float,
+    requests: Optional[int] = None,
+    warmup: float = 0.0,
+    timeout: float = 60.0,
+) -> dict[str, Any]:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, headers=scenario.headers, limits=limits, timeout=timeout) as client, \
+            httpx.AsyncClient(base_url=base_url, timeout=timeout) as metrics_client:
+        samples: list[Sample] = []
+        counter = iter(range(requests)) if requests is not None else None
+        sequence = 0
+
+        async def worker(until: float, record: bool) -> None:
+            nonlocal sequence
+            while time.monotonic() < until:
+                if record and counter is not None and next(counter, None) is None:
+                    return
+                sequence += 1
+                started = time.monotonic()
+                try:
+                    response = await scenario.call(client, sequence)
+                    status = response.status_code
+                except httpx.HTTPError:
+                    status = 0
+                if record:
+                    samples.append(Sample(started, time.monotonic() - started, status))
+
+        if warmup > 0:
+            await asyncio.gather(*(worker(time.monotonic() + warmup, False) for _ in range(concurrency)))
+
+        before = await scrape(metrics_client)
+        started = time.monotonic()
+        # Stagger the workers a little so they do not move in lockstep.
+        until = started + (duration if requests is None else float("inf"))
+
+        async def staggered() -> None:
+            await asyncio.sleep(random.uniform(0, 0.05))
+            await worker(until, True)
+
+        await asyncio.gather(*(staggered() for _ in range(concurrency)))
+        elapsed = time.monotonic() - started
+        after = await scrape(metrics_client)
+
+    summary = summarize(samples, elapsed)
+    summary["concurrency"] = concurrency
+    summary["dependencies"] = _dependency_delta(before, after, len(samples))
+    return summary
@@ -0,0 +1,124 @@
+""" Startup benchmark
+Guards how long a fresh worker takes to import the app.
+
+    cd src
+    python -m bench.startup --budget 1.5
+
+Imports `server` in `--runs` fresh interpreters with every credential
+removed from the environment, so it also fails when importing starts
+needing live settings again (see core/lifespan.py). Reports the median
+and worst import time, the modules that cost the most (`-X importtime`),
+and any module from --forbid that got imported eagerly; exits with 1 when
+the median is over budget or a forbidden module was imported.
+"""
+from typing import Any
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CREDENTIALS = (
+    "PIPELINE_URL", "PIPELINE_KEY", "SUPABASE_URL",
+    "SUPABASE_KEY", "SUPABASE_KEY_ADMIN", "SUPABASE_JWT",
+)
+# Only needed by optional features, on first use.
+LAZY_MODULES = ("requests", "pyarrow", "pyinstrument", "numpy", "scipy", "pandas")
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import server
+elapsed = time.perf_counter() - started
+print(json.dumps({"seconds": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+def _env() -> dict[str, str]:
+    # Empty rather than unset, so load_dotenv() does not fill them in from .env.
+    return {**os.environ, **{key: "" for key in CREDENTIALS}}
+
+def measure(runs: int) -> dict[str, Any]:
+    env = _env()
+    seconds: list[float] = []
+    modules: set[str] = set()
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", _PROBE], cwd=SRC, env=env, capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            raise RuntimeError("importing server failed without credentials:\n" + result.stderr)
+        probe = json.loads(result.stdout.strip().splitlines()[-1])
+        seconds.append(probe["seconds"])
+        modules = set(probe["modules"])
+
+    return {
+        "runs": runs,
+        "median_seconds": round(statistics.median(seconds), 4),
+        "max_seconds": round(max(seconds), 4),
+        "modules": len(modules),
+        "loaded": modules,
+    }
+
+def slowest(count: int) -> list[dict[str, Any]]:
+    """ The modules `server` imports directly, by cumulative import time
+    (from -X importtime). """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import server"],
+        cwd=SRC, env=_env(), capture_output=True, text=True,
+    )
+    # Children are listed before their parent, indented two more spaces.
+    children: list[tuple[str, int]] = []
+    totals: list[tuple[str, int]] = []
+    for line in result.stderr.splitlines():
+        try:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            microseconds = int(cumulative)
+        except ValueError:
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append((name.strip(), microseconds))
+        elif depth == 0:
+            if name.strip() == "server":
+                totals = children
+            children = []
+
+    ranked = sorted(totals, key=lambda item: -item[1])[:count]
+    return [{"module": module, "ms": round(microseconds / 1000, 1)} for module, microseconds in ranked]
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m bench.startup", description="Check the app's import time budget.")
+    parser.add_argument("--budget", type=float, default=1.5, help="median import seconds allowed")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="how many of the slowest imports to list")
+    parser.add_argument("--forbid", nargs="*", default=list(LAZY_MODULES), help="modules that must not load on import")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = parser.parse_args()
+
+    result = measure(args.runs)
+    loaded = result.pop("loaded")
+    eager = sorted(module for module in args.forbid if module in loaded)
+    report = {
+        **result,
+        "budget_seconds": args.budget,
+        "eager_modules": eager,
+        "slowest": slowest(args.top),
+        "ok": result["median_seconds"] <= args.budget and not eager,
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"import server: median {report['median_seconds']:.3f}s, max {report['max_seconds']:.3f}s "
+              f"over {args.runs} runs (budget {args.budget:.3f}s), {report['modules']} modules")
+        for entry in report["slowest"]:
+            print(f"  {entry['module']:<32}{entry['ms']:>8.1f} ms")
+        if eager:
+            print("imported eagerly: " + ", ".join(eager))
+
+    sys.exit(0 if report["ok"] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+""" Benchmark stand-ins
+Local fakes for the services the server talks to, so a benchmark never
+touches the paid inference API or the production database.
+
+pipeline_app(): the hosted zero-shot model. Accepts the `payload()` body
+    from external/pipeline.py (one text or a list) and answers with
+    labels and scores. Latency is drawn from a log-normal distribution
+    around `median` seconds; `error_rate` of the calls fail with a 500 and
+    `loading_rate` with the upstream's 503 "model is loading".
+
+supabase_app(): just enough PostgREST and GoTrue for the benchmarked
+    routes. Tables (`profiles`, `history`, `logs`) live in memory and
+    support select lists (including `alias:col->key->0` paths), eq/neq/
+    gt/gte/lt/lte filters, nested `or=(...)`/`and(...)` filters (the
+    history keyset cursor), order, limit and exact counts. GoTrue answers password logins (every seeded user has
+    PASSWORD), the current user and the admin user list; sessions are
+    real JWTs signed with the server's SUPABASE_JWT.
+
+Run both with `python -m bench.stubs`, or let `python -m bench` do it.
+"""
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Optional
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import random
+import time
+import uuid
+import jwt
+import uvicorn
+
+PASSWORD = "benchmark-password"
+ADMIN_EMAIL = "admin@bench.example.com"
+
+@dataclass
+class Latency:
+    median: float = 0.0
+    sigma: float = 0.0
+    error_rate: float = 0.0
+    loading_rate: float = 0.0
+
+    def sample(self) -> float:
+        if self.median <= 0:
+            return 0.0
+        return self.median * math.exp(random.gauss(0, self.sigma)) if self.sigma > 0 else self.median
+
+    def outcome(self) -> Optional[Response]:
+        """ An error response for this call, if it should fail. """
+        draw = random.random()
+        if draw < self.error_rate:
+            return JSONResponse({"error": "Internal Server Error"}, status_code=500)
+        if draw < self.error_rate + self.loading_rate:
+            return JSONResponse(
+                {"error": "Model is currently loading", "estimated_time": 1.0},
+                status_code=503,
+            )
+        return None
+
+def _classify(text: str, labels: list[str]) -> dict[str, Any]:
+    # Deterministic per text, so cached and fresh answers agree.
+    rng = random.Random(text)
+    weights = [rng.random() for _ in labels]
+    total = sum(weights) or 1.0
+    ranked = sorted(zip(labels, (weight / total for weight in weights)), key=lambda pair: -pair[1])
+    return {
+        "sequence": text,
+        "labels": [label for label, _ in ranked],
+        "scores": [score for _, score in ranked],
+    }
+
+def pipeline_app(latency: Latency) -> Starlette:
+    stats = {"calls": 0, "inputs": 0, "errors": 0}
+
+    async def classify(request: Request) -> Response:
+        body = await request.json()
+        inputs = body.get("inputs")
+        labels = (body.get("parameters") or {}).get("candidate_labels") or []
+        stats["calls"] += 1
+
+        await asyncio.sleep(latency.sample())
+        error = latency.outcome()
+        if error is not None:
+            stats["errors"] += 1
+            return error
+
+        if isinstance(inputs, list):
+            stats["inputs"] += len(inputs)
+            return JSONResponse([_classify(str(text), labels) for text in inputs])
+        stats["inputs"] += 1
+        return JSONResponse(_classify(str(inputs), labels))
+
+    async def read_stats(request: Request) -> Response:
+        return JSONResponse(stats)
+
+    return Starlette(routes=[
+        Route("/_stats", read_stats, methods=["GET"]),
+        Route("/{path:path}", classify, methods=["POST"]),
+    ])
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+class Store:
+    """ In-memory tables plus the GoTrue users behind them. """
+
+    def __init__(self):
+        self.tables: dict[str, list[dict[str, Any]]] = {"profiles": [], "history": [], "logs": []}
+        self.users: dict[str, dict[str, Any]] = {}
+        self._ids = itertools.count(1)
+
+    def add_user(self, username: str, email: str, role: str = "user") -> dict[str, Any]:
+        id = str(uuid.uuid4())
+        created_at = (datetime.now(timezone.utc) - timedelta(days=random.randint(0, 365))).isoformat()
+        user = {
+            "id": id,
+            "aud": "authenticated",
+            "role": "authenticated",
+            "email": email,
+            "app_metadata": {"provider": "email"},
+            "user_metadata": {"username": username, "app_role": role},
+            "created_at": created_at,
+            "updated_at": created_at,
+            "last_sign_in_at": None,
+        }
+        self.users[id] = user
+        self.tables["profiles"].append({"id": id, "username": username, "email": email, "created_at": created_at})
+        return user
+
+    def insert(self, table: str, rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        inserted = []
+        for row in rows:
+            row = {"id": next(self._ids), "created_at": _now(), **row}
+            self.tables.setdefault(table, []).append(row)
+            inserted.append(row)
+        return inserted
+
+def seed(users: int, history_per_user: int, labels: list[str]) -> Store:
+    store = Store()
+    store.add_user("admin", ADMIN_EMAIL, role="admin")
+    for i in range(users):
+        user = store.add_user(f"user{i:05d}", f"user{i:05d}@bench.example.com")
+        store.insert("history", [
+            {
+                "user_id": user["id"],
+                "raw_text": f"Seeded text {j} for {user['id']}",
+                "results": _classify(f"seed {i} {j}", labels),
+            }
+            for j in range(history_per_user)
+        ])
+    return store
+
+_OPERATORS = {
+    "eq": lambda a, b: a == b,
+    "neq": lambda a, b: a != b,
+    "gt": lambda a, b: a is not None and a > b,
+    "gte": lambda a, b: a is not None and a >= b,
+    "lt": lambda a, b: a is not None and a < b,
+    "lte": lambda a, b: a is not None and a <= b,
+}
+
+def _split(expression: str) -> list[str]:
+    """ Splits on the commas outside parentheses and double quotes. """
+    parts: list[str] = []
+    depth, quoted, start = 0, False, 0
+    for i, char in enumerate(expression):
+        if char == '"':
+            quoted = not quoted
+        elif quoted:
+            continue
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            parts.append(expression[start:i])
+            start = i + 1
+    parts.append(expression[start:])
+    return parts
+
+def _condition(expression: str) -> Callable[[dict[str, Any]], bool]:
+    """ One item of an `or`/`and` filter: `column.op.value`, or a nested
+    `or(...)` / `and(...)`. """
+    for logic in ("or", "and"):
+        if expression.startswith(f"{logic}(") and expression.endswith(")"):
+            return _logic(logic, expression[len(logic) + 1:-1])
+
+    column, _, rest = expression.partition(".")
+    operator, _, operand = rest.partition(".")
+    compare = _OPERATORS[operator]
+    return lambda row: compare(row.get(column), _coerce(row.get(column), operand))
+
+def _logic(logic: str, expression: str) -> Callable[[dict[str, Any]], bool]:
+    conditions = [_condition(part) for part in _split(expression)]
+    combine = any if logic == "or" else all
+    return lambda row: combine(condition(row) for condition in conditions)
+
+def _coerce(sample: Any, value: str) -> Any:
+    value = value.strip('"')
+    if isinstance(sample, int) and not isinstance(sample, bool):
+        try:
+            return int(value)
+        except ValueError:
+            return value
+    return value
+
+def _extract(row: dict[str, Any], path: str) -> Any:
+    column, *keys = path.replace("->>", "->").split("->")
+    value = row.get(column)
+    for key in keys:
+        if isinstance(value, list) and key.isdigit():
+            value = value[int(key)] if int(key) < len(value) else None
+        elif isinstance(value, dict):
+            value = value.get(key)
+        else:
+            return None
+    return value
+
+def _project(row: dict[str, Any], select: str) -> dict[str, Any]:
+    if select in ("", "*"):
+        return dict(row)
+
+    projected: dict[str, Any] = {}
+    for column in select.split(","):
+        if column == "*":
+            projected.update(row)
+            continue
+        alias, _, path = column.rpartition(":")
+        path = path or alias
+        name = alias or path.replace("->>", "->").split("->")[-1]
+        projected[name] = _extract(row, path)
+    return projected
+
+def supabase_app(store: Store, jwt_secret: str, latency: Latency) -> Starlette:
+    def session(user: dict[str, Any]) -> dict[str, Any]:
+        expires_at = int(time.time()) + 3600
+        token = jwt.encode(
+            {
+                "sub": user["id"],
+                "aud": "authenticated",
+                "exp": expires_at,
+                "email": user["email"],
+                "user_metadata": user["user_metadata"],
+            },
+            jwt_secret,
+            algorithm="HS256",
+        )
+        return {
+            "access_token": token,
+            "refresh_token": uuid.uuid4().hex,
+            "token_type": "bearer",
+            "expires_in": 3600,
+            "expires_at": expires_at,
+            "user": user,
+        }
+
+    async def token(request: Request) -> Response:
+        await asyncio.sleep(latency.sample())
+        body = await request.json()
+        user = next((user for user in store.users.values() if user["email"] == body.get("email")), None)
+        if user is None or body.get("password") != PASSWORD:
+            return JSONResponse(
+                {"code": 400, "error_code": "invalid_credentials", "msg": "Invalid login credentials"},
+                status_code=400,
+            )
+        user["last_sign_in_at"] = _now()
+        return JSONResponse(session(user))
+
+    async def current_user(request: Request) -> Response:
+        await asyncio.sleep(latency.sample())
+        try:
+            claims = jwt.decode(
+                request.headers.get("authorization", "")[7:],
+                jwt_secret,
+                algorithms=["HS256"],
+                audience="authenticated",
+            )
+        except jwt.PyJWTError:
+            return JSONResponse({"code": 401, "msg": "Invalid token"}, status_code=401)
+        return JSONResponse(store.users.get(claims["sub"]) or {}, status_code=200 if claims["sub"] in store.users else 404)
+
+    async def logout(request: Request) -> Response:
+        return Response(status_code=204)
+
+    async def admin_users(request: Request) -> Response:
+        await asyncio.sleep(latency.sample())
+        page = int(request.query_params.get("page", 1))
+        per_page = int(request.query_params.get("per_page", 50))
+        users = list(store.users.values())[(page - 1) * per_page:page * per_page]
+        return JSONResponse({"users": users, "aud": "authenticated"})
+
+    async def rest(request: Request) -> Response:
+        await asyncio.sleep(latency.sample())
+        table = request.path_params["table"]
+        rows = store.tables.setdefault(table, [])
+        prefer = request.headers.get("prefer", "")
+
+        if request.method == "POST":
+            body = json.loads(await request.body() or b"[]")
+            inserted = store.insert(table, body if isinstance(body, list) else [body])
+            if "return=representation" in prefer:
+                return JSONResponse(inserted, status_code=201)
+            return Response(status_code=201)
+
+        select = "*"
+        order: list[tuple[str, bool]] = []
+        limit: Optional[int] = None
+        matched = rows
+        for key, value in request.query_params.multi_items():
+            if key == "select":
+                select = value
+            elif key == "order":
+                order = [(part.split(".")[0], ".desc" in part) for part in value.split(",")]
+            elif key == "limit":
+                limit = int(value)
+            elif key in ("or", "and"):
+                # e.g. the history keyset cursor: or=(created_at.lt."X",and(...))
+                condition = _logic(key, value[1:-1])
+                matched = [row for row in matched if condition(row)]
+            elif key in ("offset", "on_conflict", "columns"):
+                continue
+            else:
+                operator, _, operand = value.partition(".")
+                compare = _OPERATORS.get(operator)
+                if compare is not None:
+                    matched = [
+                        row for row in matched
+                        if compare(row.get(key), _coerce(row.get(key), operand))
+                    ]
+
+        for column, desc in reversed(order):
+            matched = sorted(matched, key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+
+        total = len(matched)
+        if limit is not None:
+            matched = matched[:limit]
+
+        headers = {"Content-Range": f"0-{max(len(matched) - 1, 0)}/{total}"}
+        if request.method == "HEAD":
+            return Response(status_code=200, headers=headers)
+        return JSONResponse([_project(row, select) for row in matched], headers=headers)
+
+    return Starlette(routes=[
+        Route("/auth/v1/token", token, methods=["POST"]),
+        Route("/auth/v1/user", current_user, methods=["GET"]),
+        Route("/auth/v1/logout", logout, methods=["POST"]),
+        Route("/auth/v1/admin/users", admin_users, methods=["GET"]),
+        Route("/rest/v1/{table}", rest, methods=["GET", "HEAD", "POST"]),
+    ])
+
+async def serve(apps: list[tuple[Starlette, int]], host: str = "127.0.0.1") -> None:
+    servers = [
+        uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning", access_log=False))
+        for app, port in apps
+    ]
+    await asyncio.gather(*(server.serve() for server in servers))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the benchmark stand-ins for the pipeline and Supabase.")
+    parser.add_argument("--pipeline-port", type=int, default=8101)
+    parser.add_argument("--supabase-port", type=int, default=8102)
+    parser.add_argument("--jwt-secret", required=True)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--history", type=int, default=20, help="history rows per seeded user")
+    parser.add_argument("--pipeline-latency", type=float, default=0.3, help="median seconds")
+    parser.add_argument("--pipeline-sigma", type=float, default=0.5)
+    parser.add_argument("--pipeline-error-rate", type=float, default=0.0)
+    parser.add_argument("--pipeline-loading-rate", type=float, default=0.0)
+    parser.add_argument("--db-latency", type=float, default=0.01, help="median seconds")
+    parser.add_argument("--db-sigma", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    from external.pipeline import labels
+
+    store = seed(args.users, args.history, labels)
+    asyncio.run(serve([
+        (pipeline_app(Latency(
+            args.pipeline_latency, args.pipeline_sigma,
+            args.pipeline_error_rate, args.pipeline_loading_rate,
+        )), args.pipeline_port),
+        (supabase_app(store, args.jwt_secret, Latency(args.db_latency, args.db_sigma)), args.supabase_port),
+    ]))
+
+if __name__ == "__main__":
+    main()
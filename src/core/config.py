@@ -0,0 +1,142 @@
+""" Config
+Runtime tuning knobs, read from environment variables.
+
+Unlike `core.secrets`, every value here has a sensible default so the
+server can start without any of them being set.
+"""
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+
+# Analysis result cache (utils/cache.py)
+ANALYZE_CACHE_ENTRIES = int(os.getenv('ANALYZE_CACHE_ENTRIES', 2048))
+ANALYZE_CACHE_MAX_BYTES = int(os.getenv('ANALYZE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+ANALYZE_CACHE_TTL = float(os.getenv('ANALYZE_CACHE_TTL', 24 * 60 * 60))
+ANALYZE_CACHE_HISTORY = os.getenv('ANALYZE_CACHE_HISTORY', 'true').lower() == 'true'
+ANALYZE_CACHE_HISTORY_MAX_CHARS = int(os.getenv('ANALYZE_CACHE_HISTORY_MAX_CHARS', 4000))
+
+# Coalescing of identical concurrent analyses (utils/singleflight.py)
+ANALYZE_COALESCE_ENABLED = os.getenv('ANALYZE_COALESCE_ENABLED', 'true').lower() == 'true'
+ANALYZE_COALESCE_MAX_WAITERS = int(os.getenv('ANALYZE_COALESCE_MAX_WAITERS', 200))
+ANALYZE_COALESCE_TIMEOUT = float(os.getenv('ANALYZE_COALESCE_TIMEOUT', 90))
+
+# Zero-shot pipeline transport (external/transport.py)
+PIPELINE_POOL_SIZE = int(os.getenv('PIPELINE_POOL_SIZE', 32))
+PIPELINE_CONNECT_TIMEOUT = float(os.getenv('PIPELINE_CONNECT_TIMEOUT', 3.05))
+PIPELINE_READ_TIMEOUT = float(os.getenv('PIPELINE_READ_TIMEOUT', 30))
+PIPELINE_DEADLINE = float(os.getenv('PIPELINE_DEADLINE', 60))
+PIPELINE_RETRIES = int(os.getenv('PIPELINE_RETRIES', 3))
+PIPELINE_BACKOFF_BASE = float(os.getenv('PIPELINE_BACKOFF_BASE', 0.5))
+PIPELINE_BACKOFF_MAX = float(os.getenv('PIPELINE_BACKOFF_MAX', 10))
+PIPELINE_BREAKER_THRESHOLD = int(os.getenv('PIPELINE_BREAKER_THRESHOLD', 5))
+PIPELINE_BREAKER_RESET = float(os.getenv('PIPELINE_BREAKER_RESET', 30))
+
+# Batch analysis (POST /analyze/batch)
+ANALYZE_BATCH_MAX_ITEMS = int(os.getenv('ANALYZE_BATCH_MAX_ITEMS', 500))
+ANALYZE_BATCH_INPUTS = int(os.getenv('ANALYZE_BATCH_INPUTS', 8))
+ANALYZE_BATCH_CONCURRENCY = int(os.getenv('ANALYZE_BATCH_CONCURRENCY', 4))
+
+# Long-document analysis (POST /analyze with mode="chunked")
+ANALYZE_CHUNK_CHARS = int(os.getenv('ANALYZE_CHUNK_CHARS', 1500))
+ANALYZE_MAX_CHUNKS = int(os.getenv('ANALYZE_MAX_CHUNKS', 64))
+
+# Server-Sent Events streaming (POST /analyze/stream, /analyze/batch/stream)
+ANALYZE_STREAM_HEARTBEAT = float(os.getenv('ANALYZE_STREAM_HEARTBEAT', 10))
+
+# Analysis job queue (POST /analyze/jobs)
+JOBS_STORE = os.getenv('JOBS_STORE', 'memory')
+JOBS_SQLITE_PATH = os.getenv('JOBS_SQLITE_PATH', 'jobs.sqlite3')
+JOBS_CONCURRENCY = int(os.getenv('JOBS_CONCURRENCY', 4))
+JOBS_MAX_PER_USER = int(os.getenv('JOBS_MAX_PER_USER', 10))
+JOBS_MAX_QUEUED = int(os.getenv('JOBS_MAX_QUEUED', 1000))
+JOBS_TTL = float(os.getenv('JOBS_TTL', 60 * 60))
+# How often a worker marks itself alive in a shared store; jobs of a worker
+# not seen for three of these are failed (JOBS_STORE=sqlite).
+JOBS_HEARTBEAT = float(os.getenv('JOBS_HEARTBEAT', 30))
+
+# Classification engine (external/pipeline.py)
+# remote: hosted zero-shot model; local: in-process keyword scorer;
+# fallback: remote, answered locally while the upstream is failing.
+PIPELINE_ENGINE = os.getenv('PIPELINE_ENGINE', 'remote')
+LOCAL_ENGINE_TEMPERATURE = float(os.getenv('LOCAL_ENGINE_TEMPERATURE', 8))
+
+# Supabase clients (db/supabase.py)
+SUPABASE_POOL_SIZE = int(os.getenv('SUPABASE_POOL_SIZE', 64))
+SUPABASE_TIMEOUT = float(os.getenv('SUPABASE_TIMEOUT', 10))
+SUPABASE_CLIENT_CACHE = int(os.getenv('SUPABASE_CLIENT_CACHE', 1024))
+
+# Verified JWT claims cache (db/auth_context.py)
+AUTH_CACHE_SIZE = int(os.getenv('AUTH_CACHE_SIZE', 4096))
+
+# Background audit log sink (utils/logs.py)
+LOGS_QUEUE_SIZE = int(os.getenv('LOGS_QUEUE_SIZE', 10000))
+LOGS_BATCH_SIZE = int(os.getenv('LOGS_BATCH_SIZE', 200))
+LOGS_FLUSH_INTERVAL = float(os.getenv('LOGS_FLUSH_INTERVAL', 1))
+LOGS_OVERFLOW = os.getenv('LOGS_OVERFLOW', 'spill')
+LOGS_SAMPLE_RATE = float(os.getenv('LOGS_SAMPLE_RATE', 0.1))
+LOGS_SPILL_PATH = os.getenv('LOGS_SPILL_PATH', 'logs-spill.jsonl')
+
+# History pagination (GET /analyze/history)
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', 20))
+HISTORY_PAGE_MAX = int(os.getenv('HISTORY_PAGE_MAX', 100))
+
+# Admin user directory (services/admin/user_directory.py)
+USER_DIRECTORY_REFRESH = float(os.getenv('USER_DIRECTORY_REFRESH', 60))
+USER_DIRECTORY_PAGE_SIZE = int(os.getenv('USER_DIRECTORY_PAGE_SIZE', 1000))
+
+# Table backups (services/admin/backup_and_restore.py)
+BACKUP_DIR = os.getenv('BACKUP_DIR', 'backups')
+BACKUP_FORMAT = os.getenv('BACKUP_FORMAT', 'csv.gz')
+BACKUP_PAGE_SIZE = int(os.getenv('BACKUP_PAGE_SIZE', 1000))
+BACKUP_CONCURRENCY = int(os.getenv('BACKUP_CONCURRENCY', 3))
+BACKUP_FULL_EVERY = int(os.getenv('BACKUP_FULL_EVERY', 7))
+BACKUP_WATERMARK_LAG = float(os.getenv('BACKUP_WATERMARK_LAG', 5 * 60))
+BACKUP_RESTORE_BATCH = int(os.getenv('BACKUP_RESTORE_BATCH', 1000))
+BACKUP_RESTORE_WORKERS = int(os.getenv('BACKUP_RESTORE_WORKERS', 4))
+
+# History re-scoring with the local engine (services/admin/rescore.py)
+RESCORE_PAGE_SIZE = int(os.getenv('RESCORE_PAGE_SIZE', 500))
+
+# Username / email existence index (utils/identity.py)
+IDENTITY_BLOOM_CAPACITY = int(os.getenv('IDENTITY_BLOOM_CAPACITY', 100000))
+IDENTITY_BLOOM_ERROR = float(os.getenv('IDENTITY_BLOOM_ERROR', 0.01))
+IDENTITY_CACHE_SIZE = int(os.getenv('IDENTITY_CACHE_SIZE', 10000))
+IDENTITY_REFRESH = float(os.getenv('IDENTITY_REFRESH', 5 * 60))
+IDENTITY_PAGE_SIZE = int(os.getenv('IDENTITY_PAGE_SIZE', 1000))
+
+# Rate limiting (core/limiter.py)
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+RATE_LIMIT_STORAGE = os.getenv('RATE_LIMIT_STORAGE', 'sqlite://ratelimit.sqlite3')
+
+# Prometheus metrics (core/metrics.py, GET /metrics)
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_ALLOW_NETWORKS = os.getenv('METRICS_ALLOW_NETWORKS', '127.0.0.1/32,::1/128')
+
+# Python logging level (core/logs.py): DEBUG, INFO, WARN or ERROR
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'WARN')
+
+# Request profiling (core/profiling.py, GET /admin/read_profiles)
+PROFILE_ENABLED = os.getenv('PROFILE_ENABLED', 'true').lower() == 'true'
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+PROFILE_FORMAT = os.getenv('PROFILE_FORMAT', 'html')
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', 0.001))
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', 100))
+
+# Upstream warm-up and keep-alive (external/warmup.py)
+PIPELINE_WARMUP_ENABLED = os.getenv('PIPELINE_WARMUP_ENABLED', 'true').lower() == 'true'
+PIPELINE_WARMUP_TIMEOUT = float(os.getenv('PIPELINE_WARMUP_TIMEOUT', 120))
+PIPELINE_WARMUP_WAIT = float(os.getenv('PIPELINE_WARMUP_WAIT', 30))
+PIPELINE_WARMUP_TEXT = os.getenv('PIPELINE_WARMUP_TEXT', 'Clean water for every school.')
+PIPELINE_KEEPALIVE_IDLE = float(os.getenv('PIPELINE_KEEPALIVE_IDLE', 5 * 60))
+
+# Upstream call scheduler (external/scheduler.py)
+PIPELINE_SCHEDULER_ENABLED = os.getenv('PIPELINE_SCHEDULER_ENABLED', 'true').lower() == 'true'
+PIPELINE_MAX_IN_FLIGHT = int(os.getenv('PIPELINE_MAX_IN_FLIGHT', 16))
+PIPELINE_INTERACTIVE_RESERVE = int(os.getenv('PIPELINE_INTERACTIVE_RESERVE', 4))
+PIPELINE_QUEUE_PER_USER = int(os.getenv('PIPELINE_QUEUE_PER_USER', 50))
+PIPELINE_QUEUE_TIMEOUT_INTERACTIVE = float(os.getenv('PIPELINE_QUEUE_TIMEOUT_INTERACTIVE', 30))
+PIPELINE_QUEUE_TIMEOUT_BULK = float(os.getenv('PIPELINE_QUEUE_TIMEOUT_BULK', 120))
+# Jobs have no client waiting on them: 0 lets them queue as long as it takes.
+PIPELINE_QUEUE_TIMEOUT_BACKGROUND = float(os.getenv('PIPELINE_QUEUE_TIMEOUT_BACKGROUND', 0))
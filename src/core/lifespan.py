@@ -0,0 +1,69 @@
+""" Lifespan
+Startup and shutdown hooks for the FastAPI application.
+
+Importing the app only defines things. On startup, logging is configured,
+settings are checked (missing credentials fail here, not on import), the
+shared Supabase clients are built, the analysis job store is opened and
+the audit log sink starts. The username / email index, the admin user
+directory, the pipeline warm-up and the job heartbeat (which fails jobs
+a dead worker left unfinished) start in the background. /ready reports
+ready once the pipeline has answered (or its warm-up budget ran out).
+On shutdown, /ready turns unready first, unfinished jobs are
+cancelled and marked failed, queued audit logs are flushed, and the
+shared Supabase and pipeline connection pools are closed.
+"""
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from starlette.concurrency import run_in_threadpool
+import logging
+import time
+from core.config import LOG_LEVEL
+from core.logs import configure_logging
+from core.readiness import readiness
+from db.auth_context import check_settings as check_auth_settings
+from db.supabase import clients, db_admin, check_settings as check_supabase_settings
+from external.pipeline import client, async_client, warmup, check_settings as check_pipeline_settings
+from services.admin.user_directory import user_directory
+from services.job_services import JobServices, job_store
+from utils.identity import identity_index
+from utils.logs import log_sink
+
+logger = logging.getLogger(__name__)
+
+def _start() -> None:
+    check_auth_settings()
+    check_supabase_settings()
+    check_pipeline_settings()
+
+    # Built here so the first requests do not pay for them.
+    clients.admin()
+    clients.admin_async()
+
+    job_store()
+    log_sink.start()
+    identity_index.start(db_admin())
+    user_directory.start(db_admin())
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_logging(LOG_LEVEL)
+    started = time.perf_counter()
+    await run_in_threadpool(_start)
+    # /ready also waits for this (see external/warmup.py).
+    warmup.start()
+    JobServices.start()
+    readiness.mark_started()
+    logger.info("startup took %.3fs", time.perf_counter() - started)
+
+    yield
+
+    readiness.mark_stopping()
+    await JobServices.stop()
+    await warmup.stop()
+    await run_in_threadpool(identity_index.stop)
+    await run_in_threadpool(user_directory.stop)
+    await run_in_threadpool(log_sink.stop)
+    clients.close()
+    await clients.aclose()
+    client.close()
+    await async_client.aclose()
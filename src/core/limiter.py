@@ -1,11 +1,232 @@
-""" Initialize a rate limiter using SlowAPI.
+""" Rate limiter
+Per-route rate limits, shared by every worker process on the host.
 
-'Limiter' manages request rate limits to prevent abuse or overuse of API endpoints.
+Limits use GCRA (the generic cell rate algorithm, a token bucket that
+stores one timestamp per key): "5/second" lets a client spend 5 units at
+once and earns them back at one every 0.2 seconds. Each check is a single
+read-modify-write, whatever the rate.
 
-`key_func=get_remote_address` means each client's rate limit is tracked based on their IP address.
+Clients are keyed by the uid in their session, so a user gets one bucket
+per route however many IPs they use; anonymous requests (and invalid
+sessions) fall back to the client IP.
+
+RATE_LIMIT_STORAGE selects where the timestamps live:
+    sqlite://<path>  a SQLite file in WAL mode, shared by all workers (default)
+    memory://        per-process, for a single worker or tests
+
+Routes opt in with the decorator, optionally weighting each call:
+
+    @limiter.limit("50/second", cost=lambda payload, **_: len(payload.items))
+
+`cost` receives the endpoint's arguments. Every limited response carries
+RateLimit-Limit, RateLimit-Remaining and RateLimit-Reset headers (added by
+`RateLimitHeaders` in core/middleware.py); rejected ones are 429s with
+Retry-After.
 """
+from fastapi import HTTPException, Request
+from dataclasses import dataclass
+from functools import wraps
+from threading import Lock
+from typing import Any, Callable, Optional
+import inspect
+import math
+import re
+import sqlite3
+import time
+from starlette.concurrency import run_in_threadpool
+from core.config import RATE_LIMIT_ENABLED, RATE_LIMIT_STORAGE
+from core.metrics import RATE_LIMIT_REJECTIONS, timer
+from db.auth_context import get_auth
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 60 * 60, "day": 24 * 60 * 60}
+
+@dataclass(frozen=True)
+class Rate:
+    limit: int
+    period: float
+
+    @classmethod
+    def parse(cls, value: str) -> "Rate":
+        """ Parses "N/second", "N/minute", "N/5 minutes", ... """
+        match = re.fullmatch(r"\s*(\d+)\s*(?:/|per)\s*(\d+)?\s*(second|minute|hour|day)s?\s*", value)
+        if not match:
+            raise ValueError(f"Invalid rate limit: {value}")
+        count, multiplier, unit = match.groups()
+        return cls(int(count), int(multiplier or 1) * _PERIODS[unit])
+
+@dataclass(frozen=True)
+class RateLimitResult:
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_after: float
+    retry_after: float
+
+    def headers(self) -> dict[str, str]:
+        headers = {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(math.ceil(self.reset_after)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(math.ceil(self.retry_after))
+        return headers
+
+class RateLimitExceeded(HTTPException):
+    def __init__(self, result: RateLimitResult):
+        super().__init__(status_code=429, detail="Rate limit exceeded", headers=result.headers())
+
+def _gcra(tat: Optional[float], now: float, rate: Rate, burst: int, cost: int) -> tuple[float, RateLimitResult]:
+    """ The new theoretical arrival time, and whether `cost` units fit. """
+    interval = rate.period / rate.limit
+    capacity = interval * burst
+    tat = max(tat or now, now)
+    new_tat = tat + interval * cost
+
+    if new_tat - now > capacity:
+        remaining = int((capacity - (tat - now)) // interval)
+        return tat, RateLimitResult(False, burst, max(remaining, 0), tat - now, new_tat - now - capacity)
+
+    remaining = int((capacity - (new_tat - now)) // interval)
+    return new_tat, RateLimitResult(True, burst, remaining, new_tat - now, 0.0)
+
+class MemoryStorage:
+    def __init__(self):
+        self._tats: dict[str, float] = {}
+        self._prune_at = 100_000
+        self._lock = Lock()
+
+    def hit(self, key: str, rate: Rate, burst: int, cost: int) -> RateLimitResult:
+        now = time.time()
+        with self._lock:
+            tat, result = _gcra(self._tats.get(key), now, rate, burst, cost)
+            self._tats[key] = tat
+            if len(self._tats) > self._prune_at:
+                self._tats = {key: tat for key, tat in self._tats.items() if tat > now}
+                self._prune_at = max(100_000, len(self._tats) * 2)
+            return result
+
+class SQLiteStorage:
+    _PRUNE_EVERY = 10_000
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = Lock()
+        self._hits = 0
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA busy_timeout=5000")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS rate_limits (key TEXT PRIMARY KEY, tat REAL NOT NULL)")
+
+    def hit(self, key: str, rate: Rate, burst: int, cost: int) -> RateLimitResult:
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so the read and the
+            # update are atomic across processes too.
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self._conn.execute("SELECT tat FROM rate_limits WHERE key = ?", (key,)).fetchone()
+                tat, result = _gcra(row[0] if row else None, now, rate, burst, cost)
+                if result.allowed:
+                    self._conn.execute(
+                        "INSERT INTO rate_limits (key, tat) VALUES (?, ?) "
+                        "ON CONFLICT (key) DO UPDATE SET tat = excluded.tat",
+                        (key, tat),
+                    )
+
+                self._hits += 1
+                if self._hits % self._PRUNE_EVERY == 0:
+                    self._conn.execute("DELETE FROM rate_limits WHERE tat < ?", (now,))
+
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return result
+
+def create_storage(uri: str) -> MemoryStorage | SQLiteStorage:
+    if uri == "memory://":
+        return MemoryStorage()
+    if uri.startswith("sqlite://"):
+        return SQLiteStorage(uri[len("sqlite://"):])
+    raise ValueError(f"Unknown RATE_LIMIT_STORAGE: {uri}")
+
+def rate_limit_key(request: Request) -> str:
+    try:
+        uid = get_auth(request).uid
+    except HTTPException:
+        uid = None
+
+    if uid:
+        return f"user:{uid}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+class Limiter:
+    def __init__(self, key_func: Callable[[Request], str], storage_uri: str, enabled: bool = True):
+        self.key_func = key_func
+        self.storage_uri = storage_uri
+        self.enabled = enabled
+        self._storage: Optional[MemoryStorage | SQLiteStorage] = None
+        self._lock = Lock()
+
+    @property
+    def storage(self) -> MemoryStorage | SQLiteStorage:
+        if self._storage is None:
+            with self._lock:
+                if self._storage is None:
+                    self._storage = create_storage(self.storage_uri)
+        return self._storage
+
+    def hit(self, request: Request, scope: str, rate: Rate, burst: int, cost: int) -> RateLimitResult:
+        with timer("rate_limiter", "hit"):
+            result = self.storage.hit(f"{scope}:{self.key_func(request)}", rate, burst, cost)
+        request.state.rate_limit = result
+        if not result.allowed:
+            RATE_LIMIT_REJECTIONS.labels(getattr(request.scope.get("route"), "path", scope)).inc()
+            raise RateLimitExceeded(result)
+        return result
+
+    def limit(
+        self,
+        rate: str,
+        cost: int | Callable[..., int] = 1,
+        burst: Optional[int] = None,
+    ) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+        """ Limits the decorated endpoint to `rate` per client.
+
+        `burst` (default: the rate's count) is how many units can be spent
+        at once; it must cover the largest `cost` a single call can have.
+        The endpoint needs a `request: Request` parameter.
+        """
+        parsed = Rate.parse(rate)
+        capacity = burst or parsed.limit
+
+        def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+            scope = f"{func.__module__}.{func.__name__}"
+
+            def check(kwargs: dict[str, Any]) -> None:
+                if not self.enabled:
+                    return
+                request = kwargs.get("request")
+                if not isinstance(request, Request):
+                    raise RuntimeError(f"{scope} needs a `request: Request` parameter to be rate limited")
+                units = cost(**kwargs) if callable(cost) else cost
+                self.hit(request, scope, parsed, capacity, max(int(units), 1))
+
+            if inspect.iscoroutinefunction(func):
+                @wraps(func)
+                async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                    await run_in_threadpool(check, kwargs)
+                    return await func(*args, **kwargs)
+                return async_wrapper
+
+            @wraps(func)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                check(kwargs)
+                return func(*args, **kwargs)
+            return wrapper
 
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+        return decorator
 
-limiter = Limiter(key_func=get_remote_address)
\ No newline at end of file
+limiter = Limiter(key_func=rate_limit_key, storage_uri=RATE_LIMIT_STORAGE, enabled=RATE_LIMIT_ENABLED)
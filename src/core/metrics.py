@@ -0,0 +1,187 @@
+""" Metrics
+Prometheus metrics for the server and the services it calls.
+
+- http_*: request count, latency and in-flight requests per route
+  template and status, recorded by `MetricsMiddleware`.
+- dependency_*: latency and in-flight calls to the classification
+  pipeline, Supabase (per table / auth endpoint, via `MeteredTransport`),
+  the audit log sink and the rate limiter, recorded with `timed()`.
+- rate_limit_rejections_total: 429s per route.
+- pipeline_queue_*: calls waiting for an upstream slot, how long they
+  waited and how many were dropped, per priority class
+  (external/scheduler.py).
+
+GET /metrics serves them to admins and to METRICS_ALLOW_NETWORKS. With
+several uvicorn workers, set PROMETHEUS_MULTIPROC_DIR to a shared empty
+directory so every worker's samples are aggregated.
+"""
+from functools import wraps
+from typing import Any, Callable, Optional, TypeVar
+import inspect
+import os
+import re
+import time
+import httpx
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+    multiprocess,
+)
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests handled.",
+    ["method", "route", "status"],
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "Time to handle an HTTP request, including streamed bodies.",
+    ["method", "route", "status"], buckets=BUCKETS,
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests being handled.",
+    ["method"], multiprocess_mode="livesum",
+)
+DEPENDENCY_LATENCY = Histogram(
+    "dependency_duration_seconds", "Time spent in calls to a dependency.",
+    ["dependency", "operation", "outcome"], buckets=BUCKETS,
+)
+DEPENDENCY_IN_FLIGHT = Gauge(
+    "dependency_calls_in_flight", "Calls to a dependency awaiting an answer.",
+    ["dependency"], multiprocess_mode="livesum",
+)
+RATE_LIMIT_REJECTIONS = Counter(
+    "rate_limit_rejections_total", "Requests rejected by the rate limiter.",
+    ["route"],
+)
+PIPELINE_QUEUE_DEPTH = Gauge(
+    "pipeline_queue_depth", "Pipeline calls waiting for an upstream slot.",
+    ["priority"], multiprocess_mode="livesum",
+)
+PIPELINE_QUEUE_WAIT = Histogram(
+    "pipeline_queue_wait_seconds", "Time pipeline calls waited for an upstream slot.",
+    ["priority"], buckets=BUCKETS,
+)
+PIPELINE_QUEUE_DROPS = Counter(
+    "pipeline_queue_dropped_total", "Pipeline calls dropped before reaching the upstream.",
+    ["priority", "reason"],
+)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+class _Timer:
+    def __init__(self, dependency: str, operation: str):
+        self.dependency = dependency
+        self.operation = operation
+
+    def __enter__(self) -> "_Timer":
+        DEPENDENCY_IN_FLIGHT.labels(self.dependency).inc()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        DEPENDENCY_IN_FLIGHT.labels(self.dependency).dec()
+        DEPENDENCY_LATENCY.labels(
+            self.dependency, self.operation, "error" if exc_type else "ok",
+        ).observe(time.perf_counter() - self.started)
+
+def timer(dependency: str, operation: str) -> _Timer:
+    """ Context manager timing one call to `dependency`. """
+    return _Timer(dependency, operation)
+
+def timed(dependency: str, operation: Optional[str] = None) -> Callable[[F], F]:
+    """ Decorator timing every call of a function (sync or async). """
+    def decorator(func: F) -> F:
+        name = operation or func.__name__
+
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                with _Timer(dependency, name):
+                    return await func(*args, **kwargs)
+            return async_wrapper  # type: ignore
+
+        @wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with _Timer(dependency, name):
+                return func(*args, **kwargs)
+        return wrapper  # type: ignore
+
+    return decorator
+
+_UUID = re.compile(r"^[0-9a-fA-F-]{32,36}$")
+
+def supabase_operation(request: httpx.Request) -> str:
+    """ "rest:profiles", "auth:admin/users", ... without ids, to keep
+    label cardinality bounded. """
+    parts = [part for part in request.url.path.split("/") if part]
+    if len(parts) >= 3 and parts[1] == "v1":
+        service, rest = parts[0], [part for part in parts[2:] if not _UUID.match(part)]
+        name = rest[0] if service == "rest" else "/".join(rest[:2])
+        return f"{request.method} {service}:{name}"
+    return f"{request.method} {'/'.join(parts[:2])}"
+
+class MeteredTransport(httpx.BaseTransport):
+    def __init__(self, transport: httpx.BaseTransport, dependency: str):
+        self.transport = transport
+        self.dependency = dependency
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        with _Timer(self.dependency, supabase_operation(request)):
+            return self.transport.handle_request(request)
+
+    def close(self) -> None:
+        self.transport.close()
+
+class AsyncMeteredTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport: httpx.AsyncBaseTransport, dependency: str):
+        self.transport = transport
+        self.dependency = dependency
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        with _Timer(self.dependency, supabase_operation(request)):
+            return await self.transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        status = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.labels(method).inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.labels(method).dec()
+            # The route template, not the raw path, keeps label cardinality bounded.
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUESTS.labels(method, route, str(status)).inc()
+            HTTP_LATENCY.labels(method, route, str(status)).observe(time.perf_counter() - started)
+
+def render() -> tuple[bytes, str]:
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -1,16 +1,51 @@
 from fastapi import FastAPI
 from fastapi.security import HTTPBearer
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from typing import Any
 from core.secrets import CLIENT_URL
+from core.config import METRICS_ENABLED, PROFILE_ENABLED
+from core.metrics import MetricsMiddleware
+from core.profiling import ProfilingMiddleware
 
 security = HTTPBearer()
 
 class Middleware:
     @staticmethod
     def register(app: FastAPI):
+        app.add_middleware(RateLimitHeaders)
         CorsMiddleware.register(app)
 
+        if PROFILE_ENABLED:
+            app.add_middleware(ProfilingMiddleware)
+
+        # Added last so it is outermost and times everything else.
+        if METRICS_ENABLED:
+            app.add_middleware(MetricsMiddleware)
+
+class RateLimitHeaders:
+    """ Adds the RateLimit-* headers of the route's limiter check (see
+    core/limiter.py) to the response. """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        async def send_with_headers(message: Message):
+            if message["type"] == "http.response.start":
+                result = scope.get("state", {}).get("rate_limit")
+                if result is not None:
+                    headers = MutableHeaders(scope=message)
+                    for name, value in result.headers().items():
+                        headers.setdefault(name, value)
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
 class CorsMiddleware:
     _origins: list[Any] = [
         CLIENT_URL,
@@ -24,7 +59,17 @@ class CorsMiddleware:
         "allow_credentials": True,
         "allow_methods": ["*"],
         "allow_headers": ["*"],
-        "expose_headers": ["Content-Disposition"], 
+        "expose_headers": [
+            "Content-Disposition",
+            "ETag",
+            "X-Next-Cursor",
+            "X-Total-Count",
+            "RateLimit-Limit",
+            "RateLimit-Remaining",
+            "RateLimit-Reset",
+            "Retry-After",
+            "X-Profile-Report",
+        ], 
     }
 
     @classmethod
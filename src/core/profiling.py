@@ -0,0 +1,215 @@
+""" Request profiling
+Profiles single requests with pyinstrument (a sampling profiler) so a slow
+call in production can be broken down after the fact.
+
+A request is profiled when either
+    - it carries an `X-Profile` header and an admin session, or
+    - PROFILE_SAMPLE_RATE (default 0) picks it at random.
+The header value may name the report format ("html" or "speedscope");
+otherwise PROFILE_FORMAT is used. Profiled responses carry
+`X-Profile-Report: <name>`, the report's name under PROFILE_DIR, which
+GET /admin/read_profile/{name} downloads. Only the newest PROFILE_KEEP
+reports are kept.
+
+Requests that are not picked only pay for a header scan. Sync endpoints
+run in the threadpool, outside the event loop the middleware profiles;
+routers whose `route_class` is `ProfiledRoute` profile them on their
+worker thread too, and the two samples are merged into one report.
+
+pyinstrument (in requirements.txt) is only imported once a request is
+picked; in an install without it, profiling is disabled with a warning.
+"""
+from fastapi import HTTPException, Request
+from fastapi.routing import APIRoute
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from functools import wraps
+from threading import Lock
+from typing import Any, Callable, Optional
+import importlib.util
+import inspect
+import logging
+import os
+import random
+import uuid
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from core.config import PROFILE_DIR, PROFILE_FORMAT, PROFILE_INTERVAL, PROFILE_KEEP, PROFILE_SAMPLE_RATE
+from db.auth_context import get_auth
+
+# Imported when the first request is profiled.
+AVAILABLE = importlib.util.find_spec("pyinstrument") is not None
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {"html": ".html", "speedscope": ".speedscope.json"}
+HEADER = b"x-profile"
+
+# Sessions recorded on worker threads for the request being profiled.
+_thread_sessions: ContextVar[Optional[list[Any]]] = ContextVar("profile_thread_sessions", default=None)
+
+class ProfileStore:
+    def __init__(self, directory: str, keep: int):
+        self.directory = directory
+        self.keep = keep
+        self._lock = Lock()
+
+    def save(self, name: str, content: str) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, name)
+        with open(path + ".part", "w", encoding="utf-8") as file:
+            file.write(content)
+        os.replace(path + ".part", path)
+
+        with self._lock:
+            for stale in self.list_all()[self.keep:]:
+                try:
+                    os.remove(os.path.join(self.directory, stale["name"]))
+                except OSError:
+                    pass
+
+    def list_all(self) -> list[dict[str, Any]]:
+        """ Saved reports, newest first. """
+        if not os.path.isdir(self.directory):
+            return []
+
+        reports: list[dict[str, Any]] = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(tuple(FORMATS.values())):
+                stat = entry.stat()
+                reports.append({
+                    "name": entry.name,
+                    "bytes": stat.st_size,
+                    "created_at": datetime.fromtimestamp(stat.st_mtime, timezone.utc).isoformat(),
+                    "mtime": stat.st_mtime,
+                })
+        reports.sort(key=lambda report: report.pop("mtime"), reverse=True)
+        return reports
+
+    def path(self, name: str) -> str:
+        if os.path.basename(name) != name or not name.endswith(tuple(FORMATS.values())):
+            raise HTTPException(status_code=400, detail="Invalid report name")
+
+        path = os.path.join(self.directory, name)
+        if not os.path.isfile(path):
+            raise HTTPException(status_code=404, detail="Report not found")
+        return path
+
+profile_store = ProfileStore(PROFILE_DIR, PROFILE_KEEP)
+
+def _profiler(interval: float, async_mode: str) -> Any:
+    from pyinstrument import Profiler
+    return Profiler(interval=interval, async_mode=async_mode)
+
+def _render(session: Any, format: str) -> str:
+    from pyinstrument.renderers import HTMLRenderer, SpeedscopeRenderer
+
+    if format == "speedscope":
+        return SpeedscopeRenderer().render(session)
+    return HTMLRenderer().render(session)
+
+class ProfilingMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        store: ProfileStore = profile_store,
+        sample_rate: float = PROFILE_SAMPLE_RATE,
+        format: str = PROFILE_FORMAT,
+        interval: float = PROFILE_INTERVAL,
+    ):
+        if format not in FORMATS:
+            raise ValueError(f"Unknown PROFILE_FORMAT: {format}")
+        if not AVAILABLE:
+            logger.warning("pyinstrument is not installed; request profiling is disabled")
+
+        self.app = app
+        self.store = store
+        self.sample_rate = sample_rate
+        self.format = format
+        self.interval = interval
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not AVAILABLE:
+            return await self.app(scope, receive, send)
+
+        format = self._requested(scope)
+        if format is None:
+            return await self.app(scope, receive, send)
+
+        name = "{}-{}-{}{}".format(
+            datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S"),
+            scope["path"].strip("/").replace("/", "_") or "root",
+            uuid.uuid4().hex[:8],
+            FORMATS[format],
+        )
+
+        async def send_with_name(message: Message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["X-Profile-Report"] = name
+            await send(message)
+
+        sessions: list[Any] = []
+        token = _thread_sessions.set(sessions)
+        profiler = _profiler(self.interval, "enabled")
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_name)
+        finally:
+            profiler.stop()
+            _thread_sessions.reset(token)
+            try:
+                await run_in_threadpool(self._save, name, format, profiler.last_session, sessions)
+            except Exception as e:
+                logger.warning("failed to save profile %s: %s", name, e)
+
+    def _requested(self, scope: Scope) -> Optional[str]:
+        """ The report format if this request should be profiled. """
+        for key, value in scope["headers"]:
+            if key == HEADER:
+                try:
+                    admin = get_auth(Request(scope)).role == "admin"
+                except HTTPException:
+                    admin = False
+                if admin:
+                    requested = value.decode("latin-1").strip().lower()
+                    return requested if requested in FORMATS else self.format
+                break
+
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return self.format
+        return None
+
+    def _save(self, name: str, format: str, session: Any, thread_sessions: list[Any]) -> None:
+        from pyinstrument.session import Session
+
+        for other in thread_sessions:
+            session = Session.combine(session, other)
+        self.store.save(name, _render(session, format))
+
+def _profile_thread(func: Callable[..., Any]) -> Callable[..., Any]:
+    @wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        sessions = _thread_sessions.get()
+        if sessions is None:
+            return func(*args, **kwargs)
+
+        profiler = _profiler(PROFILE_INTERVAL, "disabled")
+        profiler.start()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.stop()
+            sessions.append(profiler.last_session)
+
+    wrapper.profiled = True  # type: ignore
+    return wrapper
+
+class ProfiledRoute(APIRoute):
+    """ Route class that lets the profiler see sync endpoints too. """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any):
+        # include_router() builds the routes again from the wrapped endpoints.
+        if AVAILABLE and not inspect.iscoroutinefunction(endpoint) and not hasattr(endpoint, "profiled"):
+            endpoint = _profile_thread(endpoint)
+        super().__init__(path, endpoint, **kwargs)
@@ -0,0 +1,54 @@
+""" Readiness
+What GET /ready reports.
+
+Importing the app has no side effects: settings are validated and
+clients built by the startup hook in core/lifespan.py, which marks the
+"startup" check done once everything is in place. Other subsystems add
+their own checks with `readiness.register()`. A required check that is
+not ready turns /ready into a 503, so a load balancer holds traffic back;
+optional ones are only reported.
+
+A check returns None when ready, or a short reason when not.
+"""
+from threading import Lock
+from typing import Any, Callable, Optional
+
+Check = Callable[[], Optional[str]]
+
+class Readiness:
+    def __init__(self):
+        self._checks: dict[str, tuple[Check, bool]] = {}
+        self._started: Optional[str] = "starting"
+        self._lock = Lock()
+        self.register("startup", lambda: self._started)
+
+    def register(self, name: str, check: Check, required: bool = True) -> None:
+        with self._lock:
+            self._checks[name] = (check, required)
+
+    def mark_started(self) -> None:
+        self._started = None
+
+    def mark_stopping(self) -> None:
+        self._started = "shutting down"
+
+    def report(self) -> tuple[bool, dict[str, Any]]:
+        """ (ready, per-check status). """
+        with self._lock:
+            checks = list(self._checks.items())
+
+        ready = True
+        details: dict[str, Any] = {}
+        for name, (check, required) in checks:
+            try:
+                reason = check()
+            except Exception as e:
+                reason = f"check failed: {e}"
+
+            details[name] = {"ready": reason is None, "required": required}
+            if reason is not None:
+                details[name]["reason"] = reason
+                ready = ready and not required
+        return ready, details
+
+readiness = Readiness()
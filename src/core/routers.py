@@ -16,7 +16,9 @@ from routers import (
     auth_router,
     profile_router,
     analyze_router,
-    admin_router
+    admin_router,
+    metrics_router,
+    health_router
 )
 
 class Routers:
@@ -25,4 +27,6 @@ class Routers:
         app.include_router(auth_router)
         app.include_router(profile_router)
         app.include_router(analyze_router)
-        app.include_router(admin_router)
\ No newline at end of file
+        app.include_router(admin_router)
+        app.include_router(metrics_router)
+        app.include_router(health_router)
\ No newline at end of file
@@ -0,0 +1,108 @@
+""" Auth context
+Reads the `access_token` cookie once per request, verifies its signature
+against SUPABASE_JWT once, and exposes the caller's uid, role and exp to
+every dependency that needs them.
+
+Verified claims are kept in a bounded LRU keyed by a hash of the token
+until the token expires, so repeat calls with the same session skip the
+HMAC and JSON work entirely.
+"""
+from fastapi import HTTPException, Request
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+from typing import Any, Optional
+import hashlib
+import time
+import jwt
+from core.config import AUTH_CACHE_SIZE
+from core.secrets import SUPABASE_JWT
+
+def check_settings() -> None:
+    """ Called at startup (core/lifespan.py), not on import. """
+    if not SUPABASE_JWT:
+        raise ValueError("Missing Supabase JWT secret in environment variables")
+
+@dataclass(frozen=True)
+class AuthContext:
+    token: str
+    uid: Optional[str] = None
+    role: Optional[str] = None
+    exp: Optional[float] = None
+
+ANONYMOUS = AuthContext(token="")
+
+class ClaimsCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: str) -> Optional[dict[str, Any]]:
+        with self._lock:
+            claims = self._entries.get(key)
+            if claims is None:
+                return None
+
+            if claims["exp"] <= time.time():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return claims
+
+    def set(self, key: str, claims: dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = claims
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+claims_cache = ClaimsCache(AUTH_CACHE_SIZE)
+
+def get_token(request: Request) -> str:
+    token = request.cookies.get("access_token")
+    if token and token.startswith('Bearer '):
+        return token[7:]
+    return ""
+
+def verify_token(token: str) -> dict[str, Any]:
+    key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    claims = claims_cache.get(key)
+    if claims is not None:
+        return claims
+
+    try:
+        claims = jwt.decode(
+            jwt=token,
+            key=SUPABASE_JWT,  # type: ignore
+            algorithms=["HS256"],
+            audience="authenticated",
+            options={"require": ["exp", "sub"]},
+        )
+    except jwt.PyJWTError as e:
+        raise HTTPException(status_code=401, detail=f"Invalid session: {str(e)}")
+
+    claims_cache.set(key, claims)
+    return claims
+
+def get_auth(request: Request) -> AuthContext:
+    """ The request's AuthContext; anonymous when there is no cookie. """
+    cached = getattr(request.state, "auth", None)
+    if cached is not None:
+        return cached
+
+    token = get_token(request)
+    if not token:
+        auth = ANONYMOUS
+    else:
+        claims = verify_token(token)
+        auth = AuthContext(
+            token=token,
+            uid=claims.get("sub"),
+            role=(claims.get("user_metadata") or {}).get("app_role"),
+            exp=float(claims["exp"]),
+        )
+
+    request.state.auth = auth
+    return auth
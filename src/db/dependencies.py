@@ -1,8 +1,9 @@
 from fastapi import Depends
 from typing import Annotated
-from supabase import Client
-from db.supabase import get_db, get_db_admin, get_id
+from supabase import Client, AsyncClient
+from db.supabase import get_db_admin, get_id, get_async_db, get_async_db_auth
 
-GetDB = Annotated[Client, Depends(get_db)]
 GetDBAdmin = Annotated[Client, Depends(get_db_admin)]
-GetUID = Annotated[Client, Depends(get_id)]
+GetUID = Annotated[str, Depends(get_id)]
+GetAsyncDB = Annotated[AsyncClient, Depends(get_async_db)]
+GetAsyncAuthDB = Annotated[AsyncClient, Depends(get_async_db_auth)]
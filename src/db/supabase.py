@@ -1,77 +1,214 @@
-from fastapi import Depends, Request
-from supabase import create_client, Client
+from fastapi import Depends, HTTPException
+from supabase import create_client, Client, AsyncClient
 from supabase.client import ClientOptions
+from supabase.lib.client_options import AsyncClientOptions
+from core.config import SUPABASE_POOL_SIZE, SUPABASE_TIMEOUT, SUPABASE_CLIENT_CACHE
 from core.secrets import SUPABASE_URL, SUPABASE_KEY, SUPABASE_KEY_ADMIN
-from typing import Annotated, Any
-import jwt
-
-def get_token(request: Request):
-    token = request.cookies.get("access_token")
-    if token and token.startswith('Bearer '):
-        return token[7:]
-    return ""
-    
-GetToken = Annotated[Any, Depends(get_token)]
+from collections import OrderedDict
+from threading import RLock
+from typing import Annotated, Optional
+from db.auth_context import AuthContext, get_auth
+from core.metrics import MeteredTransport, AsyncMeteredTransport
+import httpx
+import time
 
-if not SUPABASE_URL or not SUPABASE_KEY or not SUPABASE_KEY_ADMIN:
-    raise ValueError("Missing Supabase credentials in environment variables")
+GetAuth = Annotated[AuthContext, Depends(get_auth)]
 
-def get_db(token: GetToken) -> Client:    
-    if not token:   
-        return create_client(SUPABASE_URL, SUPABASE_KEY)
+def check_settings() -> None:
+    """ Called at startup (core/lifespan.py), not on import. """
+    if not SUPABASE_URL or not SUPABASE_KEY or not SUPABASE_KEY_ADMIN:
+        raise ValueError("Missing Supabase credentials in environment variables")
 
-    return create_client(SUPABASE_URL, SUPABASE_KEY,
-        options=ClientOptions(
-            headers={"Authorization": f"Bearer {token}"}
-        )
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=SUPABASE_POOL_SIZE,
+        max_keepalive_connections=SUPABASE_POOL_SIZE,
     )
 
-def get_db_admin(token: GetToken):
-    role = get_role(token)
-    if role != "admin":
-        raise ValueError("Unauthorized")
-    
-    return create_client(
-        SUPABASE_URL,
-        SUPABASE_KEY_ADMIN,
-        options=ClientOptions(
-            auto_refresh_token=False,
-            persist_session=False,
+class ClientManager:
+    """ Hands out Supabase clients that all share one HTTP connection pool.
+
+    - `for_token_async()`: per-user clients, cached in a bounded LRU until
+      the token's `exp`. Only use these for table access; auth calls would
+      change their session for everybody holding the same client.
+    - `fresh_async()`: a new, uncached client for auth flows (sign up/in/out).
+    - `admin_async()`: one shared service-role client.
+
+    The async routes use those, sharing one httpx.AsyncClient pool.
+    `admin()` is a sync service-role client (on its own pool) for the
+    admin routes and background threads.
+    """
+
+    def __init__(self, url: str, key: str, admin_key: str, max_clients: int):
+        self.url = url
+        self.key = key
+        self.admin_key = admin_key
+        self.max_clients = max_clients
+
+        self._http: Optional[httpx.Client] = None
+        self._admin: Optional[Client] = None
+
+        self._ahttp: Optional[httpx.AsyncClient] = None
+        self._aadmin: Optional[AsyncClient] = None
+        self._aanon: Optional[AsyncClient] = None
+        self._aclients: OrderedDict[str, tuple[AsyncClient, float]] = OrderedDict()
+        self._lock = RLock()
+
+    @property
+    def http(self) -> httpx.Client:
+        if self._http is None:
+            with self._lock:
+                if self._http is None:
+                    self._http = httpx.Client(
+                        follow_redirects=True,
+                        timeout=SUPABASE_TIMEOUT,
+                        transport=MeteredTransport(
+                            httpx.HTTPTransport(http2=True, limits=_limits()),
+                            "supabase",
+                        ),
+                    )
+        return self._http
+
+    @property
+    def ahttp(self) -> httpx.AsyncClient:
+        if self._ahttp is None:
+            with self._lock:
+                if self._ahttp is None:
+                    self._ahttp = httpx.AsyncClient(
+                        follow_redirects=True,
+                        timeout=SUPABASE_TIMEOUT,
+                        transport=AsyncMeteredTransport(
+                            httpx.AsyncHTTPTransport(http2=True, limits=_limits()),
+                            "supabase",
+                        ),
+                    )
+        return self._ahttp
+
+    def admin(self) -> Client:
+        if self._admin is None:
+            with self._lock:
+                if self._admin is None:
+                    self._admin = self._create(self.admin_key)
+        return self._admin
+
+    def for_token_async(self, token: str, expires_at: Optional[float] = None) -> AsyncClient:
+        if not token:
+            if self._aanon is None:
+                with self._lock:
+                    if self._aanon is None:
+                        self._aanon = self._acreate(self.key)
+            return self._aanon
+
+        now = time.time()
+        with self._lock:
+            cached = self._aclients.get(token)
+            if cached and cached[1] > now:
+                self._aclients.move_to_end(token)
+                return cached[0]
+
+        client = self._acreate(self.key, token)
+        if expires_at is None or expires_at <= now:
+            return client
+
+        with self._lock:
+            self._aclients[token] = (client, expires_at)
+            self._aclients.move_to_end(token)
+            self._evict(now)
+
+        return client
+
+    def fresh_async(self) -> AsyncClient:
+        return AsyncClient(
+            self.url,
+            self.key,
+            options=AsyncClientOptions(
+                headers={"Authorization": f"Bearer {self.key}"},
+                httpx_client=self.ahttp,
+            ),
         )
-    )
 
-def get_role(token: str):
-    decoded_payload = jwt.decode(
-        jwt=token,
-        algorithms=["HS256"],
-        options={
-            "verify_signature": False,
-            "verify_exp": True
-        }
-    )
+    def admin_async(self) -> AsyncClient:
+        if self._aadmin is None:
+            with self._lock:
+                if self._aadmin is None:
+                    self._aadmin = self._acreate(self.admin_key)
+        return self._aadmin
 
-    user_metadata = decoded_payload.get("user_metadata", {})
-    return user_metadata.get("app_role")
-
-def get_id(token: GetToken):
-    decoded_payload = jwt.decode(
-        jwt=token,
-        algorithms=["HS256"],
-        options={
-            "verify_signature": False,
-            "verify_exp": True
-        }
-    )
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "cached_async_clients": len(self._aclients),
+                "max_clients": self.max_clients,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._admin = None
+            if self._http is not None:
+                self._http.close()
+                self._http = None
+
+    async def aclose(self) -> None:
+        with self._lock:
+            self._aclients.clear()
+            self._aadmin = None
+            self._aanon = None
+            ahttp, self._ahttp = self._ahttp, None
+        if ahttp is not None:
+            await ahttp.aclose()
+
+    def _create(self, key: str) -> Client:
+        return create_client(
+            self.url,
+            key,
+            options=ClientOptions(
+                auto_refresh_token=False,
+                persist_session=False,
+                httpx_client=self.http,
+            )
+        )
+
+    def _acreate(self, key: str, token: Optional[str] = None) -> AsyncClient:
+        # With an Authorization header set, AsyncClient needs no awaited
+        # session lookup, so it can be built outside the event loop.
+        return AsyncClient(
+            self.url,
+            key,
+            options=AsyncClientOptions(
+                headers={"Authorization": f"Bearer {token or key}"},
+                auto_refresh_token=False,
+                persist_session=False,
+                httpx_client=self.ahttp,
+            ),
+        )
+
+    def _evict(self, now: float) -> None:
+        expired = [token for token, (_, expires_at) in self._aclients.items() if expires_at <= now]
+        for token in expired:
+            del self._aclients[token]
+
+        while len(self._aclients) > self.max_clients:
+            self._aclients.popitem(last=False)
+
+clients = ClientManager(SUPABASE_URL, SUPABASE_KEY, SUPABASE_KEY_ADMIN, SUPABASE_CLIENT_CACHE)  # type: ignore
+
+def get_async_db(auth: GetAuth) -> AsyncClient:
+    return clients.for_token_async(auth.token, auth.exp)
+
+def get_async_db_auth() -> AsyncClient:
+    return clients.fresh_async()
+
+def get_db_admin(auth: GetAuth):
+    if auth.role != "admin":
+        raise HTTPException(status_code=403, detail="Unauthorized")
     
-    user_id = decoded_payload.get("sub")
-    return user_id
+    return clients.admin()
+
+def get_id(auth: GetAuth):
+    if not auth.uid:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+    return auth.uid
 
 def db_admin():
-    return create_client(
-        SUPABASE_URL,
-        SUPABASE_KEY_ADMIN,
-        options=ClientOptions(
-            auto_refresh_token=False,
-            persist_session=False,
-        )
-    )
\ No newline at end of file
+    return clients.admin()
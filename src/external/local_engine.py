@@ -0,0 +1,106 @@
+""" Local engine
+In-process SDG classifier, scored from the per-SDG term weights that ship
+in data/sdg_terms.json.
+
+Every text is reduced to a sparse vector of (log-scaled) counts of the
+known 1..n-word terms, so a whole batch is scored with one sparse matrix
+product against the term x label weight matrix. Scores are normalized
+into a distribution over `labels`, the same shape the remote zero-shot
+model returns:
+
+    {"sequence": text, "labels": [...], "scores": [...], "engine": "local"}
+"""
+from pathlib import Path
+from typing import Any
+import json
+import re
+import numpy as np
+from scipy import sparse
+from core.config import LOCAL_ENGINE_TEMPERATURE
+
+TERMS_PATH = Path(__file__).parent / "data" / "sdg_terms.json"
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+def tokenize(text: str) -> list[str]:
+    return [_stem(token) for token in _TOKEN.findall(text.lower())]
+
+def _stem(token: str) -> str:
+    # Just enough to fold plurals onto the singular terms in the data file.
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+class LocalEngine:
+    def __init__(self, labels: list[str], terms_path: Path = TERMS_PATH):
+        self.labels = labels
+        with open(terms_path, encoding="utf-8") as file:
+            terms: dict[str, dict[str, float]] = json.load(file)
+
+        missing = set(labels) - set(terms)
+        if missing:
+            raise ValueError(f"No local terms for: {', '.join(sorted(missing))}")
+
+        weights: dict[tuple[str, int], float] = {}
+        for column, label in enumerate(labels):
+            for term, weight in terms[label].items():
+                key = (" ".join(tokenize(term)), column)
+                weights[key] = max(weights.get(key, 0.0), float(weight))
+
+        self.vocabulary = {term: row for row, term in enumerate(sorted({term for term, _ in weights}))}
+        self.max_ngram = max(len(term.split()) for term in self.vocabulary)
+
+        rows = [self.vocabulary[term] for term, _ in weights]
+        columns = [column for _, column in weights]
+        self.weights = sparse.csr_matrix(
+            (list(weights.values()), (rows, columns)),
+            shape=(len(self.vocabulary), len(labels)),
+        )
+
+    def classify(self, text: str) -> dict[str, Any]:
+        return self.classify_many([text])[0]
+
+    def classify_many(self, texts: list[str]) -> list[dict[str, Any]]:
+        counts = self._vectorize(texts)
+        counts.sum_duplicates()
+        counts.data = np.log1p(counts.data)
+        raw = np.asarray((counts @ self.weights).todense())
+
+        totals = raw.sum(axis=1, keepdims=True)
+        shares = np.divide(raw, totals, out=np.zeros_like(raw), where=totals > 0)
+        logits = LOCAL_ENGINE_TEMPERATURE * shares
+        logits -= logits.max(axis=1, keepdims=True)
+        scores = np.exp(logits)
+        scores /= scores.sum(axis=1, keepdims=True)
+
+        results: list[dict[str, Any]] = []
+        for text, row in zip(texts, scores):
+            order = np.argsort(-row, kind="stable")
+            results.append({
+                "sequence": text,
+                "labels": [self.labels[i] for i in order],
+                "scores": [float(row[i]) for i in order],
+                "engine": "local",
+            })
+
+        return results
+
+    def _vectorize(self, texts: list[str]) -> sparse.csr_matrix:
+        rows: list[int] = []
+        columns: list[int] = []
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            for n in range(1, self.max_ngram + 1):
+                for i in range(len(tokens) - n + 1):
+                    column = self.vocabulary.get(" ".join(tokens[i:i + n]))
+                    if column is not None:
+                        rows.append(row)
+                        columns.append(column)
+
+        # Duplicate (row, column) pairs are summed into term counts.
+        return sparse.csr_matrix(
+            (np.ones(len(rows)), (rows, columns)),
+            shape=(len(texts), len(self.vocabulary)),
+        )
@@ -1,9 +1,34 @@
 from core.secrets import PIPELINE_URL, PIPELINE_KEY
-from typing import Any
-import requests
+from core.config import (
+    PIPELINE_ENGINE,
+    PIPELINE_WARMUP_ENABLED,
+    PIPELINE_WARMUP_TIMEOUT,
+    PIPELINE_WARMUP_WAIT,
+    PIPELINE_WARMUP_TEXT,
+    PIPELINE_KEEPALIVE_IDLE,
+)
+from core.readiness import readiness
+from core.metrics import timed
+from functools import cache
+from typing import Any, Optional
+import time
+from external.transport import (
+    PipelineClient,
+    AsyncPipelineClient,
+    PipelineError,
+    CircuitOpenError,
+    create_breaker,
+)
+from external.warmup import Warmup
+from external.scheduler import Caller, QueueFullError, DeadlineExceededError, scheduler
 
-if not PIPELINE_URL or not PIPELINE_KEY:
-    raise ValueError("")
+def check_settings() -> None:
+    """ Called at startup (core/lifespan.py), not on import. """
+    if PIPELINE_ENGINE not in ("remote", "local", "fallback"):
+        raise ValueError(f"Unknown PIPELINE_ENGINE: {PIPELINE_ENGINE}")
+
+    if PIPELINE_ENGINE != "local" and (not PIPELINE_URL or not PIPELINE_KEY):
+        raise ValueError("Missing pipeline credentials in environment variables")
 
 headers = {
     "Authorization": f"Bearer {PIPELINE_KEY}",
@@ -28,7 +53,7 @@ labels: list[str] = [
     "SDG 17: Partnerships for the Goals"
 ]
 
-def payload(text: str) -> dict[str, Any]:
+def payload(text: str | list[str]) -> dict[str, Any]:
     payload: dict[str, Any] = {
         "inputs": text,
         "parameters": {
@@ -37,11 +62,97 @@ def payload(text: str) -> dict[str, Any]:
     }
     return payload
 
-def pipeline(text: str):
-    response = requests.post(
-        PIPELINE_URL,
-        headers=headers,
-        json=payload(text)
+# One breaker for both clients: they talk to the same upstream.
+breaker = create_breaker()
+client = PipelineClient(PIPELINE_URL, headers, breaker)
+async_client = AsyncPipelineClient(PIPELINE_URL, headers, breaker)
+
+warmup = Warmup(
+    post=lambda: async_client.post(payload(PIPELINE_WARMUP_TEXT)),
+    idle_interval=PIPELINE_KEEPALIVE_IDLE,
+    timeout=PIPELINE_WARMUP_TIMEOUT,
+    wait=PIPELINE_WARMUP_WAIT,
+    enabled=PIPELINE_WARMUP_ENABLED and PIPELINE_ENGINE != "local",
+)
+readiness.register("pipeline", warmup.check)
+
+async def _apost(body: dict[str, Any], caller: Optional[Caller] = None) -> Any:
+    # Rather than hit a model that is still loading, wait for the warm-up.
+    await warmup.wait()
+    # Then for a slot (see external/scheduler.py).
+    async with scheduler.slot(caller):
+        started = time.monotonic()
+        try:
+            response = await async_client.post(body)
+        except PipelineError as e:
+            warmup.record(time.monotonic() - started, str(e))
+            raise
+    warmup.record(time.monotonic() - started)
+    return response
+
+@cache
+def local_engine():
+    # Imported on first use: numpy/scipy are only needed by this engine.
+    from external.local_engine import LocalEngine
+    return LocalEngine(labels)
+
+def _falls_back(error: PipelineError) -> bool:
+    """ True if the local engine should answer instead: the upstream is
+    down or failing, not the scheduler pushing back on this caller. """
+    if PIPELINE_ENGINE != "fallback" or isinstance(error, (QueueFullError, DeadlineExceededError)):
+        return False
+    return (
+        isinstance(error, CircuitOpenError)
+        or error.status is None
+        or error.status >= 500
+        or error.status == 429
+    )
+
+@timed("pipeline", "classify")
+async def apipeline(text: str, caller: Optional[Caller] = None):
+    if PIPELINE_ENGINE == "local":
+        return local_engine().classify(text)
+
+    try:
+        return await _apost(payload(text), caller)
+    except PipelineError as e:
+        if _falls_back(e):
+            return local_engine().classify(text)
+        raise
+
+@timed("pipeline", "classify_many")
+async def apipeline_many(texts: list[str], caller: Optional[Caller] = None) -> list[Any]:
+    """ Classifies several texts in one upstream request, in order. """
+    if PIPELINE_ENGINE == "local":
+        return local_engine().classify_many(texts)
+
+    try:
+        response = await _apost(payload(texts), caller)
+    except PipelineError as e:
+        if _falls_back(e):
+            return local_engine().classify_many(texts)
+        raise
+
+    return _unpack_many(response, texts)
+
+def _unpack_many(response: Any, texts: list[str]) -> list[Any]:
+    # A single input may come back unwrapped.
+    if isinstance(response, dict):
+        response = [response]
+
+    if not isinstance(response, list) or len(response) != len(texts):
+        raise PipelineError("Pipeline returned a malformed batch response")
+
+    return response
+
+def is_result(response: Any) -> bool:
+    """ True if `response` is a classification, not an upstream error body. """
+    return (
+        isinstance(response, dict)
+        and isinstance(response.get("labels"), list)
+        and isinstance(response.get("scores"), list)
     )
 
-    return response.json()
\ No newline at end of file
+def is_local(response: Any) -> bool:
+    """ True for answers from the local engine, which are not worth caching. """
+    return isinstance(response, dict) and response.get("engine") == "local"
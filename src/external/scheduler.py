@@ -0,0 +1,246 @@
+""" Upstream call scheduler
+Shares the classification pipeline fairly between users.
+
+Every upstream call on the async paths (`apipeline`, `apipeline_many`)
+first takes one of PIPELINE_MAX_IN_FLIGHT slots (per worker). While they
+are all busy, calls queue:
+
+- by priority class: interactive (/analyze, /analyze/stream) before bulk
+  (/analyze/batch and its stream) before background (analysis jobs).
+  Bulk and background calls never take the last
+  PIPELINE_INTERACTIVE_RESERVE slots, so a burst of interactive requests
+  finds room straight away.
+- within a class, round-robin by user: whoever has a hundred calls queued
+  gets one slot, then everybody else with a call queued gets one.
+- until the caller's deadline (PIPELINE_QUEUE_TIMEOUT_*, counted from when
+  the request arrived). A call still queued when it passes is dropped with
+  a 504 rather than sent for a client that has given up; a caller that
+  goes away (a closed stream) leaves the queue at once.
+- at most PIPELINE_QUEUE_PER_USER per user and class; the next gets a 429.
+
+Queue depth, waits and drops are exported as pipeline_queue_* metrics and
+in `stats()` (GET /admin/read_scheduler_stats).
+"""
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Literal, Optional
+import asyncio
+import statistics
+import time
+from core.config import (
+    PIPELINE_SCHEDULER_ENABLED,
+    PIPELINE_MAX_IN_FLIGHT,
+    PIPELINE_INTERACTIVE_RESERVE,
+    PIPELINE_QUEUE_PER_USER,
+    PIPELINE_QUEUE_TIMEOUT_INTERACTIVE,
+    PIPELINE_QUEUE_TIMEOUT_BULK,
+    PIPELINE_QUEUE_TIMEOUT_BACKGROUND,
+)
+from core.metrics import PIPELINE_QUEUE_DEPTH, PIPELINE_QUEUE_WAIT, PIPELINE_QUEUE_DROPS
+from external.transport import PipelineError
+
+Priority = Literal["interactive", "bulk", "background"]
+PRIORITIES: tuple[Priority, ...] = ("interactive", "bulk", "background")
+
+class QueueFullError(PipelineError):
+    pass
+
+class DeadlineExceededError(PipelineError):
+    pass
+
+@dataclass(frozen=True)
+class Caller:
+    """ Who an upstream call is for, and until when (time.monotonic())
+    it is worth making; None waits as long as it takes. """
+    user: str
+    priority: Priority = "interactive"
+    deadline: Optional[float] = None
+
+@dataclass(eq=False)
+class _Waiter:
+    caller: Caller
+    future: "asyncio.Future[None]"
+    queued_at: float
+
+class Scheduler:
+    def __init__(
+        self,
+        max_in_flight: int,
+        reserve: int,
+        per_user: int,
+        timeouts: dict[str, float],
+        enabled: bool = True,
+        history: int = 1000,
+    ):
+        self.max_in_flight = max(1, max_in_flight)
+        # Slots each class may fill: the lower ones leave `reserve` free.
+        lower = max(1, self.max_in_flight - reserve)
+        self.limits = {"interactive": self.max_in_flight, "bulk": lower, "background": lower}
+        self.per_user = max(1, per_user)
+        self.timeouts = timeouts
+        self.enabled = enabled
+
+        self.in_flight = 0
+        # Per class: user -> their queued calls, users in round-robin order.
+        self._queues: dict[str, OrderedDict[str, deque[_Waiter]]] = {p: OrderedDict() for p in PRIORITIES}
+        self._depth = {p: 0 for p in PRIORITIES}
+
+        self.granted = {p: 0 for p in PRIORITIES}
+        self.dropped = {p: {"deadline": 0, "queue_full": 0, "cancelled": 0} for p in PRIORITIES}
+        self._waits: dict[str, deque[float]] = {p: deque(maxlen=history) for p in PRIORITIES}
+
+    def caller(self, user: str, priority: Priority = "interactive") -> Caller:
+        """ A caller whose deadline starts counting now. """
+        timeout = self.timeouts.get(priority)
+        return Caller(user, priority, time.monotonic() + timeout if timeout else None)
+
+    @asynccontextmanager
+    async def slot(self, caller: Optional[Caller] = None) -> AsyncIterator[None]:
+        """ Holds one upstream slot for `caller` while the block runs. """
+        if not self.enabled:
+            yield
+            return
+
+        await self._acquire(caller or Caller(""))
+        try:
+            yield
+        finally:
+            self._release()
+
+    def stats(self) -> dict[str, Any]:
+        classes: dict[str, Any] = {}
+        for priority in PRIORITIES:
+            waits = sorted(self._waits[priority])
+            classes[priority] = {
+                "limit": self.limits[priority],
+                "queued": self._depth[priority],
+                "users_queued": len(self._queues[priority]),
+                "granted": self.granted[priority],
+                "dropped": dict(self.dropped[priority]),
+                "wait_ms": {
+                    "p50": round(statistics.median(waits) * 1000, 1) if waits else None,
+                    "p99": round(waits[min(len(waits) - 1, int(len(waits) * 0.99))] * 1000, 1) if waits else None,
+                    "samples": len(waits),
+                },
+            }
+
+        return {
+            "enabled": self.enabled,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "classes": classes,
+        }
+
+    async def _acquire(self, caller: Caller) -> None:
+        priority = caller.priority
+        now = time.monotonic()
+        if caller.deadline is not None and now >= caller.deadline:
+            self._drop(priority, "deadline")
+            raise DeadlineExceededError("Request deadline passed before the pipeline call", status=504)
+
+        if self._free(priority) and not self._waiting(priority):
+            self._grant(priority, 0.0)
+            return
+
+        queue = self._queues[priority].setdefault(caller.user, deque())
+        if len(queue) >= self.per_user:
+            self._drop(priority, "queue_full")
+            raise QueueFullError("Too many analyses queued, try again later", status=429)
+
+        waiter = _Waiter(caller, asyncio.get_running_loop().create_future(), now)
+        queue.append(waiter)
+        self._depth[priority] += 1
+        PIPELINE_QUEUE_DEPTH.labels(priority).inc()
+
+        try:
+            await asyncio.wait_for(waiter.future, None if caller.deadline is None else caller.deadline - now)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                # Handed a slot just as the caller gave up: pass it on.
+                self._release()
+            else:
+                self._remove(waiter)
+
+            if isinstance(e, asyncio.CancelledError):
+                self._drop(priority, "cancelled")
+                raise
+            self._drop(priority, "deadline")
+            raise DeadlineExceededError("Timed out waiting for a pipeline slot", status=504) from None
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """ Hands free slots to queued callers: the higher classes first,
+        round-robin over users within a class. """
+        now = time.monotonic()
+        for priority in PRIORITIES:
+            users = self._queues[priority]
+            while users and self._free(priority):
+                user, queue = next(iter(users.items()))
+                waiter = queue.popleft()
+                if queue:
+                    users.move_to_end(user)
+                else:
+                    del users[user]
+                self._depth[priority] -= 1
+                PIPELINE_QUEUE_DEPTH.labels(priority).dec()
+
+                if waiter.future.done():
+                    continue
+                if waiter.caller.deadline is not None and now >= waiter.caller.deadline:
+                    self._drop(priority, "deadline")
+                    waiter.future.set_exception(
+                        DeadlineExceededError("Timed out waiting for a pipeline slot", status=504)
+                    )
+                    continue
+
+                self._grant(priority, now - waiter.queued_at)
+                waiter.future.set_result(None)
+
+            if users:
+                # Nothing of a lower class goes ahead of a queued call.
+                return
+
+    def _remove(self, waiter: _Waiter) -> None:
+        priority, user = waiter.caller.priority, waiter.caller.user
+        queue = self._queues[priority].get(user)
+        if queue is None or waiter not in queue:
+            return
+
+        queue.remove(waiter)
+        if not queue:
+            del self._queues[priority][user]
+        self._depth[priority] -= 1
+        PIPELINE_QUEUE_DEPTH.labels(priority).dec()
+
+    def _free(self, priority: str) -> bool:
+        return self.in_flight < self.limits[priority]
+
+    def _waiting(self, priority: str) -> bool:
+        """ True if calls of `priority` or a higher class are queued. """
+        return any(self._queues[p] for p in PRIORITIES[:PRIORITIES.index(priority) + 1])  # type: ignore
+
+    def _grant(self, priority: str, waited: float) -> None:
+        self.in_flight += 1
+        self.granted[priority] += 1
+        self._waits[priority].append(waited)
+        PIPELINE_QUEUE_WAIT.labels(priority).observe(waited)
+
+    def _drop(self, priority: str, reason: str) -> None:
+        self.dropped[priority][reason] += 1
+        PIPELINE_QUEUE_DROPS.labels(priority, reason).inc()
+
+scheduler = Scheduler(
+    max_in_flight=PIPELINE_MAX_IN_FLIGHT,
+    reserve=PIPELINE_INTERACTIVE_RESERVE,
+    per_user=PIPELINE_QUEUE_PER_USER,
+    timeouts={
+        "interactive": PIPELINE_QUEUE_TIMEOUT_INTERACTIVE,
+        "bulk": PIPELINE_QUEUE_TIMEOUT_BULK,
+        "background": PIPELINE_QUEUE_TIMEOUT_BACKGROUND,
+    },
+    enabled=PIPELINE_SCHEDULER_ENABLED,
+)
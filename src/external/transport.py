@@ -0,0 +1,270 @@
+""" Pipeline transport
+Long-lived, pooled HTTP clients for the hosted zero-shot model.
+
+PipelineClient (requests) and AsyncPipelineClient (httpx) keep their
+connections alive between calls, bound every attempt with connect/read
+timeouts, retry 5xx and "model is loading" responses with jittered
+exponential backoff, and share a CircuitBreaker so that once the upstream
+is clearly down, callers fail fast instead of queueing on dead sockets.
+
+The server's request paths use the async client, behind the scheduler
+(external/scheduler.py). The sync one is for code that runs outside the
+event loop, such as scripts and threadpool work; it bypasses the
+scheduler and only opens its session (and imports requests) on first use.
+"""
+from threading import Lock
+from typing import TYPE_CHECKING, Any, Optional
+import asyncio
+import json
+import random
+import time
+import httpx
+from core.config import (
+    PIPELINE_POOL_SIZE,
+    PIPELINE_CONNECT_TIMEOUT,
+    PIPELINE_READ_TIMEOUT,
+    PIPELINE_DEADLINE,
+    PIPELINE_RETRIES,
+    PIPELINE_BACKOFF_BASE,
+    PIPELINE_BACKOFF_MAX,
+    PIPELINE_BREAKER_THRESHOLD,
+    PIPELINE_BREAKER_RESET,
+)
+
+if TYPE_CHECKING:
+    import requests
+
+class PipelineError(RuntimeError):
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+class CircuitOpenError(PipelineError):
+    pass
+
+class CircuitBreaker:
+    """ Opens after `threshold` consecutive failures, then lets a single
+    probe through once `reset_timeout` seconds have passed. """
+
+    def __init__(self, threshold: int, reset_timeout: float):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self) -> bool:
+        """ Raises CircuitOpenError unless the call may go ahead; True if
+        it is the half-open probe. """
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return False
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            raise CircuitOpenError("Pipeline is unavailable, try again later", status=503)
+
+    def release_probe(self) -> None:
+        """ For a probe that ended without an answer (cancelled, or an
+        unexpected error): the next call probes instead. """
+        with self._lock:
+            self._probing = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+def _is_loading(status: int, body: Any) -> bool:
+    return (
+        status == 503
+        and isinstance(body, dict)
+        and "loading" in str(body.get("error", "")).lower()
+    )
+
+def _should_retry(status: int, body: Any) -> bool:
+    return status >= 500 or status == 429 or _is_loading(status, body)
+
+def _retry_delay(attempt: int, body: Any) -> float:
+    # "Model is loading" responses carry the upstream's own estimate.
+    if isinstance(body, dict) and isinstance(body.get("estimated_time"), (int, float)):
+        return min(float(body["estimated_time"]), PIPELINE_BACKOFF_MAX)
+
+    # Full jitter: spreads retries from many workers across the window.
+    return random.uniform(0, min(PIPELINE_BACKOFF_MAX, PIPELINE_BACKOFF_BASE * 2 ** attempt))
+
+def _is_outage(status: int, body: Any) -> bool:
+    # Anything the upstream answered coherently (4xx, 429, "loading") means
+    # it is alive; only transport failures and real 5xx count as outages.
+    return status == 0 or (status >= 500 and not _is_loading(status, body))
+
+def _record(breaker: CircuitBreaker, status: int, body: Any) -> None:
+    if _is_outage(status, body):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+def _error_message(status: int, body: Any) -> str:
+    if isinstance(body, dict) and body.get("error"):
+        return f"Pipeline error ({status}): {body['error']}"
+    return f"Pipeline error ({status})"
+
+def _parse(status: int, text: str) -> Any:
+    try:
+        return json.loads(text)
+    except ValueError:
+        return {"error": text[:200]} if status >= 400 else None
+
+class PipelineClient:
+    def __init__(self, url: Optional[str], headers: dict[str, str], breaker: CircuitBreaker):
+        self.url = url
+        self.headers = headers
+        self.breaker = breaker
+        self._session: Optional["requests.Session"] = None
+        self._lock = Lock()
+
+    @property
+    def session(self) -> "requests.Session":
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    # Imported on first use: the async routes never need it.
+                    import requests
+                    from requests.adapters import HTTPAdapter
+
+                    session = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=1,
+                        pool_maxsize=PIPELINE_POOL_SIZE,
+                        max_retries=0,
+                    )
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    session.headers.update(self.headers)
+                    self._session = session
+        return self._session
+
+    def post(self, json: dict[str, Any]) -> Any:
+        from requests import RequestException
+
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            probe = self.breaker.before_call()
+            try:
+                response = self.session.post(
+                    self.url,  # type: ignore
+                    json=json,
+                    timeout=(PIPELINE_CONNECT_TIMEOUT, PIPELINE_READ_TIMEOUT),
+                )
+                status, body = response.status_code, _parse(response.status_code, response.text)
+            except RequestException as e:
+                status, body = 0, {"error": str(e)}
+            except BaseException:
+                if probe:
+                    self.breaker.release_probe()
+                raise
+
+            if 0 < status < 400:
+                self.breaker.record_success()
+                return body
+
+            _record(self.breaker, status, body)
+            retryable = status == 0 or _should_retry(status, body)
+
+            delay = _retry_delay(attempt, body)
+            if (
+                not retryable
+                or attempt >= PIPELINE_RETRIES
+                or time.monotonic() - started + delay > PIPELINE_DEADLINE
+            ):
+                raise PipelineError(_error_message(status, body), status=status or None)
+
+            attempt += 1
+            time.sleep(delay)
+
+    def close(self) -> None:
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+class AsyncPipelineClient:
+    def __init__(self, url: Optional[str], headers: dict[str, str], breaker: CircuitBreaker):
+        self.url = url
+        self.headers = headers
+        self.breaker = breaker
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                headers=self.headers,
+                limits=httpx.Limits(
+                    max_connections=PIPELINE_POOL_SIZE,
+                    max_keepalive_connections=PIPELINE_POOL_SIZE,
+                ),
+                timeout=httpx.Timeout(PIPELINE_READ_TIMEOUT, connect=PIPELINE_CONNECT_TIMEOUT),
+            )
+        return self._client
+
+    async def post(self, json: dict[str, Any]) -> Any:
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            probe = self.breaker.before_call()
+            try:
+                response = await self.client.post(self.url, json=json)  # type: ignore
+                status, body = response.status_code, _parse(response.status_code, response.text)
+            except httpx.HTTPError as e:
+                status, body = 0, {"error": str(e) or type(e).__name__}
+            except BaseException:
+                # Cancelled (a client went away) or broken: without this
+                # the breaker would wait for this probe forever.
+                if probe:
+                    self.breaker.release_probe()
+                raise
+
+            if 0 < status < 400:
+                self.breaker.record_success()
+                return body
+
+            _record(self.breaker, status, body)
+            retryable = status == 0 or _should_retry(status, body)
+
+            delay = _retry_delay(attempt, body)
+            if (
+                not retryable
+                or attempt >= PIPELINE_RETRIES
+                or time.monotonic() - started + delay > PIPELINE_DEADLINE
+            ):
+                raise PipelineError(_error_message(status, body), status=status or None)
+
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+def create_breaker() -> CircuitBreaker:
+    return CircuitBreaker(PIPELINE_BREAKER_THRESHOLD, PIPELINE_BREAKER_RESET)
@@ -0,0 +1,175 @@
+""" Pipeline warm-up
+Keeps the hosted zero-shot model warm so users never wait for it to load.
+
+The hosted model is unloaded after a quiet spell; the next call then takes
+tens of seconds or gets a 503 "model is loading". `Warmup` runs in the
+background on the event loop:
+
+- at startup it sends a one-word classification, retrying until the model
+  answers or PIPELINE_WARMUP_TIMEOUT passes. /ready (core/readiness.py)
+  stays unready until then.
+- afterwards it pings again whenever no call went upstream for
+  PIPELINE_KEEPALIVE_IDLE seconds. A ping that fails means the model went
+  cold: it is warmed up again the same way. If that runs out of time too
+  the state is "degraded" until a call succeeds, and nobody is held.
+
+While the model is loading, `wait()` holds callers for up to
+PIPELINE_WARMUP_WAIT seconds so they reach a loaded model, instead of
+each of them hitting the cold one. Outages (anything but a 503, or an
+open circuit breaker) hold nobody. Every upstream call (`record()`) feeds
+the health numbers in `stats()`.
+"""
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+import asyncio
+import logging
+import statistics
+import time
+from core.metrics import timer
+from external.transport import CircuitOpenError, PipelineError
+
+logger = logging.getLogger(__name__)
+
+class Warmup:
+    def __init__(
+        self,
+        post: Callable[[], Awaitable[Any]],
+        idle_interval: float,
+        timeout: float,
+        wait: float,
+        enabled: bool = True,
+        retry_interval: float = 5,
+        history: int = 100,
+    ):
+        self.post = post
+        self.idle_interval = idle_interval
+        self.timeout = timeout
+        self.wait_timeout = wait
+        self.enabled = enabled
+        self.retry_interval = retry_interval
+
+        # cold -> warming -> warm (or degraded when the startup budget ran out)
+        self.state = "cold" if enabled else "disabled"
+        self.started_up = not enabled
+        self._warm = asyncio.Event()
+        self._task: Optional[asyncio.Task[None]] = None
+
+        self.last_call_at = 0.0
+        self.last_success_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.consecutive_failures = 0
+        self.pings = 0
+        self.warmups = 0
+        self._latencies: deque[float] = deque(maxlen=history)
+
+    def start(self) -> None:
+        """ Starts the background task; needs a running event loop. """
+        if self.enabled and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run(), name="pipeline-warmup")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def wait(self) -> None:
+        """ Holds the caller while the model is warming up, up to the limit. """
+        if self.state != "warming":
+            return
+        try:
+            await asyncio.wait_for(self._warm.wait(), self.wait_timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def record(self, latency: float, error: Optional[str] = None) -> None:
+        """ Notes one upstream call (a user's or a ping). """
+        now = time.monotonic()
+        self.last_call_at = now
+        if error is None:
+            self.last_success_at = now
+            self.consecutive_failures = 0
+            self._latencies.append(latency)
+            if self.state == "degraded":
+                self.state = "warm"
+        else:
+            self.last_error = error
+            self.consecutive_failures += 1
+
+    def check(self) -> Optional[str]:
+        """ Readiness: None once the startup warm-up is over. """
+        return None if self.started_up else f"pipeline {self.state}"
+
+    def stats(self) -> dict[str, Any]:
+        latencies = sorted(self._latencies)
+        now = time.monotonic()
+        return {
+            "state": self.state,
+            "idle_seconds": round(now - self.last_call_at, 1) if self.last_call_at else None,
+            "last_success_seconds_ago": round(now - self.last_success_at, 1) if self.last_success_at else None,
+            "last_error": self.last_error,
+            "consecutive_failures": self.consecutive_failures,
+            "pings": self.pings,
+            "warmups": self.warmups,
+            "latency_ms": {
+                "p50": round(statistics.median(latencies) * 1000, 1) if latencies else None,
+                "p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1) if latencies else None,
+                "samples": len(latencies),
+            },
+        }
+
+    async def ping(self) -> Optional[PipelineError]:
+        """ One cheap classification; the error if it failed. """
+        self.pings += 1
+        started = time.monotonic()
+        try:
+            with timer("pipeline", "warmup"):
+                await self.post()
+        except PipelineError as e:
+            self.record(time.monotonic() - started, str(e))
+            return e
+        self.record(time.monotonic() - started)
+        return None
+
+    async def warm_up(self, timeout: float) -> bool:
+        """ Pings until the model answers; False if `timeout` ran out first. """
+        self.warmups += 1
+        self.state = "warming"
+        self._warm.clear()
+        deadline = time.monotonic() + timeout
+        try:
+            while (error := await self.ping()) is not None:
+                if isinstance(error, CircuitOpenError) or error.status != 503:
+                    # An outage rather than a model loading: holding callers
+                    # would not help them, the breaker answers them faster.
+                    self.state = "degraded"
+                    self._warm.set()
+                if time.monotonic() + self.retry_interval > deadline:
+                    self.state = "degraded"
+                    logger.warning("pipeline warm-up gave up: %s", error)
+                    return False
+                await asyncio.sleep(self.retry_interval)
+            self.state = "warm"
+            return True
+        finally:
+            # Waiters proceed either way; the transport's retries take over.
+            self._warm.set()
+
+    async def _run(self) -> None:
+        try:
+            await self.warm_up(self.timeout)
+        finally:
+            self.started_up = True
+
+        while True:
+            idle = time.monotonic() - self.last_call_at
+            if idle < self.idle_interval:
+                await asyncio.sleep(self.idle_interval - idle)
+                continue
+
+            if await self.ping() is not None:
+                logger.info("pipeline went cold, warming it up")
+                await self.warm_up(self.timeout)
@@ -1,7 +1,15 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from typing import Literal, Optional
 
 class AdminModel:
     class NewUser(BaseModel):
         email: str
         password: str
-        username: str
\ No newline at end of file
+        username: str
+
+    class UserQuery(BaseModel):
+        page: int = Field(default=1, ge=1)
+        per_page: int = Field(default=50, ge=1, le=500)
+        search: Optional[str] = None
+        sort: Literal["email", "username", "created_at", "last_sign_in_at", "updated_at"] = "created_at"
+        order: Literal["asc", "desc"] = "desc"
@@ -1,5 +1,21 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from typing import Literal
+from core.config import ANALYZE_BATCH_MAX_ITEMS, ANALYZE_CHUNK_CHARS
 
 class AnalyzeModel:
     class Text(BaseModel):
-        text: str
\ No newline at end of file
+        text: str
+
+    class Document(Text):
+        # "single" sends the whole text as one input; "chunked" splits it
+        # first; "auto" only chunks texts longer than `chunk_size`.
+        mode: Literal["single", "chunked", "auto"] = "single"
+        chunk_size: int = Field(default=ANALYZE_CHUNK_CHARS, ge=200, le=20000)
+        split: Literal["sentence", "paragraph"] = "sentence"
+        aggregate: Literal["mean", "max", "weighted"] = "mean"
+
+        def is_chunked(self) -> bool:
+            return self.mode == "chunked" or (self.mode == "auto" and len(self.text) > self.chunk_size)
+
+    class Batch(BaseModel):
+        items: list["AnalyzeModel.Text"] = Field(min_length=1, max_length=ANALYZE_BATCH_MAX_ITEMS)
@@ -1,4 +1,6 @@
 from .auth_router import router as auth_router
 from .profile_router import router as profile_router
 from .analyze_router import router as analyze_router
-from .admin_router import router as admin_router
\ No newline at end of file
+from .admin_router import router as admin_router
+from .metrics_router import router as metrics_router
+from .health_router import router as health_router
\ No newline at end of file
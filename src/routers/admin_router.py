@@ -1,12 +1,15 @@
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Request, Response, Query
+from typing import Annotated, Optional
 from db.dependencies import GetDBAdmin, GetUID
 from core.limiter import limiter
+from core.profiling import ProfiledRoute
 from services.admin_services import AdminServices
 from models.admin_models import AdminModel
-from utils.logs import create_log # type: ignore
+from utils.logs import create_log, log_sink # type: ignore
 
 router = APIRouter(
-    prefix="/admin"
+    prefix="/admin",
+    route_class=ProfiledRoute,
 )
 
 @router.post("/create_user")
@@ -51,16 +54,17 @@ def read_user(request: Request, db: GetDBAdmin, user_id: str, uid: GetUID):
 
 @router.get("/read_users")
 @limiter.limit("1/second") # type: ignore
-def read_users(request: Request, db: GetDBAdmin, uid: GetUID):
+def read_users(request: Request, response: Response, db: GetDBAdmin, uid: GetUID, query: Annotated[AdminModel.UserQuery, Query()]):
     try:
-        response = AdminServices.read_users(db)
+        users, total = AdminServices.read_users(db, **query.model_dump())
+        response.headers["X-Total-Count"] = str(total)
         create_log(
             type='LOG',
             description='admin: read users',
             user_id=uid,
             endpoint="/admin/read_users",
         )
-        return response
+        return users
     
     except Exception as e:
         create_log(
@@ -74,16 +78,17 @@ def read_users(request: Request, db: GetDBAdmin, uid: GetUID):
 
 @router.get("/read_admins")
 @limiter.limit("1/second") # type: ignore
-def read_admins(request: Request, db: GetDBAdmin, uid: GetUID):
+def read_admins(request: Request, response: Response, db: GetDBAdmin, uid: GetUID, query: Annotated[AdminModel.UserQuery, Query()]):
     try:
-        response = AdminServices.read_admins(db)
+        admins, total = AdminServices.read_admins(db, **query.model_dump())
+        response.headers["X-Total-Count"] = str(total)
         create_log(
             type='LOG',
             description='admin: read admins',
             user_id=uid,
             endpoint="/admin/read_admins",
         )
-        return response
+        return admins
     
     except Exception as e:
         create_log(
@@ -147,18 +152,175 @@ def delete_user(request: Request, db: GetDBAdmin, user_id: str, uid: GetUID):
         )
         raise ValueError(f"Error deleting user: {str(e)}")
 
-from services.admin.backup_and_restore import Backup
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from services.admin.backup_and_restore import Backup, Restore
+from services.job_services import JobServices, JobLimitError
 
-@router.post("/create_backup")
+@router.post("/create_backup", status_code=202)
 @limiter.limit("5/second") # type: ignore
-def create_backup(request: Request, db: GetDBAdmin):
+async def create_backup(request: Request, db: GetDBAdmin, uid: GetUID, full: bool = False):
+    # Runs as a job; its result is the manifest, downloaded from
+    # /admin/download_backup/{id} once the job has succeeded.
     try:
-        Backup.create(db)
+        job = await JobServices.submit(db, uid, {"full": full}, kind="backup")
+        return {**job, "status_url": f'/analyze/jobs/{job["id"]}'}
+
+    except JobLimitError as e:
+        raise HTTPException(status_code=429, detail=str(e))
 
     except Exception as e:
         raise ValueError(f"Error creating backup: {str(e)}")
 
+@router.get("/download_backup/{backup_id}")
+@limiter.limit("5/second") # type: ignore
+def download_backup(request: Request, db: GetDBAdmin, backup_id: str):
+    try:
+        backup = Backup.get(backup_id)
+
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    return StreamingResponse(
+        Backup.stream_archive(backup),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="backup-{backup["id"]}.zip"'},
+    )
+
+@router.get("/read_backups")
+@limiter.limit("5/second") # type: ignore
+def read_backups(request: Request, db: GetDBAdmin):
+    return Backup.list_all()
+
+@router.get("/read_restore_plan")
+@limiter.limit("5/second") # type: ignore
+def read_restore_plan(request: Request, db: GetDBAdmin, backup_id: Optional[str] = None):
+    try:
+        return Backup.plan(backup_id)
+
+    except Exception as e:
+        raise ValueError(f"Error reading restore plan: {str(e)}")
+
 @router.post("/restore_from_backup")
 @limiter.limit("5/second") # type: ignore
-def restore_from_backup(request: Request, db: GetDBAdmin):
-    ...
\ No newline at end of file
+async def restore_from_backup(
+    request: Request,
+    response: Response,
+    db: GetDBAdmin,
+    uid: GetUID,
+    backup_id: Optional[str] = None,
+    dry_run: bool = False,
+    resume: bool = True,
+):
+    # A dry run reports inline; a restore runs as a job, whose report is
+    # read from the returned status_url.
+    try:
+        if dry_run:
+            return await run_in_threadpool(Restore.run, db, backup_id, dry_run=True, resume=resume)
+
+        # Pin the target now, so the job restores the backup that was
+        # latest when it was asked for.
+        chain = await run_in_threadpool(Backup.plan, backup_id)
+        job = await JobServices.submit(db, uid, {"backup_id": chain[-1]["id"], "resume": resume}, kind="restore")
+        create_log(
+            type='LOG',
+            description=f'admin: queued restore from backup, id={chain[-1]["id"]}',
+            user_id=uid,
+            endpoint="/admin/restore_from_backup",
+            data={"job_id": job["id"]},
+        )
+        response.status_code = 202
+        return {**job, "status_url": f'/analyze/jobs/{job["id"]}'}
+
+    except JobLimitError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+    except Exception as e:
+        create_log(
+            type='ERROR',
+            description='admin: failed to restore from backup',
+            user_id=uid,
+            endpoint="/admin/restore_from_backup",
+            error=str(e)
+        )
+        raise ValueError(f"Error restoring from backup: {str(e)}")
+
+from datetime import datetime
+
+@router.post("/rescore_history", status_code=202)
+@limiter.limit("5/second") # type: ignore
+async def rescore_history(
+    request: Request,
+    db: GetDBAdmin,
+    uid: GetUID,
+    user_id: Optional[str] = None,
+    before: Optional[datetime] = None,
+    dry_run: bool = False,
+):
+    try:
+        job = await JobServices.submit(
+            db,
+            uid,
+            {"user_id": user_id, "before": before.isoformat() if before else None, "dry_run": dry_run},
+            kind="rescore",
+        )
+        create_log(
+            type='LOG',
+            description=f'admin: queued history re-scoring, user_id={user_id}, dry_run={dry_run}',
+            user_id=uid,
+            endpoint="/admin/rescore_history",
+            data={"job_id": job["id"]},
+        )
+        return {**job, "status_url": f'/analyze/jobs/{job["id"]}'}
+
+    except JobLimitError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+    except Exception as e:
+        raise ValueError(f"Error queueing history re-scoring: {str(e)}")
+
+from utils.cache import result_cache
+from utils.singleflight import coalescer
+from external.pipeline import breaker, warmup
+from external.scheduler import scheduler
+
+@router.get("/read_cache_stats")
+@limiter.limit("5/second") # type: ignore
+def read_cache_stats(request: Request, db: GetDBAdmin):
+    return result_cache.stats()
+
+@router.get("/read_coalescing_stats")
+@limiter.limit("5/second") # type: ignore
+def read_coalescing_stats(request: Request, db: GetDBAdmin):
+    return coalescer.stats()
+
+@router.get("/read_pipeline_stats")
+@limiter.limit("5/second") # type: ignore
+def read_pipeline_stats(request: Request, db: GetDBAdmin):
+    return {"breaker": breaker.state, **warmup.stats()}
+
+@router.get("/read_scheduler_stats")
+@limiter.limit("5/second") # type: ignore
+def read_scheduler_stats(request: Request, db: GetDBAdmin):
+    return scheduler.stats()
+
+@router.get("/read_log_stats")
+@limiter.limit("5/second") # type: ignore
+def read_log_stats(request: Request, db: GetDBAdmin):
+    return log_sink.stats()
+
+from fastapi.responses import FileResponse
+from core.profiling import profile_store
+
+@router.get("/read_profiles")
+@limiter.limit("5/second") # type: ignore
+def read_profiles(request: Request, db: GetDBAdmin):
+    return profile_store.list_all()
+
+@router.get("/read_profile/{name}")
+@limiter.limit("5/second") # type: ignore
+def read_profile(request: Request, db: GetDBAdmin, name: str):
+    path = profile_store.path(name)
+    media_type = "text/html" if name.endswith(".html") else "application/json"
+    return FileResponse(path, media_type=media_type, filename=name)
@@ -1,23 +1,46 @@
 # routes/analyze_routes.py
-from fastapi import APIRouter, Request, HTTPException
+from fastapi import APIRouter, Request, Response, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import Any, AsyncIterator, Literal, Optional
+from core.config import HISTORY_PAGE_SIZE, HISTORY_PAGE_MAX, ANALYZE_BATCH_MAX_ITEMS
 from core.limiter import limiter
 from services.analyze_services import AnalyzeServices
+from services.job_services import JobServices, JobLimitError
+from external.pipeline import PipelineError, CircuitOpenError, labels
+from external.scheduler import QueueFullError, DeadlineExceededError
 from models import AnalyzeModel
-from db.dependencies import GetUID, GetDB
+from db.dependencies import GetUID, GetAsyncDB
 from utils.logs import create_log  # type: ignore
+from utils.sse import sse_event, SSE_HEADERS
+from utils.history import page_etag
 
 router = APIRouter(prefix="/analyze")
 
+def _batch_cost(payload: AnalyzeModel.Batch, **_: Any) -> int:
+    # Batches are limited per text, so one large batch costs what its
+    # texts would cost sent one by one.
+    return len(payload.items)
+
 @router.post("")
 @limiter.limit("1/second")  # type: ignore
-def analyze_text(  # type: ignore
+async def analyze_text(  # type: ignore
     request: Request,
-    payload: AnalyzeModel.Text,
-    db: GetDB,
+    payload: AnalyzeModel.Document,
+    db: GetAsyncDB,
     uid: GetUID,
 ):
     try:
-        response = AnalyzeServices.analyze_text(db, payload.text, uid)  # type: ignore
+        if not payload.is_chunked():
+            response = await AnalyzeServices.analyze_text(db, payload.text, uid)  # type: ignore
+        else:
+            response = await AnalyzeServices.analyze_document(  # type: ignore
+                db,
+                payload.text,
+                uid,  # type: ignore
+                chunk_size=payload.chunk_size,
+                split=payload.split,
+                aggregate=payload.aggregate,
+            )
         create_log(
             type="LOG",
             description="user: analyze document",
@@ -26,19 +49,186 @@ def analyze_text(  # type: ignore
             data={"payload": dict(payload), "results": response},
         )
         return response  # type: ignore
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except (QueueFullError, DeadlineExceededError) as e:
+        raise HTTPException(status_code=e.status, detail=str(e))  # type: ignore
+    except PipelineError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/batch")
+@limiter.limit("50/second", cost=_batch_cost, burst=ANALYZE_BATCH_MAX_ITEMS)  # type: ignore
+async def analyze_batch(  # type: ignore
+    request: Request,
+    payload: AnalyzeModel.Batch,
+    db: GetAsyncDB,
+    uid: GetUID,
+):
+    try:
+        texts = [item.text for item in payload.items]
+        response = await AnalyzeServices.analyze_batch(db, texts, uid)  # type: ignore
+        failed = sum(1 for item in response if "error" in item)
+        create_log(
+            type="LOG",
+            description="user: analyze batch",
+            user_id=uid,
+            endpoint="/analyze/batch",
+            data={"items": len(texts), "failed": failed},
+        )
+        return response
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def _stream(events: AsyncIterator[tuple[str, Any]], uid: str, endpoint: str, description: str) -> AsyncIterator[str]:
+    try:
+        async for event, data in events:
+            yield sse_event(event, data)
+            if event in ("result", "done"):
+                create_log(
+                    type="LOG",
+                    description=description,
+                    user_id=uid,
+                    endpoint=endpoint,
+                )
+    except Exception as e:
+        create_log(
+            type="ERROR",
+            description=f"{description} failed",
+            user_id=uid,
+            endpoint=endpoint,
+            error=str(e),
+        )
+        yield sse_event("error", {"detail": str(e)})
+
+
+@router.post("/stream")
+@limiter.limit("1/second")  # type: ignore
+async def analyze_text_stream(  # type: ignore
+    request: Request,
+    payload: AnalyzeModel.Document,
+    db: GetAsyncDB,
+    uid: GetUID,
+):
+    events = AnalyzeServices.stream_document(
+        db,
+        payload.text,
+        uid,  # type: ignore
+        chunked=payload.is_chunked(),
+        chunk_size=payload.chunk_size,
+        split=payload.split,
+        aggregate=payload.aggregate,
+    )
+    return StreamingResponse(
+        _stream(events, uid, "/analyze/stream", "user: analyze document (stream)"),  # type: ignore
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+
+@router.post("/batch/stream")
+@limiter.limit("50/second", cost=_batch_cost, burst=ANALYZE_BATCH_MAX_ITEMS)  # type: ignore
+async def analyze_batch_stream(  # type: ignore
+    request: Request,
+    payload: AnalyzeModel.Batch,
+    db: GetAsyncDB,
+    uid: GetUID,
+):
+    texts = [item.text for item in payload.items]
+    events = AnalyzeServices.stream_batch(db, texts, uid)  # type: ignore
+    return StreamingResponse(
+        _stream(events, uid, "/analyze/batch/stream", "user: analyze batch (stream)"),  # type: ignore
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+
+@router.post("/jobs", status_code=202)
+@limiter.limit("1/second")  # type: ignore
+async def submit_job(  # type: ignore
+    request: Request,
+    payload: AnalyzeModel.Document,
+    db: GetAsyncDB,
+    uid: GetUID,
+):
+    try:
+        response = await JobServices.submit(db, uid, {  # type: ignore
+            "text": payload.text,
+            "chunked": payload.is_chunked(),
+            "chunk_size": payload.chunk_size,
+            "split": payload.split,
+            "aggregate": payload.aggregate,
+        })
+        create_log(
+            type="LOG",
+            description="user: submit analysis job",
+            user_id=uid,
+            endpoint="/analyze/jobs",
+            data={"job_id": response["id"]},
+        )
+        return response
+    except JobLimitError as e:
+        raise HTTPException(status_code=429, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/jobs")
+@limiter.limit("5/second")  # type: ignore
+async def list_jobs(
+    request: Request,
+    uid: GetUID,
+):
+    try:
+        return await JobServices.list_jobs(uid)  # type: ignore
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/jobs/{job_id}")
+@limiter.limit("5/second")  # type: ignore
+async def get_job(
+    request: Request,
+    job_id: str,
+    uid: GetUID,
+):
+    response = await JobServices.get_job(uid, job_id)  # type: ignore
+    if response is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return response
+
+
 @router.get("/history")
 @limiter.limit("5/second")  # type: ignore
-def get_history(
+async def get_history(
     request: Request,
-    db: GetDB,
+    response: Response,
+    db: GetAsyncDB,
     uid: GetUID,   # ✅ get logged-in user id from dependency
+    limit: int = Query(default=HISTORY_PAGE_SIZE, ge=1, le=HISTORY_PAGE_MAX),
+    cursor: Optional[str] = None,
+    fields: Literal["full", "summary"] = "full",
+    top_k: int = Query(default=3, ge=1, le=len(labels)),
 ):
     try:
-        response = AnalyzeServices.get_history(db, uid)
-        return response
+        rows, next_cursor = await AnalyzeServices.get_history(db, uid, limit, cursor, fields, top_k)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+    etag = page_etag(rows, next_cursor)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    return rows
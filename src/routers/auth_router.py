@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Request
-from db.dependencies import GetDB, GetUID
+from db.dependencies import GetAsyncAuthDB, GetUID
 from core.limiter import limiter
 from services.auth_services import AuthServices
 from models import AuthModel
@@ -11,9 +11,9 @@ router = APIRouter(
     
 @router.post("/signup")
 @limiter.limit("1/second") # type: ignore
-def signup(request: Request, creds: AuthModel.Signup, db: GetDB):
+async def signup(request: Request, creds: AuthModel.Signup, db: GetAsyncAuthDB):
     try:
-        response = AuthServices.Signup.with_password(
+        response = await AuthServices.Signup.with_password(
             db=db,
             username=creds.username,
             email=creds.email,
@@ -33,9 +33,9 @@ def signup(request: Request, creds: AuthModel.Signup, db: GetDB):
 
 @router.post("/login")
 @limiter.limit("1/second") # type: ignore
-def login(request: Request, creds: AuthModel.Login, db: GetDB):
+async def login(request: Request, creds: AuthModel.Login, db: GetAsyncAuthDB):
     try:
-        auth_response = AuthServices.Login.with_password(
+        auth_response = await AuthServices.Login.with_password(
             db=db,
             email=creds.email,
             password=creds.password
@@ -55,9 +55,9 @@ def login(request: Request, creds: AuthModel.Login, db: GetDB):
 
 @router.post("/logout")
 @limiter.limit("1/second") # type: ignore
-def logout(request: Request, db: GetDB, uid: GetUID):
+async def logout(request: Request, db: GetAsyncAuthDB, uid: GetUID):
     try:
-        response = AuthServices.Logout.logout(db)
+        response = await AuthServices.Logout.logout(db)
         create_log(
             type='LOG',
             description='user: logged out',
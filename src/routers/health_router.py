@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from core.readiness import readiness
+
+router = APIRouter()
+
+@router.get("/ready", include_in_schema=False)
+def read_ready():
+    ready, checks = readiness.report()
+    return JSONResponse({"ready": ready, "checks": checks}, status_code=200 if ready else 503)
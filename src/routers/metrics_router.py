@@ -0,0 +1,35 @@
+from fastapi import APIRouter, HTTPException, Request, Response
+import ipaddress
+from core.config import METRICS_ALLOW_NETWORKS
+from core.metrics import render
+from db.auth_context import get_auth
+
+router = APIRouter()
+
+networks = [
+    ipaddress.ip_network(network.strip(), strict=False)
+    for network in METRICS_ALLOW_NETWORKS.split(",")
+    if network.strip()
+]
+
+def _allowed(request: Request) -> bool:
+    if request.client:
+        try:
+            address = ipaddress.ip_address(request.client.host)
+            if any(address in network for network in networks):
+                return True
+        except ValueError:
+            pass
+
+    try:
+        return get_auth(request).role == "admin"
+    except HTTPException:
+        return False
+
+@router.get("/metrics", include_in_schema=False)
+def read_metrics(request: Request):
+    if not _allowed(request):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+
+    data, content_type = render()
+    return Response(content=data, media_type=content_type)
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Request
-from db.dependencies import GetDB
+from db.dependencies import GetAsyncDB
 from services.profile_services import ProfileServices
 from core.limiter import limiter
 
@@ -9,9 +9,9 @@ router = APIRouter(
 
 @router.get("/")
 @limiter.limit("5/second") # type: ignore
-def get_profile(request: Request, db: GetDB):
+async def get_profile(request: Request, db: GetAsyncDB):
     try:
-        response = ProfileServices.get_profile_data(db)
+        response = await ProfileServices.get_profile_data(db)
         return response
         
     except Exception as e:
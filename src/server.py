@@ -1,9 +1,10 @@
 # This is the main entry point of the FastAPI server.
 from fastapi import FastAPI
+from core.lifespan import lifespan
 from core.middleware import Middleware
 from core.routers import Routers
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Register middlewares
 Middleware.register(app)
@@ -1,27 +1,638 @@
+""" Backup and restore
+Streams the `profiles`, `history` and `logs` tables out to compressed
+files, one page at a time, so memory use does not depend on table size.
+
+Each table is read with keyset range queries (BACKUP_PAGE_SIZE rows per
+request) and every page is appended to its file as soon as it arrives.
+Tables are exported concurrently. A backup is a directory under BACKUP_DIR
+holding one file per table plus a `manifest.json`:
+
+    BACKUP_DIR/<backup id>/<schema>.<table>.<format>
+    BACKUP_DIR/<backup id>/manifest.json
+
+BACKUP_FORMAT is one of:
+    csv.gz   gzip-compressed CSV (default, no extra dependencies)
+    csv.zst  zstd-compressed CSV (needs `zstandard`)
+    parquet  Parquet, one row group per page (needs `pyarrow`)
+
+JSON columns (e.g. history.results, logs.details) are written as JSON text.
+
+Backups are incremental. `history` and `logs` are append-only, so they are
+read in (created_at, id) order and the manifest records the last row
+exported as the table's watermark; the next backup only exports rows past
+it. `profiles` is small and mutable and is always exported in full. Every
+BACKUP_FULL_EVERY backups (or on request) a full snapshot starts a new
+chain, and `Backup.plan` lists the full backup plus the incrementals a
+restore has to replay, in order.
+
+`Restore.run` replays such a chain with batched, parallel upserts and
+keeps a checkpoint next to the target backup's manifest, so a restore that
+is interrupted resumes instead of starting over.
+
+Rows newer than BACKUP_WATERMARK_LAG seconds are left for the next run,
+since audit logs are written in batches and may commit slightly after
+their `created_at`.
+"""
 from supabase import Client
-import pandas as pd
-from datetime import datetime
+from postgrest.types import ReturnMethod
+from concurrent.futures import ThreadPoolExecutor, Future, FIRST_COMPLETED, wait
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
+from typing import Any, Iterator, Optional
+import csv
+import gzip
+import io
+import json
+import os
+import time
+import zipfile
+from threading import Lock
+from core.config import (
+    BACKUP_DIR,
+    BACKUP_FORMAT,
+    BACKUP_PAGE_SIZE,
+    BACKUP_CONCURRENCY,
+    BACKUP_FULL_EVERY,
+    BACKUP_WATERMARK_LAG,
+    BACKUP_RESTORE_BATCH,
+    BACKUP_RESTORE_WORKERS,
+)
 
-tables = [
-    {"schema": "public", "table": "profiles"},
-    {"schema": "public", "table": "history"},
-    {"schema": "public", "table": "logs"},
+tables: list[dict[str, Any]] = [
+    {"schema": "public", "table": "profiles", "append_only": False},
+    {"schema": "public", "table": "history", "append_only": True},
+    {"schema": "public", "table": "logs", "append_only": True},
 ]
 
+MANIFEST = "manifest.json"
+CHECKPOINT = "restore-checkpoint.json"
+
+# One backup at a time: concurrent runs would read the same watermarks.
+_create_lock = Lock()
+
+FORMATS = ("csv.gz", "csv.zst", "parquet")
+
+def _encode(rows: list[dict[str, Any]], json_columns: set[str]) -> list[dict[str, Any]]:
+    """ Serializes JSON values to text, noting which columns held them. """
+    encoded: list[dict[str, Any]] = []
+    for row in rows:
+        row = dict(row)
+        for key, value in row.items():
+            if isinstance(value, (dict, list)):
+                json_columns.add(key)
+                row[key] = json.dumps(value, separators=(",", ":"))
+        encoded.append(row)
+    return encoded
+
+class _CsvWriter:
+    def __init__(self, path: Path, compression: str):
+        if compression == "gz":
+            self._file: Any = gzip.open(path, "wt", encoding="utf-8", newline="")
+        else:
+            try:
+                import zstandard
+            except ImportError:
+                raise RuntimeError("BACKUP_FORMAT=csv.zst requires the zstandard package")
+            raw = zstandard.ZstdCompressor().stream_writer(open(path, "wb"))
+            self._file = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+        self._writer: Optional[csv.DictWriter[str]] = None
+        self.json_columns: set[str] = set()
+
+    def write(self, rows: list[dict[str, Any]]) -> None:
+        if self._writer is None:
+            self._writer = csv.DictWriter(self._file, fieldnames=list(rows[0]), extrasaction="ignore")
+            self._writer.writeheader()
+        self._writer.writerows(_encode(rows, self.json_columns))
+
+    def close(self) -> None:
+        self._file.close()
+
+class _ParquetWriter:
+    def __init__(self, path: Path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("BACKUP_FORMAT=parquet requires the pyarrow package")
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self._path = path
+        self._writer: Any = None
+        self.json_columns: set[str] = set()
+
+    def write(self, rows: list[dict[str, Any]]) -> None:
+        pa = self._pa
+        table = pa.Table.from_pylist(_encode(rows, self.json_columns))
+        if self._writer is None:
+            # Columns that are all-null on the first page have no type yet; store them as text.
+            schema = pa.schema([
+                field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+                for field in table.schema
+            ])
+            self._writer = self._pq.ParquetWriter(self._path, schema)
+        self._writer.write_table(table.select(self._writer.schema.names).cast(self._writer.schema))
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        else:
+            self._path.touch()
+
+def _open_writer(path: Path, format: str) -> _CsvWriter | _ParquetWriter:
+    if format == "parquet":
+        return _ParquetWriter(path)
+    return _CsvWriter(path, format.split(".")[1])
+
+def _read_csv(path: Path, compression: str, batch_size: int) -> Iterator[list[dict[str, Any]]]:
+    if compression == "gz":
+        file: Any = gzip.open(path, "rt", encoding="utf-8", newline="")
+    else:
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("Restoring csv.zst backups requires the zstandard package")
+        raw = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+        file = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+
+    with file:
+        batch: list[dict[str, Any]] = []
+        for row in csv.DictReader(file):
+            # CSV has no NULL: the exporter wrote None as an empty field.
+            batch.append({key: value if value != "" else None for key, value in row.items()})
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+def _read_parquet(path: Path, batch_size: int) -> Iterator[list[dict[str, Any]]]:
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Restoring parquet backups requires the pyarrow package")
+
+    # Tables with no rows are written as empty files.
+    if path.stat().st_size == 0:
+        return
+
+    source = pyarrow.parquet.ParquetFile(path)
+    try:
+        for batch in source.iter_batches(batch_size=batch_size):
+            yield batch.to_pylist()
+    finally:
+        source.close()
+
+def _open_reader(path: Path, format: str, batch_size: int) -> Iterator[list[dict[str, Any]]]:
+    if format == "parquet":
+        return _read_parquet(path, batch_size)
+    return _read_csv(path, format.split(".")[1], batch_size)
+
+def _table_name(table: dict[str, Any]) -> str:
+    return f'{table["schema"]}.{table["table"]}'
+
+def _write_json(path: Path, data: Any) -> None:
+    partial = path.with_name(path.name + ".part")
+    with open(partial, "w", encoding="utf-8") as file:
+        json.dump(data, file, indent=2)
+    os.replace(partial, path)
+
 class Backup:
     @staticmethod
-    def create(db: Client):
-        for table in tables:
-            response = db.table(table["table"]).select("*").execute()
-            
+    def create(db: Client, format: str = BACKUP_FORMAT, full: bool = False) -> dict[str, Any]:
+        """ Exports every table and returns the new backup's manifest.
+
+        The backup is incremental on top of the latest one unless `full` is
+        set, there is no usable previous backup, or the current chain has
+        reached BACKUP_FULL_EVERY backups.
+        """
+        if format not in FORMATS:
+            raise ValueError(f"Unknown backup format: {format}")
+
+        with _create_lock:
+            previous = Backup.latest()
+            if previous is not None and (
+                full
+                or previous["format"] != format
+                or previous["chain_length"] >= BACKUP_FULL_EVERY
+            ):
+                previous = None
+
+            now = datetime.now(timezone.utc)
+            # To the microsecond: a scheduled and a manual backup may start
+            # in the same second. Ids still sort in creation order.
+            backup_id = now.strftime("%Y%m%dT%H%M%S%fZ")
+            directory = Path(BACKUP_DIR) / backup_id
+            directory.mkdir(parents=True, exist_ok=False)
+
+            cutoff = (now - timedelta(seconds=BACKUP_WATERMARK_LAG)).isoformat()
+
+            def export(table: dict[str, Any]) -> dict[str, Any]:
+                after = None
+                if previous is not None and table["append_only"]:
+                    after = previous["files"].get(_table_name(table), {}).get("watermark")
+                return Backup.export_table(db, table, directory, format, after, cutoff)
+
+            with ThreadPoolExecutor(max_workers=BACKUP_CONCURRENCY, thread_name_prefix="backup") as executor:
+                files = list(executor.map(export, tables))
+
+            manifest = {
+                "id": backup_id,
+                "kind": "full" if previous is None else "incremental",
+                "format": format,
+                "created_at": now.isoformat(),
+                "cutoff": cutoff,
+                "parent": None if previous is None else previous["id"],
+                "base": backup_id if previous is None else previous["base"],
+                "chain_length": 1 if previous is None else previous["chain_length"] + 1,
+                "files": {file["table"]: file for file in files},
+            }
+
+            # Written last: a directory without a manifest is an unfinished backup.
+            _write_json(directory / MANIFEST, manifest)
+            return manifest
+
+    @staticmethod
+    def export_table(
+        db: Client,
+        table: dict[str, Any],
+        directory: Path,
+        format: str,
+        after: Optional[list[Any]] = None,
+        until: Optional[str] = None,
+    ) -> dict[str, Any]:
+        name = _table_name(table)
+        path = directory / f"{name}.{format}"
+        partial = path.with_name(path.name + ".part")
+
+        rows = 0
+        last: Optional[dict[str, Any]] = None
+        writer = _open_writer(partial, format)
+        try:
+            for page in Backup.read_pages(db, table, after, until):
+                writer.write(page)
+                rows += len(page)
+                last = page[-1]
+        finally:
+            writer.close()
+
+        os.replace(partial, path)
+
+        file: dict[str, Any] = {
+            "table": name,
+            "file": path.name,
+            "mode": "full" if after is None or not table["append_only"] else "incremental",
+            "rows": rows,
+            "bytes": path.stat().st_size,
+            "json_columns": sorted(writer.json_columns),
+        }
+        if table["append_only"]:
+            # An empty delta keeps the previous watermark.
+            file["watermark"] = [last["created_at"], last["id"]] if last is not None else after
+        return file
+
+    @staticmethod
+    def read_pages(
+        db: Client,
+        table: dict[str, Any],
+        after: Optional[list[Any]] = None,
+        until: Optional[str] = None,
+    ) -> Iterator[list[dict[str, Any]]]:
+        """ Yields the table's rows BACKUP_PAGE_SIZE at a time.
+
+        Append-only tables are read in (created_at, id) order, starting past
+        the `after` watermark and stopping at `until`; others in `id` order.
+        """
+        append_only = table["append_only"]
+        while True:
+            query = db.schema(table["schema"]).table(table["table"]).select("*")
+            if append_only:
+                if until is not None:
+                    query = query.lte("created_at", until)
+                if after is not None:
+                    created_at, id = after
+                    query = query.or_(
+                        f'created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt.{id})'
+                    )
+                query = query.order("created_at").order("id")
+            else:
+                if after is not None:
+                    query = query.gt("id", after)
+                query = query.order("id")
+
+            response = query.limit(BACKUP_PAGE_SIZE).execute()
             if not response:
-                raise RuntimeError(f"Error getting data from {table["schema"]}.{table['table']}")
+                raise RuntimeError(f"Error getting data from {_table_name(table)}")
+
+            page: list[dict[str, Any]] = response.data  # type: ignore
+            if not page:
+                return
+
+            yield page
+            if len(page) < BACKUP_PAGE_SIZE:
+                return
+
+            last = page[-1]
+            after = [last["created_at"], last["id"]] if append_only else last["id"]
+
+    @staticmethod
+    def list_all() -> list[dict[str, Any]]:
+        """ Manifests of every finished backup, oldest first. """
+        root = Path(BACKUP_DIR)
+        if not root.is_dir():
+            return []
+
+        manifests: list[dict[str, Any]] = []
+        for path in sorted(root.glob(f"*/{MANIFEST}")):
+            with open(path, encoding="utf-8") as file:
+                manifests.append(json.load(file))
+        return manifests
+
+    @staticmethod
+    def get(backup_id: str) -> dict[str, Any]:
+        path = Path(BACKUP_DIR) / backup_id / MANIFEST
+        if "/" in backup_id or "\\" in backup_id or backup_id.startswith(".") or not path.is_file():
+            raise ValueError(f"Backup not found: {backup_id}")
+
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+
+    @staticmethod
+    def latest() -> Optional[dict[str, Any]]:
+        backups = Backup.list_all()
+        return backups[-1] if backups else None
+
+    @staticmethod
+    def plan(backup_id: Optional[str] = None) -> list[dict[str, Any]]:
+        """ The backups to restore, in order, to get back to `backup_id`
+        (default: the latest): its full base, then each incremental. """
+        manifest = Backup.get(backup_id) if backup_id else Backup.latest()
+        if manifest is None:
+            raise ValueError("No backups available")
+
+        chain = [manifest]
+        while chain[-1]["parent"] is not None:
+            chain.append(Backup.get(chain[-1]["parent"]))
+
+        chain.reverse()
+        return chain
+
+    @staticmethod
+    def stream_archive(backup: dict[str, Any], chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+        """ Yields a zip of the backup's files without buffering whole files.
+
+        The files are already compressed, so they are stored as-is.
+        """
+        sink = _ChunkSink()
+        directory = Path(BACKUP_DIR) / backup["id"]
+        names = [file["file"] for file in backup["files"].values()] + [MANIFEST]
+        with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as archive:  # type: ignore
+            for name in names:
+                with open(directory / name, "rb") as source, \
+                        archive.open(f'{backup["id"]}/{name}', "w", force_zip64=True) as target:
+                    while data := source.read(chunk_size):
+                        target.write(data)
+                        yield sink.drain()
+                yield sink.drain()
+        yield sink.drain()
+
+class _Checkpoint:
+    """ Rows already restored per backup file, saved after every batch so an
+    interrupted restore can pick up where it stopped. """
+
+    def __init__(self, path: Path, resume: bool, enabled: bool):
+        self.path = path
+        self.enabled = enabled
+        self.positions: dict[str, Any] = {}
+        self._lock = Lock()
+
+        if resume and path.is_file():
+            with open(path, encoding="utf-8") as file:
+                self.positions = json.load(file)
+
+    def position(self, key: str) -> Any:
+        return self.positions.get(key, 0)
+
+    def save(self, key: str, position: Any) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self.positions[key] = position
+            _write_json(self.path, self.positions)
+
+    def clear(self) -> None:
+        if self.enabled:
+            self.path.unlink(missing_ok=True)
+
+def _validate(
+    rows: list[dict[str, Any]],
+    table: dict[str, Any],
+    json_columns: list[str],
+) -> tuple[list[dict[str, Any]], list[str]]:
+    valid: list[dict[str, Any]] = []
+    errors: list[str] = []
+    for row in rows:
+        if row.get("id") is None:
+            errors.append("missing id")
+            continue
+        if table["append_only"] and row.get("created_at") is None:
+            errors.append(f'id={row["id"]}: missing created_at')
+            continue
+
+        try:
+            for column in json_columns:
+                if isinstance(row.get(column), str):
+                    row[column] = json.loads(row[column])
+        except ValueError:
+            errors.append(f'id={row["id"]}: invalid JSON in {column}')
+            continue
+
+        valid.append(row)
+    return valid, errors
+
+class Restore:
+    @staticmethod
+    def run(
+        db: Client,
+        backup_id: Optional[str] = None,
+        dry_run: bool = False,
+        resume: bool = True,
+    ) -> dict[str, Any]:
+        """ Restores the chain of backups ending at `backup_id` (default:
+        the latest) and returns a report per table.
+
+        Rows are upserted on `id` in BACKUP_RESTORE_BATCH batches by
+        BACKUP_RESTORE_WORKERS workers per table. `profiles` is loaded first
+        (from the target backup, which holds all of it) since history and
+        logs reference it; those two then load concurrently, replaying every
+        backup in the chain in order. With `dry_run`, nothing is written and
+        the report counts the rows that would overwrite existing ones.
+        """
+        chain = Backup.plan(backup_id)
+        target = chain[-1]
+        checkpoint = _Checkpoint(Path(BACKUP_DIR) / target["id"] / CHECKPOINT, resume, not dry_run)
+        started = time.monotonic()
+
+        def restore(table: dict[str, Any]) -> dict[str, Any]:
+            name = _table_name(table)
+            backups = chain if table["append_only"] else [target]
+            report: dict[str, Any] = {
+                "table": name, "files": 0, "rows": 0, "restored": 0, "skipped": 0,
+                "invalid": 0, "conflicts": 0, "failed": 0, "errors": [],
+            }
+            for backup in backups:
+                if name in backup["files"]:
+                    Restore.restore_file(db, table, backup, checkpoint, dry_run, report)
+            return report
+
+        reports: dict[str, Any] = {}
+        stages = [
+            [table for table in tables if not table["append_only"]],
+            [table for table in tables if table["append_only"]],
+        ]
+        with ThreadPoolExecutor(max_workers=len(tables), thread_name_prefix="restore") as executor:
+            for stage in stages:
+                for report in executor.map(restore, stage):
+                    reports[report["table"]] = report
+
+                # Don't load rows whose parents failed to load.
+                if any(report["failed"] for report in reports.values()):
+                    break
+
+        complete = (
+            not dry_run
+            and len(reports) == len(tables)
+            and not any(report["failed"] for report in reports.values())
+        )
+        if complete:
+            checkpoint.clear()
+
+        return {
+            "backup_id": target["id"],
+            "chain": [backup["id"] for backup in chain],
+            "dry_run": dry_run,
+            "complete": complete,
+            "seconds": round(time.monotonic() - started, 3),
+            "tables": reports,
+        }
+
+    @staticmethod
+    def restore_file(
+        db: Client,
+        table: dict[str, Any],
+        backup: dict[str, Any],
+        checkpoint: _Checkpoint,
+        dry_run: bool,
+        report: dict[str, Any],
+    ) -> None:
+        file = backup["files"][_table_name(table)]
+        key = f'{backup["id"]}/{file["table"]}'
+        done = checkpoint.position(key)
+        report["files"] += 1
+        if done is True:
+            report["skipped"] += file["rows"]
+            return
+
+        path = Path(BACKUP_DIR) / backup["id"] / file["file"]
+        json_columns = file.get("json_columns", [])
+
+        # Batches finish out of order; the checkpoint only moves past a
+        # batch once every batch before it has been written.
+        ends: list[int] = []
+        finished: set[int] = set()
+        failed = False
+        saved = done
+
+        def load(rows: list[dict[str, Any]]) -> int:
+            if dry_run:
+                return Restore.count_existing(db, table, [row["id"] for row in rows])
+            (
+                db.schema(table["schema"]).table(table["table"])
+                .upsert(rows, on_conflict="id", returning=ReturnMethod.minimal)
+                .execute()
+            )
+            return 0
+
+        def collect(futures: dict[Future[int], tuple[int, int]], block: bool) -> None:
+            nonlocal saved, failed
+            while futures and (block or len(futures) >= BACKUP_RESTORE_WORKERS * 2):
+                completed, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    index, count = futures.pop(future)
+                    try:
+                        report["conflicts"] += future.result()
+                        report["restored"] += count
+                        finished.add(index)
+                    except Exception as e:
+                        failed = True
+                        report["failed"] += count
+                        if len(report["errors"]) < 10:
+                            report["errors"].append(f"{key} batch {index}: {e}")
+
+                position = saved
+                for index, end in enumerate(ends):
+                    if index not in finished:
+                        break
+                    position = end
+                if position != saved:
+                    saved = position
+                    checkpoint.save(key, position)
+
+        offset = 0
+        futures: dict[Future[int], tuple[int, int]] = {}
+        with ThreadPoolExecutor(max_workers=BACKUP_RESTORE_WORKERS, thread_name_prefix="restore-batch") as executor:
+            for batch in _open_reader(path, backup["format"], BACKUP_RESTORE_BATCH):
+                offset += len(batch)
+                report["rows"] += len(batch)
+                index = len(ends)
+                ends.append(offset)
+                if offset <= done:
+                    report["skipped"] += len(batch)
+                    finished.add(index)
+                    continue
+
+                rows, errors = _validate(batch, table, json_columns)
+                report["invalid"] += len(errors)
+                report["errors"].extend(f"{key}: {error}" for error in errors[:max(0, 10 - len(report["errors"]))])
+                if not rows:
+                    finished.add(index)
+                    continue
+
+                futures[executor.submit(load, rows)] = (index, len(rows))
+                collect(futures, block=False)
+
+            collect(futures, block=True)
+
+        if not failed:
+            checkpoint.save(key, True)
+
+    @staticmethod
+    def count_existing(db: Client, table: dict[str, Any], ids: list[Any]) -> int:
+        # Ids travel in the query string, so look them up a few hundred at a time.
+        count = 0
+        for i in range(0, len(ids), 200):
+            response = (
+                db.schema(table["schema"]).table(table["table"])
+                .select("id")
+                .in_("id", ids[i:i + 200])
+                .execute()
+            )
+            count += len(response.data or [])
+        return count
+
+class _ChunkSink(io.RawIOBase):
+    """ Write-only, unseekable buffer that hands back what was written. """
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
 
-            df = pd.DataFrame(response.data)
+    def write(self, data: Any) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
 
-            date = datetime.now()
-            date = str(date.strftime("%Y;%m;%d-%H;%M;%S"))
-            save_path = Path(f'{date}-{table["schema"].upper()}{table['table']}.csv')
-            save_path.parent.mkdir(parents=True, exist_ok=True)
-            df.to_csv(save_path, index=False)
\ No newline at end of file
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
@@ -0,0 +1,85 @@
+""" History re-scoring
+Re-classifies stored `history` rows with the local engine
+(external/local_engine.py), so old analyses can be scored again, e.g.
+after its term weights change, without a single upstream call.
+
+Rows are read in `id` order, RESCORE_PAGE_SIZE at a time, each page is
+scored with one `classify_many` call and written back with one upsert.
+Whole-document analyses (results with "chunks") are skipped: their rows
+hold the aggregate, not a single classification.
+
+Runs as an admin job (POST /admin/rescore_history, services/job_services.py).
+"""
+from supabase import Client
+from postgrest.types import ReturnMethod
+from typing import Any, Optional
+import time
+from core.config import RESCORE_PAGE_SIZE
+from external.pipeline import local_engine
+
+class Rescore:
+    @staticmethod
+    def run(
+        db: Client,
+        user_id: Optional[str] = None,
+        before: Optional[str] = None,
+        dry_run: bool = False,
+    ) -> dict[str, Any]:
+        """ Re-scores the history of `user_id` (default: everyone) created
+        before `before` (default: all of it). With `dry_run`, nothing is
+        written and the report counts the rows whose top label would change.
+        """
+        started = time.monotonic()
+        report: dict[str, Any] = {"rows": 0, "rescored": 0, "changed": 0, "skipped": 0, "dry_run": dry_run}
+
+        for page in Rescore.read_pages(db, user_id, before):
+            report["rows"] += len(page)
+            rows = [row for row in page if Rescore.is_single(row.get("results"))]
+            report["skipped"] += len(page) - len(rows)
+            if not rows:
+                continue
+
+            results = local_engine().classify_many([row["raw_text"] or "" for row in rows])
+            for row, result in zip(rows, results):
+                if Rescore.top_label(row["results"]) != Rescore.top_label(result):
+                    report["changed"] += 1
+                row["results"] = result
+
+            if not dry_run:
+                (
+                    db.table("history")
+                    .upsert(rows, on_conflict="id", returning=ReturnMethod.minimal)
+                    .execute()
+                )
+            report["rescored"] += len(rows)
+
+        report["seconds"] = round(time.monotonic() - started, 3)
+        return report
+
+    @staticmethod
+    def read_pages(db: Client, user_id: Optional[str], before: Optional[str]):
+        last: Any = None
+        while True:
+            query = db.table("history").select("id,user_id,raw_text,results,created_at")
+            if user_id:
+                query = query.eq("user_id", user_id)
+            if before:
+                query = query.lt("created_at", before)
+            if last is not None:
+                query = query.gt("id", last)
+
+            page: list[dict[str, Any]] = query.order("id").limit(RESCORE_PAGE_SIZE).execute().data or []
+            if page:
+                yield page
+            if len(page) < RESCORE_PAGE_SIZE:
+                return
+            last = page[-1]["id"]
+
+    @staticmethod
+    def is_single(results: Any) -> bool:
+        return isinstance(results, dict) and "chunks" not in results and "aggregate" not in results
+
+    @staticmethod
+    def top_label(results: Any) -> Optional[str]:
+        labels = results.get("labels") if isinstance(results, dict) else None
+        return labels[0] if labels else None
@@ -0,0 +1,174 @@
+""" User directory
+Cached, role-indexed snapshot of every auth user for the admin routes.
+
+`list_users()` on the auth admin API only returns one page and cannot
+filter on `updated_at`, so the snapshot is built by walking every page.
+That walk runs on a background thread (started with the app, see
+core/lifespan.py) every USER_DIRECTORY_REFRESH seconds; requests serve
+the current snapshot and only the very first one, before any walk has
+finished, waits for it. Refreshes are incremental: users whose
+`updated_at` did not change keep their already-formatted row, so the
+`AdminUtils.format_user_data` work is only redone for changed users.
+create/update/delete through AdminServices patch the snapshot directly,
+so changes made through this API show up at once; the walk picks up
+changes made elsewhere (sign-ins, the Supabase dashboard).
+"""
+from supabase import Client
+from datetime import datetime, timezone
+from threading import Event, Lock, Thread
+from typing import Any, Literal, Optional
+import logging
+import time
+from core.config import USER_DIRECTORY_REFRESH, USER_DIRECTORY_PAGE_SIZE
+from utils.admin import AdminUtils
+
+logger = logging.getLogger(__name__)
+
+_NEVER = datetime.min.replace(tzinfo=timezone.utc)
+
+SortField = Literal["email", "username", "created_at", "last_sign_in_at", "updated_at"]
+
+class _Entry:
+    __slots__ = ("row", "updated_at", "sort_keys")
+
+    def __init__(self, user: Any):
+        self.row = AdminUtils.format_user_data(user)
+        self.updated_at = user.updated_at
+        self.sort_keys: dict[str, Any] = {
+            "email": self.row["email"].lower(),
+            "username": self.row["username"].lower(),
+            "created_at": user.created_at or _NEVER,
+            "last_sign_in_at": user.last_sign_in_at or _NEVER,
+            "updated_at": user.updated_at or _NEVER,
+        }
+
+class UserDirectory:
+    def __init__(self, refresh_interval: float, page_size: int):
+        self.refresh_interval = refresh_interval
+        self.page_size = page_size
+
+        self._entries: dict[str, _Entry] = {}
+        self._by_role: dict[str, set[str]] = {}
+        self._refreshed_at = 0.0
+        self._lock = Lock()
+        self._refresh_lock = Lock()
+        self._wake = Event()
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+
+    def query(
+        self,
+        db: Client,
+        exclude_role: Optional[str] = None,
+        search: Optional[str] = None,
+        sort: SortField = "created_at",
+        order: Literal["asc", "desc"] = "desc",
+        page: int = 1,
+        per_page: int = 50,
+    ) -> tuple[list[dict[str, str]], int]:
+        """ One page of formatted users, and the total matching count. """
+        self._ensure_fresh(db)
+
+        with self._lock:
+            if exclude_role is None:
+                ids = list(self._entries)
+            else:
+                excluded = self._by_role.get(exclude_role, set())
+                ids = [id for id in self._entries if id not in excluded]
+            entries = [self._entries[id] for id in ids]
+
+        if search:
+            needle = search.lower()
+            entries = [
+                entry for entry in entries
+                if needle in entry.sort_keys["email"] or needle in entry.sort_keys["username"]
+            ]
+
+        entries.sort(key=lambda entry: entry.sort_keys[sort], reverse=order == "desc")
+
+        start = (page - 1) * per_page
+        return [entry.row for entry in entries[start:start + per_page]], len(entries)
+
+    def upsert(self, user: Any) -> None:
+        with self._lock:
+            self._put(user)
+
+    def remove(self, id: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(id, None)
+            if entry is not None:
+                self._by_role.get(entry.row["app_role"], set()).discard(id)
+
+    def invalidate(self) -> None:
+        """ Asks the background refresher for a walk now. """
+        self._wake.set()
+
+    def start(self, db: Client) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = Thread(target=self._run, args=(db,), name="user-directory", daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def refresh(self, db: Client) -> None:
+        with self._refresh_lock:
+            self._refresh(db)
+
+    def _refresh(self, db: Client) -> None:
+        seen: set[str] = set()
+        page = 1
+        while True:
+            users = db.auth.admin.list_users(page=page, per_page=self.page_size)
+            with self._lock:
+                for user in users:
+                    seen.add(user.id)
+                    entry = self._entries.get(user.id)
+                    if entry is None or entry.updated_at != user.updated_at:
+                        self._put(user)
+
+            if len(users) < self.page_size:
+                break
+            page += 1
+
+        with self._lock:
+            for id in [id for id in self._entries if id not in seen]:
+                entry = self._entries.pop(id)
+                self._by_role.get(entry.row["app_role"], set()).discard(id)
+            self._refreshed_at = time.monotonic()
+
+    def _ensure_fresh(self, db: Client) -> None:
+        if self._refreshed_at:
+            return
+
+        # No snapshot yet: build it once; concurrent callers wait and reuse it.
+        with self._refresh_lock:
+            if not self._refreshed_at:
+                self._refresh(db)
+
+    def _run(self, db: Client) -> None:
+        while not self._stop.is_set():
+            try:
+                self.refresh(db)
+            except Exception as e:
+                # Requests keep the previous snapshot until the next attempt.
+                logger.warning("user directory refresh failed: %s", e)
+            self._wake.wait(self.refresh_interval)
+            self._wake.clear()
+
+    def _put(self, user: Any) -> None:
+        previous = self._entries.get(user.id)
+        if previous is not None:
+            self._by_role.get(previous.row["app_role"], set()).discard(user.id)
+
+        entry = _Entry(user)
+        self._entries[user.id] = entry
+        self._by_role.setdefault(entry.row["app_role"], set()).add(user.id)
+
+user_directory = UserDirectory(USER_DIRECTORY_REFRESH, USER_DIRECTORY_PAGE_SIZE)
@@ -1,10 +1,13 @@
 from supabase import Client
+from typing import Any
 from utils.admin import AdminUtils
+from services.admin.user_directory import user_directory
+from utils.identity import identity_index
 
 class AdminServices:
     @staticmethod
     def create_user(db: Client, email: str, password: str, username: str):
-        return db.auth.admin.create_user({
+        response = db.auth.admin.create_user({
             "email": email,
             "password": password,
             "user_metadata": {
@@ -12,6 +15,11 @@ class AdminServices:
                 "app_role": "user",
             },
         })
+        if response.user:
+            user_directory.upsert(response.user)
+            identity_index.add(username=username, email=email)
+
+        return response
         
     @staticmethod
     def read_user(db: Client, id: str):
@@ -21,37 +29,29 @@ class AdminServices:
         return user_data
 
     @staticmethod
-    def read_users(db: Client):
-        users = db.auth.admin.list_users()
-        response: list[dict[str, str]] = []
-        for user in users:
-            user_data = AdminUtils.format_user_data(user) # type: ignore
-            if not user_data.get('app_role') == "admin":
-                response.append(user_data)
-            
-        return response
+    def read_users(db: Client, **query: Any) -> tuple[list[dict[str, str]], int]:
+        return user_directory.query(db, exclude_role="admin", **query)
     
     @staticmethod
     def update_user(db: Client, id: str, username: str, app_role: str):
-        return db.auth.admin.update_user_by_id(id, {
+        response = db.auth.admin.update_user_by_id(id, {
             "user_metadata": {
                 "username": username,
                 "app_role": app_role
             }
         })
+        if response.user:
+            user_directory.upsert(response.user)
+            identity_index.add(username=username)
+
+        return response
 
     @staticmethod
     def delete_user(db: Client, id: str):
-        return db.auth.admin.delete_user(id)
+        response = db.auth.admin.delete_user(id)
+        user_directory.remove(id)
+        return response
 
     @staticmethod
-    def read_admins(db: Client):
-        users = db.auth.admin.list_users()
-        response: list[dict[str, str]] = []
-        for user in users:
-            user_data = AdminUtils.format_user_data(user) # type: ignore
-            if not user_data.get('app_role') == "user":
-                response.append(user_data)
-
-        print(response)    
-        return response
\ No newline at end of file
+    def read_admins(db: Client, **query: Any) -> tuple[list[dict[str, str]], int]:
+        return user_directory.query(db, exclude_role="user", **query)
@@ -1,22 +1,351 @@
 # services/analyze_services.py
-from supabase import Client
-from utils.history import add_to_history
+from supabase import AsyncClient
+from typing import Any, AsyncIterator, Literal, Optional
+import asyncio
+import logging
+import time
+from core.config import (
+    ANALYZE_CACHE_HISTORY,
+    ANALYZE_CACHE_HISTORY_MAX_CHARS,
+    ANALYZE_BATCH_INPUTS,
+    ANALYZE_BATCH_CONCURRENCY,
+    ANALYZE_MAX_CHUNKS,
+    ANALYZE_STREAM_HEARTBEAT,
+    HISTORY_PAGE_SIZE,
+    HISTORY_PAGE_MAX,
+)
+from external.pipeline import apipeline, apipeline_many, labels, is_result, is_local, PipelineError
+from external.scheduler import Caller, Priority, scheduler
+from utils.cache import result_cache, cache_key
+from utils.singleflight import coalescer
+from utils.chunking import split_text, aggregate_results, Boundary, Strategy
+from utils.history import (
+    add_to_history,
+    add_many_to_history,
+    find_in_history,
+    encode_cursor,
+    decode_cursor,
+    summary_columns,
+    summarize_row,
+)
+
+logger = logging.getLogger(__name__)
 
 class AnalyzeServices:
     @staticmethod
-    def analyze_text(db: Client, text: str, uid: str) -> dict:
-        # ... your existing code unchanged ...
-        add_to_history(db, uid, text, results)
+    async def analyze_text(db: AsyncClient, text: str, uid: str, priority: Priority = "interactive") -> dict:
+        results = await AnalyzeServices.classify(db, text, uid, scheduler.caller(uid, priority))
+        await add_to_history(db, uid, text, results)
+        return results
+
+    @staticmethod
+    async def classify(db: AsyncClient, text: str, uid: str, caller: Optional[Caller] = None) -> Any:
+        key = cache_key(text, labels)
+        results = result_cache.get(key)
+        if results is not None:
+            return results
+
+        results = await AnalyzeServices._from_history(db, text, uid)
+        if results is not None:
+            result_cache.record_history_hit()
+            result_cache.set(key, results)
+            return results
+
+        # Identical texts being classified right now share that call, as
+        # long as it was queued in the same priority class: the shared call
+        # runs as its first caller, and an interactive request must not wait
+        # behind a job's place in the scheduler.
+        priority = caller.priority if caller else "interactive"
+        return await coalescer.do(
+            f"{priority}:{key}", lambda: AnalyzeServices._classify_upstream(text, key, caller)
+        )
+
+    @staticmethod
+    async def _classify_upstream(text: str, key: str, caller: Optional[Caller]) -> Any:
+        # It may have finished while this caller looked in its history.
+        results = result_cache.get(key, record_miss=False)
+        if results is not None:
+            return results
+
+        started = time.perf_counter()
+        results = await apipeline(text, caller)
+        if not is_result(results):
+            raise PipelineError("Pipeline returned an invalid result")
+
+        if not is_local(results):
+            result_cache.set(key, results, cost=time.perf_counter() - started)
+        return results
+
+    @staticmethod
+    async def analyze_document(
+        db: AsyncClient,
+        text: str,
+        uid: str,
+        chunk_size: int,
+        split: Boundary = "sentence",
+        aggregate: Strategy = "mean",
+        priority: Priority = "interactive",
+    ) -> dict[str, Any]:
+        chunks = split_text(text, chunk_size, split)
+        if len(chunks) <= 1:
+            return await AnalyzeServices.analyze_text(db, text, uid, priority)
+
+        if len(chunks) > ANALYZE_MAX_CHUNKS:
+            raise ValueError(f"Document is too long: {len(chunks)} chunks, limit is {ANALYZE_MAX_CHUNKS}")
+
+        # Fixed-size groups, so each upstream call takes about as long
+        # however long the document; the scheduler and the per-request
+        # semaphore bound how many run at once.
+        outcomes = await AnalyzeServices.classify_many(chunks, caller=scheduler.caller(uid, priority))
+        for outcome in outcomes:
+            if isinstance(outcome, Exception):
+                raise outcome
+
+        results = aggregate_results(text, chunks, outcomes, aggregate)
+        await add_to_history(db, uid, text, results)
+        return results
+
+    @staticmethod
+    async def analyze_batch(db: AsyncClient, texts: list[str], uid: str) -> list[dict[str, Any]]:
+        outcomes = await AnalyzeServices.classify_many(texts, caller=scheduler.caller(uid, "bulk"))
+
+        items: list[dict[str, Any]] = []
+        rows: list[tuple[str, Any]] = []
+        for index, (text, outcome) in enumerate(zip(texts, outcomes)):
+            if isinstance(outcome, Exception):
+                items.append({"index": index, "error": str(outcome)})
+            else:
+                items.append({"index": index, "results": outcome})
+                rows.append((text, outcome))
+
+        if rows:
+            await add_many_to_history(db, uid, rows)
+
+        return items
+
+    @staticmethod
+    async def stream_document(
+        db: AsyncClient,
+        text: str,
+        uid: str,
+        chunked: bool,
+        chunk_size: int,
+        split: Boundary = "sentence",
+        aggregate: Strategy = "mean",
+    ) -> AsyncIterator[tuple[str, Any]]:
+        """ Yields (event, data) pairs: accepted, one chunk per finished
+        chunk, then result once history has been written. A None data is a
+        keep-alive. """
+        chunks = split_text(text, chunk_size, split) if chunked else [text]
+        if len(chunks) > ANALYZE_MAX_CHUNKS:
+            raise ValueError(f"Document is too long: {len(chunks)} chunks, limit is {ANALYZE_MAX_CHUNKS}")
+
+        caller = scheduler.caller(uid, "interactive")
+        yield "accepted", {"chunks": len(chunks)}
+
+        outcomes: list[Any] = [None] * len(chunks)
+        async for progress in AnalyzeServices.classify_iter(chunks, heartbeat=ANALYZE_STREAM_HEARTBEAT, caller=caller):
+            if progress is None:
+                yield "ping", None
+                continue
+
+            index, outcome = progress
+            if isinstance(outcome, Exception):
+                raise outcome
+
+            outcomes[index] = outcome
+            yield "chunk", {"index": index, "labels": outcome["labels"], "scores": outcome["scores"]}
+
+        if len(chunks) == 1:
+            results = outcomes[0]
+        else:
+            results = aggregate_results(text, chunks, outcomes, aggregate)
+
+        await add_to_history(db, uid, text, results)
+        yield "result", results
+
+    @staticmethod
+    async def stream_batch(db: AsyncClient, texts: list[str], uid: str) -> AsyncIterator[tuple[str, Any]]:
+        """ Yields accepted, one item per finished text, then done once the
+        successful items have been written to history. """
+        caller = scheduler.caller(uid, "bulk")
+        yield "accepted", {"items": len(texts)}
+
+        rows: list[tuple[str, Any]] = []
+        failed = 0
+        async for progress in AnalyzeServices.classify_iter(texts, heartbeat=ANALYZE_STREAM_HEARTBEAT, caller=caller):
+            if progress is None:
+                yield "ping", None
+                continue
+
+            index, outcome = progress
+            if isinstance(outcome, Exception):
+                failed += 1
+                yield "item", {"index": index, "error": str(outcome)}
+            else:
+                rows.append((texts[index], outcome))
+                yield "item", {"index": index, "results": outcome}
+
+        if rows:
+            await add_many_to_history(db, uid, rows)
+
+        yield "done", {"succeeded": len(rows), "failed": failed}
+
+    @staticmethod
+    async def classify_many(
+        texts: list[str],
+        group_size: int = ANALYZE_BATCH_INPUTS,
+        caller: Optional[Caller] = None,
+    ) -> list[Any]:
+        """ Classifies `texts`, returning a result or an Exception per text. """
+        outcomes: list[Any] = [None] * len(texts)
+        async for index, outcome in AnalyzeServices.classify_iter(texts, group_size, caller=caller):  # type: ignore
+            outcomes[index] = outcome
+
+        return outcomes
+
+    @staticmethod
+    async def classify_iter(
+        texts: list[str],
+        group_size: int = ANALYZE_BATCH_INPUTS,
+        heartbeat: Optional[float] = None,
+        caller: Optional[Caller] = None,
+    ) -> AsyncIterator[Optional[tuple[int, Any]]]:
+        """ Yields (index, result or Exception) for `texts` as they complete.
+
+        Cached texts are answered from memory, duplicates are sent once, and
+        the rest are packed `group_size` per upstream request, queued for
+        `caller` by the scheduler. With a `heartbeat`, None is yielded
+        whenever that many seconds pass without progress.
+        """
+        pending: dict[str, list[int]] = {}
+        for index, text in enumerate(texts):
+            key = cache_key(text, labels)
+            cached = result_cache.get(key)
+            if cached is not None:
+                yield index, cached
+            else:
+                pending.setdefault(key, []).append(index)
+
+        keys = list(pending)
+        groups = [keys[i:i + group_size] for i in range(0, len(keys), group_size)]
+        # Per request, so one large batch does not fill its user's queue in
+        # the scheduler; sharing the upstream between requests is its job.
+        slots = asyncio.Semaphore(ANALYZE_BATCH_CONCURRENCY)
+
+        async def run(group: list[str]) -> list[Any]:
+            try:
+                async with slots:
+                    started = time.perf_counter()
+                    results = await apipeline_many([texts[pending[key][0]] for key in group], caller)
+            except PipelineError as e:
+                # A rejected input must not fail its neighbours: retry alone.
+                if len(group) == 1 or not e.status or not 400 <= e.status < 500 or e.status == 429:
+                    raise
+                return [await run_one(key) for key in group]
+
+            cost = (time.perf_counter() - started) / len(group)
+            for key, result in zip(group, results):
+                if is_result(result) and not is_local(result):
+                    result_cache.set(key, result, cost=cost)
+            return results
+
+        async def run_one(key: str) -> Any:
+            try:
+                return (await run([key]))[0]
+            except Exception as e:
+                return e
+
+        tasks = {asyncio.ensure_future(run(group)): group for group in groups}
+        remaining = set(tasks)
+        try:
+            while remaining:
+                done, remaining = await asyncio.wait(remaining, timeout=heartbeat, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    yield None
+                    continue
+
+                for task in done:
+                    group = tasks[task]
+                    try:
+                        results = task.result()
+                    except Exception as e:
+                        results = [e] * len(group)
+
+                    for key, outcome in zip(group, results):
+                        if not isinstance(outcome, Exception) and not is_result(outcome):
+                            outcome = PipelineError("Pipeline returned an invalid result")
+                        for index in pending[key]:
+                            yield index, outcome
+        finally:
+            # A client that disconnects mid-stream stops the remaining calls.
+            for task in remaining:
+                task.cancel()
+
+    @staticmethod
+    async def _from_history(db: AsyncClient, text: str, uid: str) -> Optional[Any]:
+        # Exact-match lookups travel in the query string, so very long texts
+        # are left to the upstream call instead.
+        if not ANALYZE_CACHE_HISTORY or len(text) > ANALYZE_CACHE_HISTORY_MAX_CHARS:
+            return None
+
+        try:
+            results = await find_in_history(db, uid, text)
+        except Exception as e:
+            logger.warning("history cache lookup failed: %s", e)
+            return None
+
+        if not is_result(results) or set(results["labels"]) != set(labels):  # type: ignore
+            return None
+
+        # Answered by the fallback while the upstream was failing: ask again.
+        if is_local(results):
+            return None
+
+        # A chunked analysis of the same text: not what a single one returns.
+        if "chunks" in results or "aggregate" in results:  # type: ignore
+            return None
+
         return results
 
     @staticmethod
-    def get_history(db: Client, user_id: str):
-        res = (
+    async def get_history(
+        db: AsyncClient,
+        user_id: str,
+        limit: int = HISTORY_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        fields: Literal["full", "summary"] = "full",
+        top_k: int = 3,
+    ) -> tuple[list[dict[str, Any]], Optional[str]]:
+        """ One page of history, newest first, plus the cursor of the next
+        page (None on the last page). """
+        limit = max(1, min(limit, HISTORY_PAGE_MAX))
+        columns = "*" if fields == "full" else summary_columns(top_k)
+
+        query = (
             db.table("history")
-            .select("*")
-            .eq("user_id", user_id)           # ✅ only this user's history
-            .order("created_at", desc=True)   # ✅ newest first (if you have created_at)
+            .select(columns)
+            .eq("user_id", user_id)
+        )
+        if cursor:
+            created_at, id = decode_cursor(cursor)
+            query = query.or_(
+                f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{id})'
+            )
+
+        res = await (
+            query
+            .order("created_at", desc=True)
+            .order("id", desc=True)
+            .limit(limit + 1)
             .execute()
         )
 
-        return res.data or []                # ✅ JSON-serializable list
+        rows: list[dict[str, Any]] = res.data or []  # type: ignore
+        next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        rows = rows[:limit]
+
+        if fields == "summary":
+            rows = [summarize_row(row, top_k) for row in rows]
+
+        return rows, next_cursor
@@ -1,4 +1,4 @@
-from supabase import Client
+from supabase import AsyncClient
 from fastapi.responses import JSONResponse
 from utils.auth import AuthUtils
 from utils.logs import create_log # type: ignore
@@ -6,15 +6,16 @@ from utils.logs import create_log # type: ignore
 class AuthServices:
     class Signup:
         @staticmethod
-        def with_password(db: Client, username: str, email: str, password: str):
-            if AuthUtils.check_username_exists(username):
+        async def with_password(db: AsyncClient, username: str, email: str, password: str):
+            username_exists, email_exists = await AuthUtils.acheck_identity_exists(username, email)
+            if username_exists:
                 raise ValueError("Username already exists")
             
-            if AuthUtils.check_email_exists(email):
+            if email_exists:
                 raise ValueError("Email already exists")
 
             # Sign up the user
-            response = db.auth.sign_up({
+            response = await db.auth.sign_up({
                 "email": email,
                 "password": password,
                 "options": {
@@ -26,6 +27,7 @@ class AuthServices:
             })
             
             if response.user:
+                AuthUtils.add_identity(username, email)
                 create_log(
                     type='LOG',
                     description='auth: signup',
@@ -34,7 +36,7 @@ class AuthServices:
                 )
             
             # Set session
-            response = AuthServices.Login.with_password(
+            response = await AuthServices.Login.with_password(
                 db=db,
                 email=email,
                 password=password
@@ -44,14 +46,17 @@ class AuthServices:
 
     class Login:
         @staticmethod
-        def with_password(db: Client, email: str, password: str):
-            if not AuthUtils.check_email_exists(email):
-                raise ValueError("Email does not exist")
-            
-            auth_response = db.auth.sign_in_with_password({
-                "email": email,
-                "password": password
-            })
+        async def with_password(db: AsyncClient, email: str, password: str):
+            # Only failed logins need to know whether the email exists.
+            try:
+                auth_response = await db.auth.sign_in_with_password({
+                    "email": email,
+                    "password": password
+                })
+            except Exception:
+                if not await AuthUtils.acheck_email_exists(email):
+                    raise ValueError("Email does not exist")
+                raise
 
             if not auth_response.session or not auth_response.session.access_token:
                 raise ValueError("Login Failed")
@@ -79,8 +84,8 @@ class AuthServices:
 
     class Logout:
         @staticmethod
-        def logout(db: Client):
-            db.auth.sign_out()
+        async def logout(db: AsyncClient):
+            await db.auth.sign_out()
             response = JSONResponse("Logout successful")
             response.delete_cookie(
                 key='access_token',
@@ -0,0 +1,214 @@
+from supabase import AsyncClient, Client
+from starlette.concurrency import run_in_threadpool
+from functools import cache
+from typing import Any, Optional
+import asyncio
+import logging
+import time
+import uuid
+from core.config import JOBS_CONCURRENCY, JOBS_MAX_PER_USER, JOBS_MAX_QUEUED, JOBS_TTL, JOBS_HEARTBEAT
+from services.analyze_services import AnalyzeServices
+from services.admin.backup_and_restore import Backup, Restore
+from services.admin.rescore import Rescore
+from utils.jobs import MemoryJobStore, SQLiteJobStore, create_store
+
+logger = logging.getLogger(__name__)
+
+# Jobs run as tasks on the server's event loop; at most JOBS_CONCURRENCY
+# analyses talk to the model at a time, the rest wait their turn. Admin
+# jobs (any other kind) run in the threadpool with the sync admin client.
+# The store may be a SQLite file, so it is only used from the threadpool.
+job_slots = asyncio.Semaphore(JOBS_CONCURRENCY)
+job_tasks: set[asyncio.Task[None]] = set()
+
+@cache
+def job_store() -> MemoryJobStore | SQLiteJobStore:
+    # Opened at startup (core/lifespan.py), not on import: it may create a file.
+    return create_store()
+
+# Marks this worker's jobs in a shared store (see utils/jobs.py).
+worker_id = uuid.uuid4().hex
+heartbeat_task: Optional[asyncio.Task[None]] = None
+
+class JobLimitError(ValueError):
+    pass
+
+class JobServices:
+    @staticmethod
+    async def submit(
+        db: AsyncClient | Client,
+        uid: str,
+        request: dict[str, Any],
+        kind: str = "analyze",
+    ) -> dict[str, Any]:
+        """ Queues a job. For an analysis, `request` holds the
+        AnalyzeModel.Document fields and `db` is the caller's async client;
+        admin jobs ("backup", "restore", "rescore") take their arguments and the admin client. """
+        request = {**request, "kind": kind}
+        job = await run_in_threadpool(JobServices._create, uid, request)
+        task = asyncio.create_task(JobServices._run(db, job["id"], uid, request))
+        job_tasks.add(task)
+        task.add_done_callback(job_tasks.discard)
+
+        return JobServices._public(job)
+
+    @staticmethod
+    async def get_job(uid: str, id: str) -> Optional[dict[str, Any]]:
+        job = await run_in_threadpool(job_store().get, id)
+        if not job or job["user_id"] != uid or JobServices._expired(job):
+            return None
+
+        return JobServices._public(job, include_result=True)
+
+    @staticmethod
+    async def list_jobs(uid: str, limit: int = 50) -> list[dict[str, Any]]:
+        await run_in_threadpool(job_store().purge, time.time())
+        jobs = await run_in_threadpool(job_store().list_for_user, uid, limit)
+        return [JobServices._public(job) for job in jobs]
+
+    @staticmethod
+    def _create(uid: str, request: dict[str, Any]) -> dict[str, Any]:
+        job_store().purge(time.time())
+
+        if job_store().count_active(uid) >= JOBS_MAX_PER_USER:
+            raise JobLimitError(f"Too many active jobs, limit is {JOBS_MAX_PER_USER}")
+
+        if job_store().count_active() >= JOBS_MAX_QUEUED:
+            raise JobLimitError("Job queue is full, try again later")
+
+        job: dict[str, Any] = {
+            "id": uuid.uuid4().hex,
+            "user_id": uid,
+            "status": "queued",
+            "request": request,
+            "result": None,
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "expires_at": None,
+            "worker": worker_id,
+        }
+        job_store().create(job)
+        return job
+
+    @staticmethod
+    def start() -> None:
+        """ Starts the heartbeat, which first fails the jobs of workers that
+        died (lifespan startup); needs a running event loop. """
+        global heartbeat_task
+        if heartbeat_task is None or heartbeat_task.done():
+            heartbeat_task = asyncio.create_task(JobServices._heartbeat(), name="jobs-heartbeat")
+
+    @staticmethod
+    async def stop() -> None:
+        """ Cancels the jobs still queued or running, which marks them failed. """
+        global heartbeat_task
+        tasks = [task for task in (heartbeat_task, *job_tasks) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        heartbeat_task = None
+
+    @staticmethod
+    async def _heartbeat() -> None:
+        while True:
+            now = time.time()
+            try:
+                await run_in_threadpool(job_store().heartbeat, worker_id, now)
+                failed = await run_in_threadpool(
+                    job_store().fail_orphaned,
+                    now,
+                    now - 3 * JOBS_HEARTBEAT,
+                    "The server stopped before the job finished",
+                    now + JOBS_TTL,
+                )
+                if failed:
+                    logger.warning("failed %d analysis jobs left behind by a stopped worker", failed)
+            except Exception as e:
+                logger.warning("analysis job heartbeat failed: %s", e)
+            await asyncio.sleep(JOBS_HEARTBEAT)
+
+    @staticmethod
+    async def _run(db: Any, id: str, uid: str, request: dict[str, Any]) -> None:
+        try:
+            if JobServices._kind(request) == "analyze":
+                async with job_slots:
+                    await JobServices._execute(db, id, uid, request)
+            else:
+                await JobServices._execute(db, id, uid, request)
+        except asyncio.CancelledError:
+            # Shutting down: finalize it rather than leave it active forever.
+            finished = time.time()
+            await run_in_threadpool(
+                job_store().update, id, status="failed", error="The server stopped before the job finished",
+                finished_at=finished, expires_at=finished + JOBS_TTL,
+            )
+            raise
+
+    @staticmethod
+    async def _execute(db: Any, id: str, uid: str, request: dict[str, Any]) -> None:
+        await run_in_threadpool(job_store().update, id, status="running", started_at=time.time())
+        kind = JobServices._kind(request)
+        try:
+            if kind == "rescore":
+                result = await run_in_threadpool(
+                    Rescore.run, db, user_id=request.get("user_id"), before=request.get("before"), dry_run=request.get("dry_run", False),
+                )
+            elif kind == "backup":
+                backup = await run_in_threadpool(Backup.create, db, full=request.get("full", False))
+                result = {**backup, "download_url": f'/admin/download_backup/{backup["id"]}'}
+            elif kind == "restore":
+                result = await run_in_threadpool(
+                    Restore.run, db, request["backup_id"], resume=request.get("resume", True),
+                )
+            elif request.get("chunked"):
+                result = await AnalyzeServices.analyze_document(
+                    db,
+                    request["text"],
+                    uid,
+                    chunk_size=request["chunk_size"],
+                    split=request["split"],
+                    aggregate=request["aggregate"],
+                    priority="background",
+                )
+            else:
+                result = await AnalyzeServices.analyze_text(db, request["text"], uid, priority="background")
+
+            finished = time.time()
+            await run_in_threadpool(
+                job_store().update, id, status="succeeded", result=result, finished_at=finished, expires_at=finished + JOBS_TTL,
+            )
+
+        except Exception as e:
+            logger.warning("%s job %s failed: %s", kind, id, e)
+            finished = time.time()
+            await run_in_threadpool(
+                job_store().update, id, status="failed", error=str(e), finished_at=finished, expires_at=finished + JOBS_TTL,
+            )
+
+    @staticmethod
+    def _kind(request: dict[str, Any]) -> str:
+        # Jobs stored before there were kinds are analyses.
+        return request.get("kind", "analyze")
+
+    @staticmethod
+    def _expired(job: dict[str, Any]) -> bool:
+        return job["expires_at"] is not None and job["expires_at"] <= time.time()
+
+    @staticmethod
+    def _public(job: dict[str, Any], include_result: bool = False) -> dict[str, Any]:
+        response = {
+            "id": job["id"],
+            "kind": JobServices._kind(job["request"]),
+            "status": job["status"],
+            "created_at": job["created_at"],
+            "started_at": job["started_at"],
+            "finished_at": job["finished_at"],
+            "expires_at": job["expires_at"],
+        }
+        if include_result:
+            response["result"] = job["result"]
+            response["error"] = job["error"]
+
+        return response
@@ -1,9 +1,9 @@
-from supabase import Client
+from supabase import AsyncClient
 
 class ProfileServices:
     @staticmethod
-    def get_profile_data(db: Client):
-        response = db.table("profiles").select("*").execute()
+    async def get_profile_data(db: AsyncClient):
+        response = await db.table("profiles").select("*").execute()
         results = getattr(response, "data", None)
 
         if not results or len(results) == 0:
@@ -1,20 +1,16 @@
-from db.supabase import db_admin
-
-db = db_admin()
+from db.supabase import clients
+from utils.identity import identity_index
 
 class AuthUtils:
     @staticmethod
-    def check_username_exists(username: str) -> bool:
-        print(f"Checking if {username} exists...")
-        results = db.table("profiles").select("id").eq("username", username).limit(1).execute()
-        data = getattr(results, "data", None)
-        return bool(data and len(data) > 0)
+    async def acheck_email_exists(email: str) -> bool:
+        return (await identity_index.aexists(clients.admin_async(), email=email))[1]
 
     @staticmethod
-    def check_email_exists(email: str) -> bool:
-        print(f"Checking if {email} exists...")
-        results = db.table("profiles").select("id").eq("email", email).limit(1).execute()
-        data = getattr(results, "data", None)
-        return bool(data and len(data) > 0)
+    async def acheck_identity_exists(username: str, email: str) -> tuple[bool, bool]:
+        """ (username taken, email taken), in at most one query. """
+        return await identity_index.aexists(clients.admin_async(), username=username, email=email)
 
-    
\ No newline at end of file
+    @staticmethod
+    def add_identity(username: str, email: str) -> None:
+        identity_index.add(username=username, email=email)
@@ -0,0 +1,139 @@
+""" Analysis result cache
+Content-addressed cache for zero-shot classification results.
+
+Entries are keyed by a hash of the normalized text plus the candidate
+labels, so re-submitting the same abstract (modulo whitespace) is served
+from memory instead of making another upstream round trip.
+
+The in-memory tier is an LRU bounded both by entry count and by the
+approximate serialized size of the stored results. Entries also expire
+after a TTL so a model update upstream eventually shows through.
+"""
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Optional
+import hashlib
+import json
+import time
+import unicodedata
+from core.config import (
+    ANALYZE_CACHE_ENTRIES,
+    ANALYZE_CACHE_MAX_BYTES,
+    ANALYZE_CACHE_TTL,
+)
+
+def normalize_text(text: str) -> str:
+    text = unicodedata.normalize("NFC", text)
+    return " ".join(text.split())
+
+def cache_key(text: str, labels: list[str]) -> str:
+    digest = hashlib.sha256()
+    digest.update(normalize_text(text).encode("utf-8"))
+    digest.update(b"\x00")
+    digest.update("\x1f".join(sorted(labels)).encode("utf-8"))
+    return digest.hexdigest()
+
+class _Entry:
+    __slots__ = ("value", "size", "expires_at", "cost")
+
+    def __init__(self, value: Any, size: int, expires_at: float, cost: float):
+        self.value = value
+        self.size = size
+        self.expires_at = expires_at
+        self.cost = cost
+
+class ResultCache:
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.history_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.saved_seconds = 0.0
+
+    def get(self, key: str, record_miss: bool = True) -> Optional[Any]:
+        """ The cached value, or None. Pass `record_miss=False` when
+        re-checking a key whose miss was already counted. """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += record_miss
+                return None
+
+            if entry.expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += record_miss
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_seconds += entry.cost
+            return entry.value
+
+    def set(self, key: str, value: Any, cost: float = 0.0) -> None:
+        """ Stores `value` under `key`.
+
+        `cost` is the upstream time (in seconds) it took to produce the
+        value; it is credited to `saved_seconds` on every later hit.
+        """
+        size = len(json.dumps(value, separators=(",", ":")))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = _Entry(value, size, time.monotonic() + self.ttl, cost)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def record_history_hit(self) -> None:
+        with self._lock:
+            self.history_hits += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "history_hits": self.history_hits,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "saved_seconds": round(self.saved_seconds, 3),
+            }
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+result_cache = ResultCache(
+    max_entries=ANALYZE_CACHE_ENTRIES,
+    max_bytes=ANALYZE_CACHE_MAX_BYTES,
+    ttl=ANALYZE_CACHE_TTL,
+)
@@ -0,0 +1,94 @@
+""" Chunking
+Splits long documents into model-sized pieces and folds the per-chunk
+zero-shot scores back into a single document result.
+
+split_text():
+    Packs whole paragraphs or sentences greedily into chunks of at most
+    `max_chars`. A paragraph that does not fit is packed by sentence, and
+    a sentence that does not fit is cut on whitespace.
+
+aggregate_results():
+    Combines per-chunk results into the same {sequence, labels, scores}
+    shape the pipeline returns, using mean, max or length-weighted scores.
+"""
+from typing import Any, Literal
+import re
+
+Boundary = Literal["sentence", "paragraph"]
+Strategy = Literal["mean", "max", "weighted"]
+
+_PARAGRAPH = re.compile(r"\n\s*\n")
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+
+def split_text(text: str, max_chars: int, boundary: Boundary = "sentence") -> list[str]:
+    if boundary == "paragraph":
+        units: list[str] = []
+        for paragraph in _PARAGRAPH.split(text):
+            paragraph = paragraph.strip()
+            if len(paragraph) <= max_chars:
+                units.extend([paragraph] if paragraph else [])
+            else:
+                units.extend(_pack(_sentences(paragraph, max_chars), max_chars, " "))
+        return _pack(units, max_chars, "\n\n")
+
+    return _pack(_sentences(text, max_chars), max_chars, " ")
+
+def _sentences(text: str, max_chars: int) -> list[str]:
+    """ Sentences of `text`, with any single over-long sentence cut on whitespace. """
+    units: list[str] = []
+    for sentence in _SENTENCE.split(text):
+        sentence = sentence.strip()
+        if len(sentence) <= max_chars:
+            units.extend([sentence] if sentence else [])
+            continue
+
+        words = [word[i:i + max_chars] for word in sentence.split() for i in range(0, len(word), max_chars)]
+        units.extend(_pack(words, max_chars, " "))
+    return units
+
+def _pack(units: list[str], max_chars: int, separator: str) -> list[str]:
+    chunks: list[str] = []
+    current = ""
+    for unit in units:
+        if not current:
+            current = unit
+        elif len(current) + len(separator) + len(unit) <= max_chars:
+            current = current + separator + unit
+        else:
+            chunks.append(current)
+            current = unit
+
+    if current:
+        chunks.append(current)
+
+    return chunks
+
+def aggregate_results(text: str, chunks: list[str], results: list[Any], strategy: Strategy = "mean") -> dict[str, Any]:
+    per_chunk = [dict(zip(result["labels"], result["scores"])) for result in results]
+    weights = [len(chunk) for chunk in chunks] if strategy == "weighted" else [1] * len(chunks)
+    total = sum(weights)
+
+    scores: dict[str, float] = {}
+    for label in per_chunk[0]:
+        values = [chunk_scores.get(label, 0.0) for chunk_scores in per_chunk]
+        if strategy == "max":
+            scores[label] = max(values)
+        else:
+            scores[label] = sum(value * weight for value, weight in zip(values, weights)) / total
+
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    return {
+        "sequence": text,
+        "labels": [label for label, _ in ranked],
+        "scores": [score for _, score in ranked],
+        "aggregate": strategy,
+        "chunks": [
+            {
+                "index": index,
+                "length": len(chunk),
+                "labels": result["labels"],
+                "scores": result["scores"],
+            }
+            for index, (chunk, result) in enumerate(zip(chunks, results))
+        ],
+    }
@@ -1,12 +1,100 @@
-from supabase import Client
-from typing import Any
+from supabase import AsyncClient
+from datetime import datetime
+from typing import Any, Optional
+import base64
+import hashlib
+import json
+import re
 
-def add_to_history(db: Client, user_id: str, raw_text: str, results: Any):
-    response = db.table("history").insert({
+async def add_to_history(db: AsyncClient, user_id: str, raw_text: str, results: Any):
+    response = await db.table("history").insert({
         "user_id": user_id,
         "raw_text": raw_text,
         "results": results
     }).execute()
 
     return response
-    
\ No newline at end of file
+
+async def add_many_to_history(db: AsyncClient, user_id: str, rows: list[tuple[str, Any]]):
+    """ Inserts every (raw_text, results) pair in a single request. """
+    response = await db.table("history").insert([
+        {
+            "user_id": user_id,
+            "raw_text": raw_text,
+            "results": results
+        }
+        for raw_text, results in rows
+    ]).execute()
+
+    return response
+
+async def find_in_history(db: AsyncClient, user_id: str, raw_text: str) -> Optional[Any]:
+    """ Returns the newest stored results for exactly this text, if any. """
+    response = await (
+        db.table("history")
+        .select("results")
+        .eq("user_id", user_id)
+        .eq("raw_text", raw_text)
+        .order("created_at", desc=True)
+        .limit(1)
+        .execute()
+    )
+    data = getattr(response, "data", None)
+    if not data:
+        return None
+
+    return data[0].get("results")
+
+_ID = re.compile(r"[0-9A-Fa-f-]{1,64}")
+
+def encode_cursor(row: dict[str, Any]) -> str:
+    """ Opaque keyset cursor pointing just past `row`. """
+    raw = json.dumps([row["created_at"], row["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[str, Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, id = json.loads(raw)
+        # Both values are spliced into a PostgREST filter: only accept a
+        # timestamp and an integer/uuid id.
+        datetime.fromisoformat(created_at)
+        if not isinstance(id, int) and not _ID.fullmatch(str(id)):
+            raise ValueError
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+    return created_at, id
+
+def summary_columns(top_k: int) -> str:
+    """ Select list with only the id, timestamp and top-k labels/scores.
+
+    Labels come back from the pipeline sorted by score, so the top k are
+    the first k array entries; they are extracted in the database so
+    neither raw_text nor the full results blob leave it.
+    """
+    columns = ["id", "created_at"]
+    for i in range(top_k):
+        columns.append(f"label_{i}:results->labels->{i}")
+        columns.append(f"score_{i}:results->scores->{i}")
+    return ",".join(columns)
+
+def summarize_row(row: dict[str, Any], top_k: int) -> dict[str, Any]:
+    labels: list[Any] = []
+    scores: list[Any] = []
+    for i in range(top_k):
+        if row.get(f"label_{i}") is None:
+            break
+        labels.append(row[f"label_{i}"])
+        scores.append(row.get(f"score_{i}"))
+
+    return {
+        "id": row["id"],
+        "created_at": row["created_at"],
+        "labels": labels,
+        "scores": scores,
+    }
+
+def page_etag(rows: list[dict[str, Any]], next_cursor: Optional[str]) -> str:
+    body = json.dumps([rows, next_cursor], sort_keys=True, separators=(",", ":"), default=str)
+    return 'W/"' + hashlib.sha256(body.encode("utf-8")).hexdigest()[:32] + '"'
@@ -0,0 +1,261 @@
+""" Identity index
+In-memory answers to "is this username / email already taken?".
+
+Signup and login used to ask `profiles` directly on every request. The
+index keeps a Bloom filter of every known username and email, so most
+"email not taken" answers never leave the process, plus a bounded LRU of
+names confirmed to exist. Anything the index cannot answer for certain (a
+Bloom filter "maybe", or a lookup before the first load finishes) is
+resolved with a single `profiles` query for all the names at once.
+
+The filter is per worker and only as fresh as its last rebuild, so a user
+created on another worker may be missing from it. Its "not taken" is only
+trusted for emails, which auth itself keeps unique; usernames are always
+confirmed against `profiles` unless known to be taken.
+
+The filter is loaded from `profiles` in the background at startup and
+rebuilt every IDENTITY_REFRESH seconds (which also forgets deleted users);
+signups add to it immediately. Emails are compared lower-cased, usernames
+exactly, matching how they are stored.
+"""
+from supabase import Client, AsyncClient
+from postgrest.types import CountMethod
+from collections import OrderedDict
+from threading import Event, Lock, Thread
+from typing import Any, Optional
+import hashlib
+import logging
+import math
+import unicodedata
+from core.config import (
+    IDENTITY_BLOOM_CAPACITY,
+    IDENTITY_BLOOM_ERROR,
+    IDENTITY_CACHE_SIZE,
+    IDENTITY_REFRESH,
+    IDENTITY_PAGE_SIZE,
+)
+from core.readiness import readiness
+
+logger = logging.getLogger(__name__)
+
+# Fields whose uniqueness the database enforces, so a stale "not taken"
+# from the filter cannot let a duplicate in.
+BLOOM_TRUSTED = ("email",)
+
+def username_key(username: str) -> str:
+    return "u:" + unicodedata.normalize("NFC", username.strip())
+
+def email_key(email: str) -> str:
+    return "e:" + email.strip().lower()
+
+def _quote(value: str) -> str:
+    # PostgREST filter values with reserved characters must be double-quoted.
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.capacity = capacity
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str) -> list[int]:
+        # Double hashing: k positions from two halves of one digest.
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        a = int.from_bytes(digest[:8], "little")
+        b = int.from_bytes(digest[8:], "little") | 1
+        return [(a + i * b) % self.size for i in range(self.hashes)]
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+class IdentityIndex:
+    def __init__(self, capacity: int, error_rate: float, cache_size: int, refresh_interval: float, page_size: int):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.cache_size = cache_size
+        self.refresh_interval = refresh_interval
+        self.page_size = page_size
+
+        self._bloom: Optional[BloomFilter] = None
+        self._known: OrderedDict[str, None] = OrderedDict()
+        self._added: Optional[list[str]] = None
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+
+        self.index_hits = 0
+        self.cache_hits = 0
+        self.queries = 0
+
+    async def aexists(self, db: AsyncClient, username: Optional[str] = None, email: Optional[str] = None) -> tuple[bool, bool]:
+        """ Whether `username` and `email` are taken, with at most one query. """
+        keys, answers = self._lookup(username, email)
+        unknown = [field for field in keys if field not in answers]
+        if unknown:
+            response = await self._query(db, keys, unknown).execute()
+            self._resolve(keys, unknown, response.data or [], answers)
+
+        return answers["username"], answers["email"]
+
+    def add(self, username: Optional[str] = None, email: Optional[str] = None) -> None:
+        """ Records a new user, e.g. right after signup. """
+        for key in (
+            username_key(username) if username else None,
+            email_key(email) if email else None,
+        ):
+            if key is not None:
+                with self._lock:
+                    if self._bloom is not None:
+                        self._bloom.add(key)
+                    if self._added is not None:
+                        self._added.append(key)
+                self._remember(key)
+
+    def refresh(self, db: Client) -> None:
+        """ Rebuilds the filter from every row of `profiles`. """
+        with self._lock:
+            # Signups during the rebuild may land after their page was read.
+            self._added = []
+
+        try:
+            # Two keys per user, with headroom for signups until the next rebuild.
+            users = db.table("profiles").select("id", count=CountMethod.exact, head=True).execute().count or 0
+            bloom = BloomFilter(max(self.capacity, users * 4), self.error_rate)
+
+            last_id = None
+            while True:
+                query = db.table("profiles").select("id,username,email")
+                if last_id is not None:
+                    query = query.gt("id", last_id)
+                rows = query.order("id").limit(self.page_size).execute().data or []
+
+                for row in rows:
+                    if row.get("username"):
+                        bloom.add(username_key(row["username"]))
+                    if row.get("email"):
+                        bloom.add(email_key(row["email"]))
+
+                if len(rows) < self.page_size:
+                    break
+                last_id = rows[-1]["id"]
+        except Exception:
+            with self._lock:
+                self._added = None
+            raise
+
+        with self._lock:
+            for key in self._added:
+                bloom.add(key)
+            self._added = None
+            self._bloom = bloom
+            self._known.clear()
+
+    def start(self, db: Client) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = Thread(target=self._run, args=(db,), name="identity-index", daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def stats(self) -> dict[str, object]:
+        with self._lock:
+            return {
+                "ready": self._bloom is not None,
+                "entries": self._bloom.count if self._bloom is not None else 0,
+                "bloom_bytes": (self._bloom.size + 7) // 8 if self._bloom is not None else 0,
+                "known": len(self._known),
+                "index_hits": self.index_hits,
+                "cache_hits": self.cache_hits,
+                "queries": self.queries,
+            }
+
+    def _lookup(self, username: Optional[str], email: Optional[str]) -> tuple[dict[str, Optional[str]], dict[str, bool]]:
+        keys = {
+            "username": username_key(username) if username is not None else None,
+            "email": email_key(email) if email is not None else None,
+        }
+        answers: dict[str, bool] = {}
+        with self._lock:
+            for field, key in keys.items():
+                if key is None:
+                    answers[field] = False
+                elif key in self._known:
+                    self._known.move_to_end(key)
+                    self.cache_hits += 1
+                    answers[field] = True
+                elif field in BLOOM_TRUSTED and self._bloom is not None and key not in self._bloom:
+                    self.index_hits += 1
+                    answers[field] = False
+        return keys, answers
+
+    def _query(self, db: AsyncClient, keys: dict[str, Optional[str]], unknown: list[str]) -> Any:
+        self.queries += 1
+        filters = [f"{field}.eq.{_quote(keys[field][2:])}" for field in unknown]  # type: ignore
+        return (
+            db.table("profiles")
+            .select(",".join(unknown))
+            .or_(",".join(filters))
+            .limit(len(unknown))
+        )
+
+    def _resolve(
+        self,
+        keys: dict[str, Optional[str]],
+        unknown: list[str],
+        rows: list[dict[str, Any]],
+        answers: dict[str, bool],
+    ) -> None:
+        found = {
+            key
+            for row in rows
+            for key in (
+                username_key(row["username"]) if row.get("username") else None,
+                email_key(row["email"]) if row.get("email") else None,
+            )
+            if key is not None
+        }
+        for field in unknown:
+            answers[field] = keys[field] in found
+            if answers[field]:
+                self._remember(keys[field])  # type: ignore
+
+    def _remember(self, key: str) -> None:
+        with self._lock:
+            self._known[key] = None
+            self._known.move_to_end(key)
+            while len(self._known) > self.cache_size:
+                self._known.popitem(last=False)
+
+    def _run(self, db: Client) -> None:
+        while not self._stop.is_set():
+            try:
+                self.refresh(db)
+            except Exception as e:
+                # Lookups keep working (via profiles) until the next attempt.
+                logger.warning("identity index refresh failed: %s", e)
+            self._stop.wait(self.refresh_interval)
+
+identity_index = IdentityIndex(
+    capacity=IDENTITY_BLOOM_CAPACITY,
+    error_rate=IDENTITY_BLOOM_ERROR,
+    cache_size=IDENTITY_CACHE_SIZE,
+    refresh_interval=IDENTITY_REFRESH,
+    page_size=IDENTITY_PAGE_SIZE,
+)
+
+# Lookups fall back to `profiles` until the first load, so this is informational.
+readiness.register("identity_index", lambda: None if identity_index._bloom is not None else "loading", required=False)
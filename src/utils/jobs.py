@@ -0,0 +1,193 @@
+""" Job stores
+Persistence for analysis jobs (services/job_services.py).
+
+MemoryJobStore keeps jobs in this process only. SQLiteJobStore keeps
+them in a local SQLite file, so every server worker on the host can
+answer status polls, whichever worker is running the job. There, each
+worker sends a `heartbeat()`; `fail_orphaned()` fails the unfinished jobs
+of workers that stopped sending one (they died or were restarted).
+
+A job is a plain dict:
+    id, user_id, status (queued | running | succeeded | failed),
+    request, result, error, created_at, started_at, finished_at, expires_at,
+    worker (the id of the worker running it)
+"""
+from threading import Lock
+from typing import Any, Optional
+import json
+import sqlite3
+from core.config import JOBS_STORE, JOBS_SQLITE_PATH
+
+ACTIVE = ("queued", "running")
+
+class MemoryJobStore:
+    def __init__(self):
+        self._jobs: dict[str, dict[str, Any]] = {}
+        self._lock = Lock()
+
+    def create(self, job: dict[str, Any]) -> None:
+        with self._lock:
+            self._jobs[job["id"]] = dict(job)
+
+    def update(self, id: str, **fields: Any) -> None:
+        with self._lock:
+            if id in self._jobs:
+                self._jobs[id].update(fields)
+
+    def get(self, id: str) -> Optional[dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(id)
+            return dict(job) if job else None
+
+    def list_for_user(self, user_id: str, limit: int) -> list[dict[str, Any]]:
+        with self._lock:
+            jobs = [dict(job) for job in self._jobs.values() if job["user_id"] == user_id]
+        jobs.sort(key=lambda job: job["created_at"], reverse=True)
+        return jobs[:limit]
+
+    def count_active(self, user_id: Optional[str] = None) -> int:
+        with self._lock:
+            return sum(
+                1 for job in self._jobs.values()
+                if job["status"] in ACTIVE and (user_id is None or job["user_id"] == user_id)
+            )
+
+    def purge(self, now: float) -> int:
+        with self._lock:
+            expired = [
+                id for id, job in self._jobs.items()
+                if job["expires_at"] is not None and job["expires_at"] <= now
+            ]
+            for id in expired:
+                del self._jobs[id]
+            return len(expired)
+
+    # Jobs here live and die with this worker: none can be orphaned.
+    def heartbeat(self, worker: str, now: float) -> None:
+        pass
+
+    def fail_orphaned(self, now: float, stale_before: float, error: str, expires_at: float) -> int:
+        return 0
+
+class SQLiteJobStore:
+    _COLUMNS = (
+        "id", "user_id", "status", "request", "result", "error",
+        "created_at", "started_at", "finished_at", "expires_at", "worker",
+    )
+    _JSON_COLUMNS = ("request", "result")
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA busy_timeout=5000")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    request TEXT,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    expires_at REAL,
+                    worker TEXT
+                )
+                """
+            )
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            if "worker" not in columns:
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN worker TEXT")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_user ON jobs (user_id, created_at)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS workers (id TEXT PRIMARY KEY, seen_at REAL NOT NULL)")
+
+    def create(self, job: dict[str, Any]) -> None:
+        row = self._dump(job)
+        columns = ", ".join(row)
+        placeholders = ", ".join("?" for _ in row)
+        with self._lock:
+            self._conn.execute(f"INSERT INTO jobs ({columns}) VALUES ({placeholders})", tuple(row.values()))
+
+    def update(self, id: str, **fields: Any) -> None:
+        row = self._dump(fields)
+        assignments = ", ".join(f"{column} = ?" for column in row)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*row.values(), id))
+
+    def get(self, id: str) -> Optional[dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (id,)).fetchone()
+        return self._load(row) if row else None
+
+    def list_for_user(self, user_id: str, limit: int) -> list[dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE user_id = ? ORDER BY created_at DESC LIMIT ?",
+                (user_id, limit),
+            ).fetchall()
+        return [self._load(row) for row in rows]
+
+    def count_active(self, user_id: Optional[str] = None) -> int:
+        query = "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)"
+        params: tuple[Any, ...] = ACTIVE
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params = (*ACTIVE, user_id)
+
+        with self._lock:
+            return self._conn.execute(query, params).fetchone()[0]
+
+    def purge(self, now: float) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+            )
+            return cursor.rowcount
+
+    def heartbeat(self, worker: str, now: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO workers (id, seen_at) VALUES (?, ?) ON CONFLICT (id) DO UPDATE SET seen_at = excluded.seen_at",
+                (worker, now),
+            )
+
+    def fail_orphaned(self, now: float, stale_before: float, error: str, expires_at: float) -> int:
+        """ Fails the queued and running jobs of workers not seen since
+        `stale_before`; they would otherwise count as active forever. """
+        with self._lock:
+            self._conn.execute("DELETE FROM workers WHERE seen_at < ?", (stale_before,))
+            cursor = self._conn.execute(
+                """
+                UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, expires_at = ?
+                WHERE status IN (?, ?)
+                AND (worker IS NULL OR worker NOT IN (SELECT id FROM workers))
+                """,
+                (error, now, expires_at, *ACTIVE),
+            )
+            return cursor.rowcount
+
+    def _dump(self, job: dict[str, Any]) -> dict[str, Any]:
+        row = {column: job[column] for column in self._COLUMNS if column in job}
+        for column in self._JSON_COLUMNS:
+            if row.get(column) is not None:
+                row[column] = json.dumps(row[column])
+        return row
+
+    def _load(self, row: sqlite3.Row) -> dict[str, Any]:
+        job = dict(row)
+        for column in self._JSON_COLUMNS:
+            if job.get(column) is not None:
+                job[column] = json.loads(job[column])
+        return job
+
+def create_store() -> MemoryJobStore | SQLiteJobStore:
+    if JOBS_STORE == "sqlite":
+        return SQLiteJobStore(JOBS_SQLITE_PATH)
+    if JOBS_STORE == "memory":
+        return MemoryJobStore()
+    raise ValueError(f"Unknown JOBS_STORE: {JOBS_STORE}")
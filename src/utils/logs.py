@@ -1,8 +1,185 @@
+""" Audit logs
+`create_log` only enqueues: a background LogSink thread bulk-inserts the
+queued rows into the `logs` table once LOGS_BATCH_SIZE rows are waiting
+or LOGS_FLUSH_INTERVAL seconds have passed, so route latency no longer
+includes a database round trip per log line. The thread runs between
+the app's startup and shutdown (core/lifespan.py); rows logged after
+shutdown are written (or spilled) straight away instead of queued.
+
+When the queue is full, LOGS_OVERFLOW decides what happens to new rows:
+    drop:   discard them
+    sample: keep roughly LOGS_SAMPLE_RATE of them, discard the rest
+    spill:  append them to the LOGS_SPILL_PATH JSONL file
+Batches the database rejects are spilled (or dropped) the same way.
+"""
 from db.supabase import db_admin
+from datetime import datetime, timezone
+from threading import Event, Lock, Thread
 from typing import Optional, Any
+import json
+import logging
+import queue
+import random
+import time
+from core.config import (
+    LOGS_QUEUE_SIZE,
+    LOGS_BATCH_SIZE,
+    LOGS_FLUSH_INTERVAL,
+    LOGS_OVERFLOW,
+    LOGS_SAMPLE_RATE,
+    LOGS_SPILL_PATH,
+)
+from core.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+class LogSink:
+    def __init__(self, capacity: int, batch_size: int, flush_interval: float, overflow: str):
+        if overflow not in ("drop", "sample", "spill"):
+            raise ValueError(f"Unknown LOGS_OVERFLOW: {overflow}")
+
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+
+        self._queue: queue.Queue[dict[str, Any]] = queue.Queue(maxsize=capacity)
+        self._stop = Event()
+        self._stopped = False
+        self._thread: Optional[Thread] = None
+        self._lock = Lock()
+
+        self.enqueued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.failed_batches = 0
+        self.last_flush_at: Optional[float] = None
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._stopped = False
+                self._thread = Thread(target=self._run, name="log-sink", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 10) -> None:
+        """ Stops the flusher after writing out everything still queued;
+        later rows are written as they come. """
+        self._stopped = True
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+        self._flush(self._drain(self._queue.qsize()))
+
+    def put(self, record: dict[str, Any]) -> None:
+        if self._stopped:
+            # Nothing would flush the queue any more.
+            self._flush([record])
+            return
+
+        try:
+            self._queue.put_nowait(record)
+            with self._lock:
+                self.enqueued += 1
+            return
+        except queue.Full:
+            pass
+
+        if self.overflow == "spill":
+            self._spill([record])
+        elif self.overflow == "sample" and random.random() < LOGS_SAMPLE_RATE:
+            # Make room by discarding the oldest row instead.
+            try:
+                self._queue.get_nowait()
+                self._queue.put_nowait(record)
+            except (queue.Empty, queue.Full):
+                pass
+            with self._lock:
+                self.dropped += 1
+        else:
+            with self._lock:
+                self.dropped += 1
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "depth": self._queue.qsize(),
+                "capacity": self._queue.maxsize,
+                "overflow": self.overflow,
+                "enqueued": self.enqueued,
+                "flushed": self.flushed,
+                "dropped": self.dropped,
+                "spilled": self.spilled,
+                "failed_batches": self.failed_batches,
+                "last_flush_at": self.last_flush_at,
+            }
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            batch: list[dict[str, Any]] = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stop.is_set():
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._flush(batch)
+
+    def _drain(self, limit: int) -> list[dict[str, Any]]:
+        batch: list[dict[str, Any]] = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch: list[dict[str, Any]]) -> None:
+        for start in range(0, len(batch), self.batch_size):
+            chunk = batch[start:start + self.batch_size]
+            try:
+                db_admin().table("logs").insert(chunk).execute()  # type: ignore
+            except Exception as e:
+                logger.warning("failed to write %d log rows: %s", len(chunk), e)
+                with self._lock:
+                    self.failed_batches += 1
+                if self.overflow == "spill":
+                    self._spill(chunk)
+                else:
+                    with self._lock:
+                        self.dropped += len(chunk)
+                continue
+
+            with self._lock:
+                self.flushed += len(chunk)
+                self.last_flush_at = time.time()
+
+    def _spill(self, records: list[dict[str, Any]]) -> None:
+        try:
+            with self._lock, open(LOGS_SPILL_PATH, "a", encoding="utf-8") as file:
+                for record in records:
+                    file.write(json.dumps(record, default=str) + "\n")
+                self.spilled += len(records)
+        except OSError as e:
+            logger.warning("failed to spill %d log rows: %s", len(records), e)
+            with self._lock:
+                self.dropped += len(records)
 
-db = db_admin()
+log_sink = LogSink(
+    capacity=LOGS_QUEUE_SIZE,
+    batch_size=LOGS_BATCH_SIZE,
+    flush_interval=LOGS_FLUSH_INTERVAL,
+    overflow=LOGS_OVERFLOW,
+)
 
+@timed("create_log", "enqueue")
 def create_log(
     type: str,
     description: str,
@@ -25,8 +202,10 @@ def create_log(
     new_log: Any = {
         "type": type,
         "description": description,
-        "details": details
+        "details": details,
+        # Rows are written up to LOGS_FLUSH_INTERVAL later; keep the event time.
+        "created_at": datetime.now(timezone.utc).isoformat(),
     }
     
-    db.table("logs").insert(new_log).execute() # type: ignore
-    return
\ No newline at end of file
+    log_sink.put(new_log)
+    return
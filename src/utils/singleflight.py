@@ -0,0 +1,97 @@
+""" Request coalescing
+Shares one upstream call between concurrent identical analyses.
+
+When a class pastes the same text at once, the first caller for a cache
+key starts the pipeline call and everybody else asking for the same key
+while it is in flight awaits that call instead of sending their own. All
+of them get its result (or its error); each still writes their own
+history row.
+
+- At most ANALYZE_COALESCE_MAX_WAITERS callers wait on one call; the
+  next caller starts a new one for the following callers to share.
+- Followers give up after ANALYZE_COALESCE_TIMEOUT seconds with a 504.
+- The shared call is not cancelled when the caller that started it goes
+  away, so the others still get their answer.
+- The shared call keeps its first caller's priority and deadline in the
+  scheduler (external/scheduler.py), so analyses only share flights
+  within a priority class: the key includes it.
+"""
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+import asyncio
+from core.config import (
+    ANALYZE_COALESCE_ENABLED,
+    ANALYZE_COALESCE_MAX_WAITERS,
+    ANALYZE_COALESCE_TIMEOUT,
+)
+from external.transport import PipelineError
+
+@dataclass
+class _Flight:
+    task: "asyncio.Future[Any]"
+    waiters: int = 0
+
+class SingleFlight:
+    def __init__(self, max_waiters: int, timeout: float, enabled: bool = True):
+        self.max_waiters = max_waiters
+        self.timeout = timeout
+        self.enabled = enabled
+
+        self._flights: dict[str, _Flight] = {}
+
+        self.calls = 0
+        self.coalesced = 0
+        self.overflows = 0
+        self.timeouts = 0
+
+    async def do(self, key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        """ `call()`'s result, shared with every concurrent caller of `key`. """
+        if not self.enabled:
+            return await call()
+
+        flight = self._flights.get(key)
+        if flight is not None and flight.waiters >= self.max_waiters:
+            # Full: this caller starts the call the next ones will share.
+            self.overflows += 1
+            flight = None
+
+        if flight is None:
+            self.calls += 1
+            leader = _Flight(asyncio.ensure_future(call()))
+            self._flights[key] = leader
+            leader.task.add_done_callback(lambda task: self._done(key, leader))
+            return await asyncio.shield(leader.task)
+
+        flight.waiters += 1
+        self.coalesced += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(flight.task), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise PipelineError("Timed out waiting for an identical analysis", status=504)
+        finally:
+            flight.waiters -= 1
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._flights),
+            "waiting": sum(flight.waiters for flight in self._flights.values()),
+            "upstream_calls": self.calls,
+            "saved_calls": self.coalesced,
+            "overflows": self.overflows,
+            "timeouts": self.timeouts,
+        }
+
+    def _done(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Nobody may be left to await it; mark the error as seen.
+        if not flight.task.cancelled():
+            flight.task.exception()
+
+coalescer = SingleFlight(
+    max_waiters=ANALYZE_COALESCE_MAX_WAITERS,
+    timeout=ANALYZE_COALESCE_TIMEOUT,
+    enabled=ANALYZE_COALESCE_ENABLED,
+)
@@ -0,0 +1,19 @@
+""" Server-Sent Events
+Formatting helpers for `text/event-stream` responses.
+"""
+from typing import Any
+import json
+
+# Stop nginx-style proxies from buffering the stream until it ends.
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+def sse_event(event: str, data: Any = None) -> str:
+    """ A named event, or a comment line (keeps idle proxies from closing the
+    connection) when `data` is None. """
+    if data is None:
+        return f": {event}\n\n"
+
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"